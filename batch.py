@@ -0,0 +1,337 @@
+"""
+Xử lý hàng loạt: chạy một phương pháp trên cả thư mục ảnh (hoặc file zip) mà không cần upload từng file.
+
+Mỗi ảnh đi qua ba giai đoạn chồng lấn nhau:
+- giải mã trên các luồng I/O (cv2.imdecode nhả GIL);
+- xử lý trên các tiến trình worker (các toán tử thuần Python giữ GIL);
+- mã hóa PNG/JPEG và ghi kết quả trên các luồng I/O.
+Số ảnh đang xử lý dở (đã đọc nhưng chưa ghi xong) bị giới hạn bởi prefetch, nên bộ nhớ không tăng
+theo số file trong thư mục.
+
+Chạy từ thư mục gốc của dự án:
+    python -m batch scans/ results/scans --method median_filter --param kernelSize=5
+    python -m batch scans.zip results.zip --method equalize --param color=luma --report report.json
+"""
+import argparse
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from processing import (InvalidRequestError, check_memory, color_mode, decode_image, encode_output, image_shape,
+                        plan_request, run_method)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.gif', '.webp')
+
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith('.')
+
+def directory_inputs(folder):
+    """
+    Các ảnh trong thư mục (kể cả thư mục con), theo thứ tự tên.
+    Returns:
+        list: (tên tương đối, hàm đọc bytes).
+    """
+    inputs = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if is_image_name(name):
+                path = os.path.join(root, name)
+                inputs.append((os.path.relpath(path, folder), lambda path=path: read_file(path)))
+    return sorted(inputs, key=lambda item: item[0])
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def zip_inputs(archive):
+    """
+    Các ảnh trong một file zip (đường dẫn hoặc file-like); việc đọc được khóa vì ZipFile dùng chung một con trỏ file.
+    Returns:
+        list: (tên trong zip đã chuẩn hóa, hàm đọc bytes).
+    Raises:
+        InvalidRequestError: Zip có ảnh mang đường dẫn tuyệt đối hoặc ra ngoài thư mục gốc ('../'), vì thư mục
+            của tên trong zip được dùng làm thư mục ghi kết quả (DirectoryWriter, ZipWriter).
+    """
+    zip_file = zipfile.ZipFile(archive)
+    lock = threading.Lock()
+
+    def reader(name):
+        with lock:
+            return zip_file.read(name)
+
+    inputs = []
+    for info in zip_file.infolist():
+        if info.is_dir() or not is_image_name(info.filename):
+            continue
+        name = os.path.normpath(info.filename)
+        if os.path.isabs(name) or name.split(os.sep)[0] == '..':
+            raise InvalidRequestError(f"Unsafe path in zip archive: {info.filename}")
+        inputs.append((name, lambda name=info.filename: reader(name)))
+    return inputs
+
+class DirectoryWriter:
+    """
+    Ghi kết quả vào thư mục, giữ cấu trúc thư mục con của ảnh vào.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def write(self, relative_dir, filename, data):
+        folder = os.path.join(self.folder, relative_dir)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, filename), 'wb') as f:
+            f.write(data)
+
+    def close(self, report):
+        with open(os.path.join(self.folder, 'report.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+
+class ZipWriter:
+    """
+    Ghi kết quả vào một file zip (đường dẫn hoặc file-like, ví dụ io.BytesIO của response).
+    Ảnh PNG/JPEG đã nén sẵn nên được lưu không nén lại (ZIP_STORED).
+    """
+
+    def __init__(self, target):
+        self.zip_file = zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_STORED)
+        self.lock = threading.Lock()
+
+    def write(self, relative_dir, filename, data):
+        with self.lock:
+            self.zip_file.writestr(os.path.join(relative_dir, filename), data)
+
+    def close(self, report):
+        with self.lock:
+            self.zip_file.writestr('report.json', json.dumps(report, indent=2))
+            self.zip_file.close()
+
+    def abort(self):
+        """
+        Đóng file zip khi lô bị dừng giữa chừng (không có report.json).
+        """
+        with self.lock:
+            self.zip_file.close()
+
+def decode_input(read, method_type, params, max_job_bytes=None):
+    """
+    Giai đoạn 1 (luồng I/O): đọc, kiểm tra bộ nhớ ước lượng từ header rồi giải mã ảnh.
+    """
+    start = time.perf_counter()
+    data = read()
+    if max_job_bytes:
+        check_memory(plan_request(method_type, params, image_shape(io.BytesIO(data))), max_job_bytes)
+    image_array = decode_image(data, color_mode(params))
+    return image_array, time.perf_counter() - start
+
+def compute(image_array, method_type, params, stem, auto_min_pixels=None):
+    """
+    Giai đoạn 2 (tiến trình worker): chạy phương pháp xử lý, chưa mã hóa kết quả.
+    Returns:
+        tuple: (outputs, context, số giây) như processing.run_method.
+    """
+    start = time.perf_counter()
+    outputs, context = run_method(image_array, method_type, params, stem, auto_min_pixels)
+    return outputs, context, time.perf_counter() - start
+
+def encode_results(outputs, writer, relative_dir):
+    """
+    Giai đoạn 3 (luồng I/O): mã hóa và ghi các kết quả.
+    """
+    start = time.perf_counter()
+    for output in outputs:
+        data, _ = encode_output(output)
+        writer.write(relative_dir, output['filename'], data)
+    return time.perf_counter() - start
+
+def run_batch(inputs, method_type, params, writer, workers=None, io_threads=4, prefetch=None, auto_min_pixels=None,
+              max_job_bytes=None, executor=None, on_file=None):
+    """
+    Chạy một phương pháp trên nhiều ảnh với ba giai đoạn chồng lấn (xem đầu module).
+    Args:
+        inputs (list): (tên, hàm đọc bytes), ví dụ từ directory_inputs hoặc zip_inputs.
+        method_type (str): Phương pháp xử lý (methodType), hoặc 'pipeline'.
+        params (dict): Các tham số như form của /process (kernelSize, color, stages, ...).
+        writer: DirectoryWriter hoặc ZipWriter.
+        workers (int): Số tiến trình worker, mặc định bằng số lõi CPU; 0 để xử lý ngay trên luồng I/O.
+        io_threads (int): Số luồng giải mã/mã hóa.
+        prefetch (int): Số ảnh tối đa đang xử lý dở, mặc định 2 * workers + io_threads.
+        auto_min_pixels (int): Xem processing.plan_request.
+        max_job_bytes (int): Từ chối từng ảnh có bộ nhớ ước lượng vượt giới hạn này (None để bỏ qua).
+        executor (Executor): Executor dùng lại (ví dụ jobs.TaskExecutor của JobQueue); None để tạo pool tạm.
+        on_file (callable): Gọi với bản ghi của từng ảnh khi ảnh đó xong (theo thứ tự đầu vào).
+    Returns:
+        dict: Báo cáo: 'files' (mỗi ảnh: tên, kích thước, thời gian từng giai đoạn, MP/s hoặc lỗi) và
+            'summary' (số ảnh, số lỗi, tổng megapixel, thời gian, MP/s và ảnh/giây của cả lô).
+    Raises:
+        InvalidRequestError: Phương pháp hoặc tham số không hợp lệ (kiểm tra trước khi đọc ảnh nào).
+    """
+    params = dict(params)
+    plan_request(method_type, params, (64, 64))  # Báo lỗi tham số ngay, trước khi chạy lô
+    if workers is None:
+        workers = os.cpu_count() or 1
+    prefetch = prefetch or 2 * max(workers, 1) + io_threads
+
+    io_pool = ThreadPoolExecutor(max_workers=io_threads)
+    pool = executor
+    if pool is None and workers > 0:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    compute_pool = pool or io_pool
+
+    used_stems = set()
+
+    def unique_stem(relative_dir, filename):
+        # a.png và a.jpg cùng thư mục cho cùng tên kết quả: ảnh sau giữ phần mở rộng trong tên (a_jpg), rồi thêm
+        # số thứ tự nếu vẫn trùng. So sánh không phân biệt hoa thường (hệ thống file của Windows/macOS)
+        stem, extension = os.path.splitext(filename)
+        candidate = stem
+        if (relative_dir, candidate.lower()) in used_stems:
+            candidate = f"{stem}_{extension.lstrip('.')}"
+        number = 2
+        while (relative_dir, candidate.lower()) in used_stems:
+            candidate = f"{stem}_{extension.lstrip('.')}_{number}"
+            number += 1
+        used_stems.add((relative_dir, candidate.lower()))
+        return candidate
+
+    def start(name, read):
+        # Nối ba giai đoạn bằng callback; done nhận bản ghi của ảnh khi ghi xong hoặc khi có lỗi
+        done = Future()
+        record = {'name': name}
+        relative_dir = os.path.dirname(name)
+        stem = unique_stem(relative_dir, os.path.basename(name))
+        started = time.perf_counter()
+
+        def stage(callback):
+            # Lỗi của giai đoạn trước hoặc của chính callback kết thúc ảnh này với trạng thái failed
+            def run(future):
+                try:
+                    callback(future.result())
+                except Exception as e:
+                    record.update(status='failed', error=str(e))
+                    done.set_result(record)
+            return run
+
+        def decoded(result):
+            image_array, seconds = result
+            record.update(shape=list(image_array.shape), decode_ms=round(seconds * 1000, 3),
+                          megapixels=round(image_array.shape[0] * image_array.shape[1] / 1e6, 3))
+            future = compute_pool.submit(compute, image_array, method_type, params, stem, auto_min_pixels)
+            future.add_done_callback(stage(computed))
+
+        def computed(result):
+            outputs, context, seconds = result
+            record.update(compute_ms=round(seconds * 1000, 3), outputs=[output['filename'] for output in outputs])
+            if 'message' in context:
+                record['message'] = context['message']
+            io_pool.submit(encode_results, outputs, writer, relative_dir).add_done_callback(stage(encoded))
+
+        def encoded(seconds):
+            record.update(encode_ms=round(seconds * 1000, 3), status='done',
+                          seconds=round(time.perf_counter() - started, 4))
+            done.set_result(record)
+
+        io_pool.submit(decode_input, read, method_type, params, max_job_bytes).add_done_callback(stage(decoded))
+        return done
+
+    files = []
+    batch_start = time.perf_counter()
+    try:
+        in_flight = deque()
+        for name, read in inputs:
+            while len(in_flight) >= prefetch:
+                files.append(finish(in_flight.popleft(), on_file))
+            in_flight.append(start(name, read))
+        while in_flight:
+            files.append(finish(in_flight.popleft(), on_file))
+    finally:
+        io_pool.shutdown()
+        if executor is None and pool is not None:
+            pool.shutdown()
+    elapsed = time.perf_counter() - batch_start
+
+    succeeded = [record for record in files if record['status'] == 'done']
+    megapixels = sum(record['megapixels'] for record in succeeded)
+    report = {
+        'method': method_type,
+        'params': params,
+        'files': files,
+        'summary': {
+            'files': len(files),
+            'failed': len(files) - len(succeeded),
+            'megapixels': round(megapixels, 3),
+            'seconds': round(elapsed, 3),
+            'mp_per_s': round(megapixels / elapsed, 3) if elapsed > 0 else None,
+            'files_per_s': round(len(succeeded) / elapsed, 3) if elapsed > 0 else None,
+        },
+    }
+    writer.close(report)
+    return report
+
+def finish(done, on_file):
+    record = done.result()
+    if record['status'] == 'done':
+        # Thông lượng của riêng ảnh này (từ lúc đọc đến lúc ghi xong, gồm cả thời gian chờ trong hàng đợi)
+        record['mp_per_s'] = round(record['megapixels'] / record['seconds'], 3) if record['seconds'] > 0 else None
+    if on_file is not None:
+        on_file(record)
+    return record
+
+def print_record(record):
+    if record['status'] != 'done':
+        print(f"{record['name']:<40} FAILED: {record['error']}")
+        return
+    print(f"{record['name'][-40:]:<40} {record['megapixels']:>8.2f} {record['decode_ms']:>10.1f} "
+          f"{record['compute_ms']:>11.1f} {record['encode_ms']:>10.1f} {record['mp_per_s']:>8.2f}")
+
+def parse_param(pair):
+    """
+    Một tham số dạng form 'tên=giá trị' (ví dụ kernelSize=5, color=luma), dùng làm type= của --param.
+    Returns:
+        tuple: (tên, giá trị).
+    """
+    name, separator, value = pair.partition('=')
+    if not separator or not name:
+        raise argparse.ArgumentTypeError(f"Expected name=value, got '{pair}'.")
+    return name, value
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one processing method over a directory or zip of images")
+    parser.add_argument('input', help="Thư mục ảnh hoặc file .zip")
+    parser.add_argument('output', help="Thư mục kết quả, hoặc file .zip")
+    parser.add_argument('--method', required=True, help="Phương pháp xử lý (methodType), ví dụ median_filter")
+    parser.add_argument('--param', action='append', default=[], type=parse_param,
+                        help="Tham số dạng form name=value, lặp lại được (ví dụ --param kernelSize=5)")
+    parser.add_argument('--workers', type=int, default=None, help="Số tiến trình xử lý (mặc định: số lõi CPU)")
+    parser.add_argument('--io-threads', type=int, default=4, help="Số luồng giải mã/mã hóa")
+    parser.add_argument('--prefetch', type=int, default=None, help="Số ảnh tối đa đang xử lý dở")
+    parser.add_argument('--report', help="Ghi thêm báo cáo JSON ra file này")
+    args = parser.parse_args()
+
+    try:
+        inputs = zip_inputs(args.input) if zipfile.is_zipfile(args.input) else directory_inputs(args.input)
+    except InvalidRequestError as e:
+        parser.error(str(e))
+    writer = ZipWriter(args.output) if args.output.lower().endswith('.zip') else DirectoryWriter(args.output)
+
+    print(f"{'file':<40} {'MP':>8} {'decode ms':>10} {'compute ms':>11} {'encode ms':>10} {'MP/s':>8}")
+    try:
+        report = run_batch(inputs, args.method, dict(args.param), writer, args.workers, args.io_threads,
+                           args.prefetch, on_file=print_record)
+    except InvalidRequestError as e:
+        parser.error(str(e))
+
+    summary = report['summary']
+    print(f"\n{summary['files']} files ({summary['failed']} failed), {summary['megapixels']:.2f} MP in "
+          f"{summary['seconds']:.2f} s: {summary['mp_per_s']} MP/s, {summary['files_per_s']} files/s")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
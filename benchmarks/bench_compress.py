@@ -0,0 +1,90 @@
+"""
+Benchmark so sánh engine JPEG xử lý theo lô với phiên bản xử lý từng khối 8x8,
+đo thời gian / kích thước file của bộ ghi JPEG baseline (bảng Huffman chuẩn và tối ưu),
+và so sánh bộ mã hóa màu (YCbCr 4:2:0 / 4:4:4) với OpenCV ở cùng quality (thời gian, kích thước, PSNR).
+
+Chạy từ thư mục gốc của dự án:
+    python -m benchmarks.bench_compress --sizes 512 1024 2048 --repeat 3
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from image_processing.compress import (JPEG_SUBSAMPLING, encode_jpeg, encode_jpeg_grayscale, encode_jpeg_with_opencv,
+                                       jpeg_encode_decode_grayscale, jpeg_encode_decode_grayscale_blockwise)
+
+
+def time_function(func, image, repeat):
+    """
+    Trả về (thời gian nhỏ nhất tính bằng giây, kết quả của lần chạy cuối).
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(image)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def psnr(original, data):
+    """
+    PSNR (dB) giữa ảnh RGB gốc và file JPEG data sau khi giải mã bằng OpenCV.
+    """
+    decoded = cv2.cvtColor(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+    mse = np.mean((original.astype(np.float64) - decoded) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark custom JPEG: batched vs blockwise")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024, 2048], help="Cạnh ảnh vuông (pixel)")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần lặp, lấy thời gian nhỏ nhất")
+    parser.add_argument('--qualities', type=int, nargs='+', default=[25, 50, 90], help="Quality cho bảng ảnh màu")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>8} {'blocks':>9} {'blockwise (s)':>14} {'batched (s)':>12} {'speedup':>8} {'equal':>6}")
+    for size in args.sizes:
+        image = rng.integers(0, 256, size=(size, size), dtype=np.uint8)
+        num_blocks = ((size + 7) // 8) ** 2
+
+        blockwise_time, blockwise_result = time_function(jpeg_encode_decode_grayscale_blockwise, image, args.repeat)
+        batched_time, batched_result = time_function(jpeg_encode_decode_grayscale, image, args.repeat)
+
+        equal = np.array_equal(blockwise_result, batched_result)
+        print(f"{size:>8} {num_blocks:>9} {blockwise_time:>14.3f} {batched_time:>12.3f} "
+              f"{blockwise_time / batched_time:>7.1f}x {str(equal):>6}")
+
+    print()
+    print(f"{'size':>8} {'huffman':>10} {'encode (s)':>11} {'bytes':>10} {'ratio':>7}")
+    for size in args.sizes:
+        # Ảnh mượt (gradient + nhiễu nhẹ) gần với ảnh thật hơn nhiễu ngẫu nhiên
+        ramp = np.add.outer(np.arange(size), np.arange(size)) * (255 / (2 * size))
+        image = np.clip(ramp + rng.normal(0, 8, size=(size, size)), 0, 255).astype(np.uint8)
+        for optimize in (False, True):
+            encode_time, data = time_function(lambda im: encode_jpeg_grayscale(im, optimize_huffman=optimize), image, args.repeat)
+            print(f"{size:>8} {'optimized' if optimize else 'standard':>10} {encode_time:>11.3f} "
+                  f"{len(data):>10} {image.nbytes / len(data):>6.2f}:1")
+
+    print()
+    print(f"{'size':>8} {'quality':>8} {'sampling':>9} {'encoder':>8} {'encode (s)':>11} {'bytes':>10} {'PSNR (dB)':>10}")
+    for size in args.sizes:
+        # Ảnh màu mượt: ba gradient khác hướng + nhiễu nhẹ
+        y, x = np.mgrid[:size, :size] * (255 / size)
+        planes = np.dstack([x, y, (x + y) / 2]) + rng.normal(0, 6, size=(size, size, 3))
+        image = np.clip(planes, 0, 255).astype(np.uint8)
+        for quality in args.qualities:
+            for subsampling in JPEG_SUBSAMPLING:
+                encoders = [('custom', lambda im: encode_jpeg(im, quality, subsampling, optimize_huffman=True)),
+                            ('opencv', lambda im: encode_jpeg_with_opencv(im, quality, subsampling))]
+                for label, encoder in encoders:
+                    encode_time, data = time_function(encoder, image, args.repeat)
+                    print(f"{size:>8} {quality:>8} {subsampling:>9} {label:>8} {encode_time:>11.3f} "
+                          f"{len(data):>10} {psnr(image, data):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
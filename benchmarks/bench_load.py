@@ -0,0 +1,191 @@
+"""
+Load test cho chế độ production: khởi động gunicorn (gunicorn.conf.py) với từng số worker, gửi request
+POST /process đồng thời từ nhiều client trong một khoảng thời gian và đo số request mỗi giây cùng độ trễ
+(p50, p95, p99). Mỗi request dùng delivery=inline và preview=0 để đo đúng thời gian xử lý (không qua cache,
+không ghi file).
+
+Chạy từ thư mục gốc của dự án (cần gunicorn):
+    python -m benchmarks.bench_load --workers 1 2 4 --concurrency 8 --duration 20
+    python -m benchmarks.bench_load --methods median_filter gaussian_low_pass --size 1024 --output load.json
+    python -m benchmarks.bench_load --url http://127.0.0.1:8000   # Đo một server đang chạy
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+import cv2
+import numpy as np
+
+from benchmarks.bench_pairs import synthetic_image
+
+
+def multipart_body(fields, filename, data):
+    """
+    Nội dung multipart/form-data cho các trường form và một file ảnh.
+    Returns:
+        tuple: (bytes, content type).
+    """
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request('GET', '/metrics')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not start within {timeout} s.")
+
+
+def start_server(workers, port, extra_env):
+    """
+    Khởi động gunicorn với số worker cho trước.
+    """
+    env = dict(os.environ, WEB_WORKERS=str(workers), BIND=f'127.0.0.1:{port}', **extra_env)
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'server:app'], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_clients(host, port, requests_by_client, concurrency, duration):
+    """
+    concurrency client, mỗi client một kết nối keep-alive, gửi lần lượt các request của mình (xoay vòng)
+    cho tới khi hết duration giây.
+    Returns:
+        tuple: (danh sách độ trễ của các request thành công (giây), số lỗi, thời gian đo thực tế).
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def client(index):
+        connection = http.client.HTTPConnection(host, port, timeout=300)
+        own, failed = [], 0
+        count = 0
+        while time.perf_counter() < deadline:
+            body, content_type = requests_by_client[(index + count) % len(requests_by_client)]
+            count += 1
+            sent = time.perf_counter()
+            try:
+                connection.request('POST', '/process', body=body, headers={'Content-Type': content_type})
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    own.append(time.perf_counter() - sent)
+                else:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=300)
+        connection.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def summarize(latencies, errors, elapsed):
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(values, 50)), 1),
+        'p95_ms': round(float(np.percentile(values, 95)), 1),
+        'p99_ms': round(float(np.percentile(values, 99)), 1),
+        'max_ms': round(float(values.max()), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the production server across worker counts")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Các số worker gunicorn cần đo")
+    parser.add_argument('--url', help="Đo server đang chạy tại URL này thay vì tự khởi động gunicorn")
+    parser.add_argument('--methods', nargs='+', default=['median_filter', 'gaussian_low_pass', 'jpeg_opencv_compress'],
+                        help="Các methodType, gửi xoay vòng")
+    parser.add_argument('--size', type=int, default=512, help="Cạnh ảnh tổng hợp (pixel)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Số client đồng thời")
+    parser.add_argument('--duration', type=float, default=15.0, help="Số giây đo cho mỗi cấu hình")
+    parser.add_argument('--warmup-operators', default='', help="WARMUP_OPERATORS cho server được khởi động")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    image = synthetic_image(args.size, 3, np.random.default_rng(0))
+    _, png = cv2.imencode('.png', image)
+    bodies = [multipart_body({'methodType': method, 'color': 'channels', 'preview': '0', 'delivery': 'inline'},
+                             'load.png', png.tobytes()) for method in args.methods]
+
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'ok':>6} {'errors':>6}")
+    results = []
+    configurations = [None] if args.url else args.workers
+    for workers in configurations:
+        process = None
+        if args.url:
+            parsed = urllib.parse.urlparse(args.url)
+            host, port = parsed.hostname, parsed.port or 80
+        else:
+            host, port = '127.0.0.1', free_port()
+            process = start_server(workers, port, {'WARMUP_OPERATORS': args.warmup_operators})
+        try:
+            wait_ready(host, port, timeout=60)
+            stats = summarize(*run_clients(host, port, bodies, args.concurrency, args.duration))
+        finally:
+            if process is not None:
+                stop_server(process)
+        stats['workers'] = workers
+        results.append(stats)
+        label = '-' if workers is None else workers
+        print(f"{label:>7} {stats['requests_per_second']:>8.2f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} {stats['requests']:>6} {stats['errors']:>6}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'methods': args.methods, 'size': args.size, 'concurrency': args.concurrency,
+                       'duration': args.duration, 'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
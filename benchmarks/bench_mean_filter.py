@@ -0,0 +1,57 @@
+"""
+Benchmark bộ lọc trung bình theo kích thước kernel: ảnh tích phân, vòng lặp gốc và cv2.blur.
+
+Chạy từ thư mục gốc của dự án:
+    python -m benchmarks.bench_mean_filter --size 1024 --kernels 3 7 15 31 63
+    python -m benchmarks.bench_mean_filter --size 2048 --skip-loop
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from image_processing.spatial_enhancement import mean_filter, mean_filter_loop
+
+
+def time_function(func, repeat):
+    """
+    Trả về (thời gian nhỏ nhất tính bằng giây, kết quả của lần chạy cuối).
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mean filter over kernel sizes")
+    parser.add_argument('--size', type=int, default=512, help="Cạnh ảnh vuông (pixel)")
+    parser.add_argument('--kernels', type=int, nargs='+', default=[3, 5, 7, 11, 15, 21, 31, 45, 63])
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần lặp, lấy thời gian nhỏ nhất")
+    parser.add_argument('--skip-loop', action='store_true', help="Bỏ qua vòng lặp gốc (rất chậm với ảnh lớn)")
+    args = parser.parse_args()
+
+    image = np.random.default_rng(0).integers(0, 256, size=(args.size, args.size), dtype=np.uint8)
+    print(f"{'kernel':>7} {'integral (s)':>13} {'loop (s)':>10} {'cv2.blur (s)':>13} {'max diff cv2':>13}")
+    for kernel_size in args.kernels:
+        integral_time, result = time_function(lambda: mean_filter(image, kernel_size), args.repeat)
+
+        loop_time = float('nan')
+        if not args.skip_loop:
+            loop_time, loop_result = time_function(lambda: mean_filter_loop(image, kernel_size), 1)
+            assert np.array_equal(result, loop_result), "integral mean filter differs from loop"
+
+        # Padding 0 ở biên để cùng ngữ nghĩa với mean_filter; cv2.blur làm tròn còn mean_filter cắt phần thập phân
+        cv2_time, cv2_result = time_function(
+            lambda: cv2.blur(image, (kernel_size, kernel_size), borderType=cv2.BORDER_CONSTANT), args.repeat)
+        max_diff = np.abs(result.astype(int) - cv2_result).max()
+
+        print(f"{kernel_size:>7} {integral_time:>13.4f} {loop_time:>10.3f} {cv2_time:>13.4f} {max_diff:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark bộ nhớ: bộ nhớ đỉnh cấp phát thêm của từng toán tử trong registry, tính bằng byte mỗi mẫu
+(pixel x kênh, cùng đơn vị với Operator.memory), so với ước lượng Operator.memory dùng để chặn các job quá lớn.
+
+Mỗi toán tử được đo ở các chế độ:
+- default: gọi như server (kết quả là mảng mới);
+- in-place: out=ảnh vào, với các toán tử in_place;
+- single: precision='single' (rfft2 float32) với các bộ lọc miền tần số.
+Hai cột bộ nhớ: tracemalloc (mọi mảng NumPy, kể cả kết quả trả về) và peak RSS tăng thêm (gồm cả bộ nhớ
+OpenCV cấp phát bên trong, xem bench_pairs.peak_memory). Cache phổ và hàm truyền được xóa trước mỗi lần đo.
+
+Chạy từ thư mục gốc của dự án:
+    python -m benchmarks.bench_memory --size 1024 --dtypes uint8 uint16
+    python -m benchmarks.bench_memory --operators laplacian_filter mean_filter --channels 3 --output memory.json
+"""
+import argparse
+import json
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_pairs import peak_memory, synthetic_image
+from image_processing.color import convert_depth
+from image_processing.frequency_enhancement import SPECTRUM_CACHE, TRANSFER_FUNCTIONS
+from image_processing.registry import OPERATORS, accepts
+
+
+def traced_peak(func):
+    """
+    Chạy func và trả về (kết quả, số byte đỉnh do tracemalloc ghi nhận trong lúc chạy).
+    """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, max(peak - before, 0)
+
+
+def variants(operator, kernel_size):
+    """
+    Các chế độ đo của một toán tử: (tên chế độ, tham số, in_place).
+    """
+    params = {'kernel_size': kernel_size} if operator.kernel_dependent else {}
+    if not accepts(operator, params):
+        params = {'kernel_size': kernel_size + 1}  # Ví dụ median_filter_opencv chỉ nhận kernel lẻ
+    modes = [('default', params, False)]
+    if operator.in_place:
+        modes.append(('in-place', params, True))
+    if any(parameter.name == 'precision' for parameter in operator.parameters):
+        modes.append(('single', dict(params, precision='single'), False))
+    return modes
+
+
+def measure(operator, image, params, in_place):
+    """
+    Bộ nhớ đỉnh (tracemalloc, RSS) tính bằng byte mỗi mẫu khi chạy toán tử một lần trên một bản sao của ảnh.
+    """
+    samples = image.size
+    working = image.copy()
+    extra = {'out': working} if in_place else {}
+
+    def run():
+        SPECTRUM_CACHE.clear()
+        TRANSFER_FUNCTIONS.clear()
+        return operator(working, **params, **extra)
+
+    run()  # Khởi động (import, cache của thư viện)
+    _, traced = traced_peak(run)
+    _, rss = peak_memory(run)
+    return {
+        'traced_bytes_per_pixel': round(traced / samples, 2),
+        'rss_bytes_per_pixel': None if rss is None else round(rss / samples, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory per pixel of each registered operator")
+    parser.add_argument('--operators', nargs='+', choices=sorted(OPERATORS), default=sorted(OPERATORS))
+    parser.add_argument('--size', type=int, default=1024, help="Cạnh ảnh tổng hợp (pixel)")
+    parser.add_argument('--channels', type=int, choices=[1, 3], default=1, help="1 (grayscale) hoặc 3 (RGB)")
+    parser.add_argument('--dtypes', nargs='+', choices=['uint8', 'uint16'], default=['uint8'])
+    parser.add_argument('--kernel-size', type=int, default=5)
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    image8 = synthetic_image(args.size, args.channels, np.random.default_rng(0))
+    print(f"{'operator':<28} {'dtype':>6} {'mode':>9} {'traced B/px':>12} {'RSS B/px':>9} {'estimate B/px':>14}")
+    cases = []
+    for name in args.operators:
+        operator = OPERATORS[name]
+        for dtype in args.dtypes:
+            if not operator.supports(dtype):
+                continue
+            image = convert_depth(image8, dtype)
+            for mode, params, in_place in variants(operator, args.kernel_size):
+                stats = measure(operator, image, params, in_place)
+                estimate = operator.memory(operator.validate(params))
+                case = dict({'operator': name, 'dtype': dtype, 'mode': mode, 'shape': list(image.shape),
+                             'estimate_bytes_per_pixel': estimate}, **stats)
+                cases.append(case)
+                rss = '-' if stats['rss_bytes_per_pixel'] is None else f"{stats['rss_bytes_per_pixel']:.1f}"
+                print(f"{name:<28} {dtype:>6} {mode:>9} {stats['traced_bytes_per_pixel']:>12.1f} {rss:>9} "
+                      f"{estimate:>14.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'size': args.size, 'channels': args.channels, 'cases': cases}, f, indent=2)
+        print(f"\nWrote {len(cases)} cases to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
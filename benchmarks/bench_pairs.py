@@ -0,0 +1,257 @@
+"""
+Benchmark các cặp cài đặt tự xây dựng / OpenCV trong registry (cùng family, ví dụ median_filter và
+median_filter_opencv) trên ma trận kích thước ảnh, kích thước kernel và kiểu dữ liệu.
+Mỗi trường hợp ghi lại thời gian, thông lượng (MP/s), bộ nhớ đỉnh tăng thêm (peak RSS) của từng cài đặt,
+và sai khác giữa hai kết quả (max abs diff, PSNR; với nén JPEG là hai ảnh sau khi giải mã).
+Kết quả được ghi ra JSON để theo dõi thay đổi hiệu năng giữa các lần chạy (--baseline để so sánh).
+
+Ảnh thử: ảnh tổng hợp (gradient + nhiễu) cho mỗi kích thước, cộng với các ảnh mẫu trong uploads/.
+
+Chạy từ thư mục gốc của dự án:
+    python -m benchmarks.bench_pairs --sizes 256 512 1024 --kernels 3 5 9 --dtypes uint8 uint16
+    python -m benchmarks.bench_pairs --pairs median_filter dilation --no-samples --output bench.json
+    python -m benchmarks.bench_pairs --baseline bench.json
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from image_processing.color import convert_depth, dtype_maximum
+from image_processing.registry import OPERATORS, accepts
+from processing import load_image
+
+# Các cặp (tự xây dựng, OpenCV) suy ra từ registry: toán tử OpenCV và toán tử gốc của family
+PAIRS = {operator.family: (OPERATORS[operator.family], operator)
+         for operator in OPERATORS.values() if operator.backend == 'opencv' and operator.family in OPERATORS}
+
+SAMPLE_PATTERNS = ('*.png', '*.jpg', '*.jpeg', '*.tif', '*.tiff', '*.bmp')
+
+
+def time_function(func, repeat):
+    """
+    Trả về (thời gian nhỏ nhất tính bằng giây, kết quả của lần chạy cuối).
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def memory_status():
+    """
+    (VmRSS, VmHWM) của tiến trình hiện tại, tính bằng byte.
+    """
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(('VmRSS:', 'VmHWM:')):
+                values[line.split(':')[0]] = int(line.split()[1]) * 1024
+    return values['VmRSS'], values['VmHWM']
+
+
+def peak_memory(func):
+    """
+    Chạy func một lần và đo bộ nhớ đỉnh tăng thêm (byte) so với RSS trước khi chạy, kể cả bộ nhớ do
+    OpenCV cấp phát (không thấy được qua tracemalloc). Mốc đỉnh được đặt lại bằng /proc/self/clear_refs
+    (Linux); trên hệ thống khác trả về None cho bộ nhớ.
+    Returns:
+        tuple: (kết quả của func, số byte hoặc None).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        before, _ = memory_status()
+    except OSError:
+        return func(), None
+    result = func()
+    _, peak = memory_status()
+    return result, max(peak - before, 0)
+
+
+def synthetic_image(size, channels, rng):
+    """
+    Ảnh uint8 tổng hợp: gradient mượt cộng nhiễu, gần với ảnh thật hơn nhiễu ngẫu nhiên thuần.
+    """
+    y, x = np.mgrid[:size, :size] * (255 / size)
+    planes = [x, y, (x + y) / 2][:channels]
+    image = np.dstack(planes) if channels > 1 else planes[0]
+    return np.clip(image + rng.normal(0, 12, size=image.shape), 0, 255).astype(np.uint8)
+
+
+def test_images(sizes, channels, samples, rng):
+    """
+    Danh sách (tên, ảnh uint8): ảnh tổng hợp cho mỗi kích thước và các ảnh mẫu (giữ kích thước gốc).
+    """
+    images = [(f"synthetic-{size}", synthetic_image(size, channels, rng)) for size in sizes]
+    color = 'grayscale' if channels == 1 else 'channels'
+    for path in samples:
+        image = load_image(path, color)
+        if image.ndim == 3:
+            image = image[..., :3]
+        images.append((os.path.relpath(path), convert_depth(image, np.uint8)))
+    return images
+
+
+def decoded(result):
+    """
+    Kết quả dạng ảnh để so sánh: file JPEG (bytes) được giải mã bằng OpenCV.
+    """
+    if isinstance(result, bytes):
+        return cv2.imdecode(np.frombuffer(result, np.uint8), cv2.IMREAD_UNCHANGED)
+    return result
+
+
+def difference(first, second, maximum):
+    """
+    (max abs diff, PSNR) giữa hai ảnh; PSNR None nghĩa là hai ảnh giống hệt nhau.
+    """
+    first, second = decoded(first), decoded(second)
+    if first.shape != second.shape:
+        return None, None
+    diff = np.abs(first.astype(np.float64) - second)
+    mse = float(np.mean(diff ** 2))
+    psnr = None if mse == 0 else round(10 * np.log10(maximum ** 2 / mse), 2)
+    return float(diff.max()), psnr
+
+
+def measure(operator, image, params, repeat):
+    """
+    Đo một cài đặt: bộ nhớ đỉnh ở lần chạy đầu (cũng là lần khởi động), thời gian tốt nhất sau đó.
+    """
+    result, peak = peak_memory(lambda: operator(image, **params))
+    seconds, _ = time_function(lambda: operator(image, **params), repeat)
+    megapixels = image.shape[0] * image.shape[1] / 1e6
+    return result, {
+        'seconds': round(seconds, 6),
+        'mp_per_s': round(megapixels / seconds, 2) if seconds > 0 else None,
+        'peak_rss_mib': None if peak is None else round(peak / 2 ** 20, 2),
+    }
+
+
+def case_key(case):
+    return (case['pair'], case['image'], case['dtype'], case['kernel_size'])
+
+
+def run_cases(pairs, images, kernels, dtypes, repeat):
+    """
+    Chạy mọi tổ hợp (cặp, ảnh, kiểu dữ liệu, kernel); tổ hợp có cài đặt không hỗ trợ kiểu dữ liệu bị bỏ qua.
+    """
+    cases = []
+    for family in pairs:
+        custom, opencv = PAIRS[family]
+        kernel_sizes = kernels if custom.kernel_dependent else [None]
+        for name, image8 in images:
+            for dtype in dtypes:
+                if not (custom.supports(dtype) and opencv.supports(dtype)):
+                    continue
+                image = convert_depth(image8, dtype)
+                for kernel_size in kernel_sizes:
+                    params = {} if kernel_size is None else {'kernel_size': kernel_size}
+                    if not (accepts(custom, params) and accepts(opencv, params)):
+                        continue  # Ví dụ kernel chẵn với median_filter_opencv
+                    custom_result, custom_stats = measure(custom, image, params, repeat)
+                    opencv_result, opencv_stats = measure(opencv, image, params, repeat)
+                    max_diff, psnr = difference(custom_result, opencv_result, dtype_maximum(dtype))
+                    case = {'pair': family, 'custom': custom.name, 'opencv': opencv.name, 'image': name,
+                            'shape': list(image.shape), 'dtype': dtype, 'kernel_size': kernel_size,
+                            'results': {'custom': custom_stats, 'opencv': opencv_stats},
+                            'max_abs_diff': max_diff, 'psnr': psnr}
+                    cases.append(case)
+                    print_case(case)
+    return cases
+
+
+def print_header():
+    print(f"{'pair':<20} {'image':<28} {'dtype':>6} {'k':>3} {'custom (s)':>11} {'opencv (s)':>11} "
+          f"{'custom MP/s':>12} {'opencv MP/s':>12} {'custom MiB':>11} {'opencv MiB':>11} {'max diff':>9} {'PSNR':>7}")
+
+
+def print_case(case):
+    custom, opencv = case['results']['custom'], case['results']['opencv']
+
+    def text(value, fmt):
+        return '-' if value is None else format(value, fmt)
+
+    psnr = 'equal' if case['psnr'] is None and case['max_abs_diff'] == 0 else text(case['psnr'], '.2f')
+    image = os.path.basename(case['image'])[:28]
+    print(f"{case['pair']:<20} {image:<28} {case['dtype']:>6} {text(case['kernel_size'], 'd'):>3} "
+          f"{custom['seconds']:>11.4f} {opencv['seconds']:>11.4f} {text(custom['mp_per_s'], '.1f'):>12} "
+          f"{text(opencv['mp_per_s'], '.1f'):>12} {text(custom['peak_rss_mib'], '.1f'):>11} "
+          f"{text(opencv['peak_rss_mib'], '.1f'):>11} {text(case['max_abs_diff'], '.0f'):>9} {psnr:>7}")
+
+
+def compare_baseline(cases, baseline_path, tolerance):
+    """
+    So sánh thời gian với một file JSON trước đó; in các trường hợp chậm hơn tolerance lần.
+    Returns:
+        int: Số trường hợp chậm đi.
+    """
+    with open(baseline_path) as f:
+        baseline = {case_key(case): case for case in json.load(f)['cases']}
+    regressions = 0
+    print()
+    print(f"Compared with {baseline_path} (tolerance {tolerance:.2f}x):")
+    for case in cases:
+        previous = baseline.get(case_key(case))
+        if previous is None:
+            continue
+        for backend in ('custom', 'opencv'):
+            ratio = case['results'][backend]['seconds'] / max(previous['results'][backend]['seconds'], 1e-9)
+            if ratio > tolerance:
+                regressions += 1
+                print(f"  REGRESSION {case[backend]:<24} {os.path.basename(case['image'])[:28]:<28} "
+                      f"{case['dtype']:>6} k={case['kernel_size']}: {ratio:.2f}x slower")
+    if not regressions:
+        print("  no regressions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark custom vs OpenCV operator pairs")
+    parser.add_argument('--pairs', nargs='+', choices=sorted(PAIRS), default=sorted(PAIRS), help="Các family cần đo")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024], help="Cạnh ảnh tổng hợp (pixel)")
+    parser.add_argument('--kernels', type=int, nargs='+', default=[3, 5, 9], help="Kích thước kernel")
+    parser.add_argument('--dtypes', nargs='+', choices=['uint8', 'uint16'], default=['uint8', 'uint16'])
+    parser.add_argument('--channels', type=int, choices=[1, 3], default=1, help="1 (grayscale) hoặc 3 (RGB)")
+    parser.add_argument('--samples', default='uploads', help="Thư mục ảnh mẫu")
+    parser.add_argument('--no-samples', action='store_true', help="Chỉ dùng ảnh tổng hợp")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần lặp, lấy thời gian nhỏ nhất")
+    parser.add_argument('--output', default='bench_pairs.json', help="File JSON kết quả")
+    parser.add_argument('--baseline', help="File JSON của một lần chạy trước để so sánh")
+    parser.add_argument('--tolerance', type=float, default=1.2, help="Ngưỡng chậm đi để báo (lần)")
+    args = parser.parse_args()
+
+    samples = [] if args.no_samples else sorted(
+        path for pattern in SAMPLE_PATTERNS for path in glob.glob(os.path.join(args.samples, pattern)))
+    images = test_images(args.sizes, args.channels, samples, np.random.default_rng(0))
+
+    print_header()
+    cases = run_cases(args.pairs, images, args.kernels, args.dtypes, args.repeat)
+
+    report = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                        'machine': platform.machine(), 'cpu_count': os.cpu_count()},
+        'settings': {'repeat': args.repeat, 'channels': args.channels},
+        'cases': cases,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(cases)} cases to {args.output}")
+
+    if args.baseline:
+        compare_baseline(cases, args.baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark khả năng mở rộng của parallel_filter từ 1 đến N lõi, với backend thread và process.
+
+Chạy từ thư mục gốc của dự án:
+    python -m benchmarks.bench_parallel --size 2048 --methods mean_filter dilation median_filter
+    python -m benchmarks.bench_parallel --size 1024 --workers 1 2 4 8 16 32 --backend process
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from image_processing.parallel import PARALLEL_METHODS, parallel_filter
+
+
+def time_function(func, repeat):
+    """
+    Trả về (thời gian nhỏ nhất tính bằng giây, kết quả của lần chạy cuối).
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def default_worker_counts():
+    """
+    1, 2, 4, ... đến số lõi CPU.
+    """
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 < cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row-band parallel filters over worker counts")
+    parser.add_argument('--size', type=int, default=1024, help="Cạnh ảnh vuông (pixel)")
+    parser.add_argument('--methods', nargs='+', default=['mean_filter', 'dilation', 'median_filter', 'jpeg_encode_decode_grayscale'],
+                        choices=PARALLEL_METHODS)
+    parser.add_argument('--kernel-size', type=int, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=default_worker_counts())
+    parser.add_argument('--backend', choices=['thread', 'process', 'both'], default='both')
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần lặp, lấy thời gian nhỏ nhất")
+    args = parser.parse_args()
+
+    image = np.random.default_rng(0).integers(0, 256, size=(args.size, args.size), dtype=np.uint8)
+    backends = ['thread', 'process'] if args.backend == 'both' else [args.backend]
+    print(f"{os.cpu_count()} CPU cores, image {args.size}x{args.size}, kernel {args.kernel_size}")
+    print(f"{'method':>30} {'backend':>8} {'workers':>8} {'time (s)':>10} {'speedup':>8}")
+
+    for method in args.methods:
+        serial_time, reference = time_function(lambda: parallel_filter(image, method, args.kernel_size, workers=1), args.repeat)
+        print(f"{method:>30} {'serial':>8} {1:>8} {serial_time:>10.4f} {1.0:>8.2f}")
+        for backend in backends:
+            for workers in args.workers:
+                if workers == 1:
+                    continue
+                # Pool tạo trước và dùng lại để thời gian đo không tính chi phí khởi động worker
+                pool_class = ThreadPoolExecutor if backend == 'thread' else ProcessPoolExecutor
+                with pool_class(max_workers=workers) as executor:
+                    parallel_filter(image[:64], method, args.kernel_size, workers=workers, backend=backend, executor=executor)
+                    elapsed, result = time_function(
+                        lambda: parallel_filter(image, method, args.kernel_size, workers=workers, backend=backend, executor=executor),
+                        args.repeat)
+                assert np.array_equal(result, reference), f"{method} ({backend}, {workers} workers) differs from serial"
+                print(f"{method:>30} {backend:>8} {workers:>8} {elapsed:>10.4f} {serial_time / elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
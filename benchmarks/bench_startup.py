@@ -0,0 +1,154 @@
+"""
+Benchmark khởi động: thời gian import một module (mặc định server) trong tiến trình Python mới, đo bằng
+`python -X importtime`, và thời gian warm-up (processing.warm_up) của từng bước.
+Báo cáo gồm tổng thời gian import, thời gian theo gói cấp cao nhất (flask, numpy, cv2, scipy, ...), các module
+tốn nhiều thời gian nhất, và các thư viện nặng đã bị import ngay từ đầu (OpenCV, SciPy, PIL chỉ nên được
+import ở lần dùng đầu tiên, xem image_processing.lazy). Kết quả được ghi ra JSON (--baseline để so sánh).
+
+Chạy từ thư mục gốc của dự án:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 5 --warmup all --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+from collections import defaultdict
+
+# Các thư viện không nên bị import khi chỉ import server
+HEAVY_MODULES = ('cv2', 'scipy', 'PIL')
+
+WARMUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import processing
+imported = time.perf_counter() - start
+names = processing.warmup_operators(sys.argv[1])
+timings = processing.warm_up(names)
+from image_processing.lazy import IMPORT_SECONDS
+print(json.dumps({'import': imported, 'steps': timings, 'lazy_imports': IMPORT_SECONDS}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Đọc output của -X importtime.
+    Returns:
+        list: (tên module, self µs, cumulative µs) theo thứ tự import.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure_import(module):
+    """
+    Import module trong một tiến trình Python mới.
+    Returns:
+        list: Xem parse_importtime.
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               capture_output=True, text=True, check=True)
+    return parse_importtime(completed.stderr)
+
+
+def summarize(runs, module, top):
+    """
+    Gộp nhiều lần đo: với mỗi module lấy lần nhanh nhất (giảm nhiễu của hệ thống).
+    """
+    self_us, cumulative_us = {}, {}
+    for modules in runs:
+        for name, own, cumulative in modules:
+            self_us[name] = min(self_us.get(name, own), own)
+            cumulative_us[name] = min(cumulative_us.get(name, cumulative), cumulative)
+    packages = defaultdict(int)
+    for name, own in self_us.items():
+        packages[name.split('.')[0]] += own
+    return {
+        'total_ms': round(cumulative_us.get(module, 0) / 1000, 2),
+        'packages_ms': {name: round(us / 1000, 2)
+                        for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        'modules_ms': [{'module': name, 'self': round(own / 1000, 2), 'cumulative': round(cumulative_us[name] / 1000, 2)}
+                       for name, own in sorted(self_us.items(), key=lambda item: -item[1])[:top]],
+        'eager_heavy_modules': sorted(name for name in HEAVY_MODULES if name in self_us),
+    }
+
+
+def measure_warmup(operators):
+    completed = subprocess.run([sys.executable, '-c', WARMUP_SCRIPT, operators], capture_output=True, text=True,
+                               check=True)
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def print_report(report):
+    print(f"import {report['module']}: {report['total_ms']:.1f} ms (best of {report['repeat']})")
+    print("\nBy package (self time):")
+    for name, ms in report['packages_ms'].items():
+        print(f"  {name:<40} {ms:>8.1f} ms")
+    print("\nSlowest modules:")
+    print(f"  {'module':<40} {'self':>8} {'cumul.':>8}")
+    for row in report['modules_ms']:
+        print(f"  {row['module']:<40} {row['self']:>6.1f}ms {row['cumulative']:>6.1f}ms")
+    eager = report['eager_heavy_modules']
+    print(f"\nHeavy modules imported eagerly: {', '.join(eager) if eager else 'none'}")
+    warmup = report.get('warmup')
+    if warmup:
+        print(f"\nWarm-up ({sum(warmup['steps'].values()) * 1000:.1f} ms):")
+        for step, seconds in sorted(warmup['steps'].items(), key=lambda item: -item[1]):
+            print(f"  {step:<40} {seconds * 1000:>8.1f} ms")
+        print("Lazy imports during warm-up:")
+        for name, seconds in sorted(warmup['lazy_imports'].items(), key=lambda item: -item[1]):
+            print(f"  {name:<40} {seconds * 1000:>8.1f} ms")
+
+
+def compare_baseline(report, baseline_path, tolerance):
+    """
+    So sánh tổng thời gian import với một file JSON trước đó.
+    Returns:
+        bool: True nếu chậm hơn tolerance lần.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ratio = report['total_ms'] / max(baseline['total_ms'], 1e-9)
+    regression = ratio > tolerance
+    print(f"\nCompared with {baseline_path}: {baseline['total_ms']:.1f} ms -> {report['total_ms']:.1f} ms "
+          f"({ratio:.2f}x){' REGRESSION' if regression else ''}")
+    return regression
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and warm-up report for the server")
+    parser.add_argument('--module', default='server', help="Module cần import")
+    parser.add_argument('--repeat', type=int, default=3, help="Số tiến trình đo, lấy thời gian nhỏ nhất")
+    parser.add_argument('--top', type=int, default=15, help="Số module/gói chậm nhất được in")
+    parser.add_argument('--warmup', help="Đo thêm processing.warm_up với các toán tử này ('all' hoặc danh sách)")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    parser.add_argument('--baseline', help="File JSON của một lần chạy trước để so sánh")
+    parser.add_argument('--tolerance', type=float, default=1.2, help="Ngưỡng chậm đi để báo (lần)")
+    args = parser.parse_args()
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    report = dict({'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                   'python': platform.python_version(), 'module': args.module, 'repeat': args.repeat},
+                  **summarize(runs, args.module, args.top))
+    if args.warmup:
+        report['warmup'] = measure_warmup(args.warmup)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.baseline:
+        compare_baseline(report, args.baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    main()
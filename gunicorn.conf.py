@@ -0,0 +1,78 @@
+"""
+Cấu hình chạy server ở chế độ production bằng gunicorn (WSGI, preforking):
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Tiến trình master import ứng dụng (preload_app) và dựng trước các trạng thái chỉ đọc
+(processing.preload_shared_state: thư viện, bảng lượng tử hóa JPEG, hàm truyền của bộ lọc miền tần số)
+rồi mới fork các worker, nên các worker dùng chung chúng qua copy-on-write. gc.freeze() đưa các đối tượng
+này ra khỏi bộ thu gom rác để GC của worker không ghi vào (và không làm sao chép) các trang bộ nhớ đó.
+
+Biến môi trường:
+- BIND: địa chỉ lắng nghe (mặc định 0.0.0.0:8000).
+- WEB_WORKERS: số worker HTTP (mặc định bằng số lõi CPU: các phép xử lý ảnh dùng CPU, thêm worker
+  chỉ làm chúng tranh nhau lõi).
+- WEB_THREADS: số luồng mỗi worker (mặc định 1; lớn hơn 1 dùng worker gthread, ví dụ để /metrics và
+  /jobs/<id> vẫn trả lời khi worker đang xử lý một ảnh).
+- WEB_TIMEOUT: số giây tối đa cho một request trước khi worker bị khởi động lại (mặc định 120).
+- MAX_UPLOAD_BYTES: kích thước request tối đa (mặc định 256 MiB), xem server.py.
+- PRELOAD_FILTER_SHAPES: các kích thước ảnh (ví dụ "1024x1024,1920x1080") cần tính trước hàm truyền.
+- JOB_WORKERS: số tiến trình của hàng đợi job trong mỗi worker (mặc định số lõi / WEB_WORKERS).
+- PARALLEL_WORKERS: số luồng xử lý song song theo dải của một ảnh lớn (mặc định số lõi / WEB_WORKERS),
+  xem processing.PARALLEL_MIN_PIXELS.
+- JOB_FOLDER: thư mục trạng thái job dùng chung giữa các worker (mặc định jobs/), xem jobs.JobStore.
+
+Mỗi worker có hàng đợi job riêng nhưng ghi trạng thái và kết quả job vào JOB_FOLDER, nên /jobs/<id> (và
+status_url của chế độ xem trước) trả lời được ở mọi worker. MEMORY_STORE là bộ nhớ riêng của từng worker:
+với nhiều worker, delivery=memory nhúng kết quả vào trang (data URL) thay vì trả về /memory/<token>.
+RESULT_CACHE và /metrics vẫn riêng từng worker; cache chỉ trúng ít hơn vì file kết quả nằm chung trong results/.
+"""
+import gc
+import os
+
+cores = os.cpu_count() or 1
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', cores))
+threads = int(os.environ.get('WEB_THREADS', 1))
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+
+# Giới hạn phần đầu của request (dòng request, số header và kích thước mỗi header); phần thân được giới hạn
+# bởi MAX_CONTENT_LENGTH của Flask
+limit_request_line = 8190
+limit_request_fields = 100
+limit_request_field_size = 8190
+os.environ.setdefault('MAX_UPLOAD_BYTES', str(256 * 1024 * 1024))
+
+# Mỗi worker có hàng đợi job riêng: chia các lõi cho các worker thay vì mỗi worker tạo số tiến trình bằng
+# số lõi. Thư viện số học (OpenMP/BLAS) cũng dùng một luồng mỗi tiến trình để không tranh lõi.
+os.environ.setdefault('JOB_WORKERS', str(max(1, cores // workers)))
+os.environ.setdefault('OMP_NUM_THREADS', str(max(1, cores // workers)))
+os.environ.setdefault('PARALLEL_WORKERS', str(max(1, cores // workers)))
+
+
+def filter_shapes(value):
+    """
+    Đọc PRELOAD_FILTER_SHAPES ("1024x1024,1920x1080", rộng x cao) thành các kích thước (rows, cols).
+    """
+    shapes = []
+    for item in value.replace(';', ',').split(','):
+        if item.strip():
+            width, height = item.lower().split('x')
+            shapes.append((int(height), int(width)))
+    return shapes
+
+
+def when_ready(server):
+    # Chạy trong master sau khi ứng dụng đã được import (preload_app) và trước khi fork worker đầu tiên
+    from server import app
+    from processing import preload_shared_state
+    # Số worker thực tế (kể cả khi được đặt bằng -w trên dòng lệnh), xem process_in_memory
+    app.config['WEB_WORKERS'] = server.cfg.workers
+    state = preload_shared_state(filter_shapes(os.environ.get('PRELOAD_FILTER_SHAPES', '')))
+    server.log.info("Preloaded %d modules, %d bytes of quantization tables, %d bytes of transfer functions",
+                    len(state['modules']), state['quality_tables_bytes'], state['transfer_functions_bytes'])
+    gc.freeze()
@@ -0,0 +1,164 @@
+import numpy as np
+from image_processing.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+# Các chế độ màu của một yêu cầu xử lý (trường form "color"):
+# - grayscale: chuyển ảnh về một kênh (mặc định, như trước đây).
+# - channels: xử lý đồng thời mọi kênh màu trên mảng (H, W, C).
+# - luma: chỉ xử lý kênh Y của YCbCr, giữ nguyên Cb/Cr.
+COLOR_MODES = ('grayscale', 'channels', 'luma')
+
+# Ma trận RGB -> YCbCr toàn dải (JFIF, hệ số BT.601)
+RGB_TO_YCBCR = np.array([[0.299, 0.587, 0.114],
+                         [-0.168736, -0.331264, 0.5],
+                         [0.5, -0.418688, -0.081312]], dtype=np.float32)
+YCBCR_TO_RGB = np.array([[1.0, 0.0, 1.402],
+                         [1.0, -0.344136, -0.714136],
+                         [1.0, 1.772, 0.0]], dtype=np.float32)
+
+# Các kiểu lấy mẫu màu Cb/Cr khi nén JPEG: 4:2:0 (giảm một nửa theo cả hai chiều) và 4:4:4 (không giảm)
+JPEG_SUBSAMPLING = ('4:2:0', '4:4:4')
+
+def dtype_maximum(dtype):
+    """
+    Giá trị lớn nhất của một mức sáng: 255 với uint8, 65535 với uint16.
+    """
+    return np.iinfo(dtype).max
+
+def normalize_depth(image):
+    """
+    Đưa ảnh vừa giải mã về uint8 hoặc uint16, giữ nguyên độ sâu 16 bit thay vì cắt cụt về 8 bit.
+    - uint8, uint16: giữ nguyên.
+    - bool: 0/255 (uint8).
+    - Số nguyên khác (ví dụ int32 của ảnh PIL mode 'I'): cắt về [0, 65535] (uint16).
+    - Số thực: ảnh trong [0, 1] được nhân với 65535 (uint16), ngược lại cắt về [0, 255] (uint8).
+    """
+    if image.dtype in (np.uint8, np.uint16):
+        return image
+    if image.dtype == bool:
+        return image.astype(np.uint8) * 255
+    if np.issubdtype(image.dtype, np.integer):
+        return np.clip(image, 0, 65535).astype(np.uint16)
+    if image.size and np.nanmax(image) <= 1.0:
+        return np.round(np.clip(np.nan_to_num(image), 0, 1) * 65535).astype(np.uint16)
+    return np.round(np.clip(np.nan_to_num(image), 0, 255)).astype(np.uint8)
+
+def convert_depth(image, dtype):
+    """
+    Đổi độ sâu bit giữa uint8 và uint16 theo tỷ lệ (0..255 <-> 0..65535, làm tròn).
+    """
+    dtype = np.dtype(dtype)
+    if image.dtype == dtype:
+        return image
+    if image.dtype == np.uint8 and dtype == np.uint16:
+        return image.astype(np.uint16) * 257
+    if image.dtype == np.uint16 and dtype == np.uint8:
+        return ((image.astype(np.uint32) + 128) // 257).astype(np.uint8)
+    raise ValueError(f"Cannot convert {image.dtype} to {dtype}.")
+
+def to_uint8(image):
+    """
+    Ảnh uint8 cho các toán tử chỉ hỗ trợ 8 bit (JPEG baseline, một số hàm OpenCV).
+    """
+    return convert_depth(normalize_depth(image), np.uint8)
+
+def convert_to_grayscale(image_array):
+    """
+    Chuyển đổi ảnh về định dạng grayscale, giữ nguyên kiểu dữ liệu (uint8 hoặc uint16).
+    Ảnh nhiều kênh theo thứ tự RGB: 2 kênh là grayscale + alpha, 4 kênh là RGBA (alpha bị bỏ qua).
+    """
+    if image_array.ndim == 2:  # Ảnh đã là grayscale
+        return image_array
+    if image_array.ndim != 3:
+        raise ValueError("Unsupported image format.")
+    channels = image_array.shape[2]
+    if channels in (1, 2):
+        return np.ascontiguousarray(image_array[..., 0])
+    if channels == 3:
+        return cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+    if channels == 4:
+        return cv2.cvtColor(image_array, cv2.COLOR_RGBA2GRAY)
+    raise ValueError(f"Unsupported number of channels: {channels}.")
+
+def split_alpha(image):
+    """
+    Tách kênh alpha (ảnh 2 hoặc 4 kênh) khỏi các kênh màu.
+    Returns:
+        tuple: (ảnh màu 2D hoặc (H, W, 3), alpha hoặc None).
+    """
+    if image.ndim != 3:
+        return image, None
+    channels = image.shape[2]
+    if channels == 4:
+        return np.ascontiguousarray(image[..., :3]), image[..., 3]
+    if channels == 2:
+        return np.ascontiguousarray(image[..., 0]), image[..., 1]
+    if channels == 1:
+        return np.ascontiguousarray(image[..., 0]), None
+    return image, None
+
+def merge_alpha(image, alpha):
+    """
+    Gắn lại kênh alpha vào ảnh kết quả (H, W, 3); alpha được đổi về cùng độ sâu bit với kết quả.
+    Kết quả không phải ảnh ba kênh (ví dụ ảnh xám) được trả về không kèm alpha.
+    """
+    if alpha is None or image.ndim != 3 or image.shape[2] != 3:
+        return image
+    return np.dstack([image, convert_depth(alpha, image.dtype)])
+
+def working_shape(shape, color):
+    """
+    Kích thước mảng được xử lý, suy ra từ kích thước ảnh giải mã (rows, cols[, bands]) và chế độ màu.
+    """
+    height, width = int(shape[0]), int(shape[1])
+    bands = shape[2] if len(shape) > 2 else 1
+    channels = 3 if bands >= 3 else 1  # Bỏ kênh alpha
+    if color == 'channels' and channels > 1:
+        return height, width, channels
+    return height, width
+
+def rgb_to_ycbcr(image):
+    """
+    RGB -> YCbCr toàn dải (JFIF). Cb/Cr được dịch lên nửa dải của kiểu dữ liệu (128 với uint8).
+    Args:
+        image (ndarray): Ảnh (H, W, 3) uint8 hoặc uint16.
+    Returns:
+        ndarray: Ảnh YCbCr float32 (H, W, 3).
+    """
+    ycbcr = np.asarray(image, dtype=np.float32) @ RGB_TO_YCBCR.T
+    ycbcr[..., 1:] += (dtype_maximum(image.dtype) + 1) / 2
+    return ycbcr
+
+def ycbcr_to_rgb(ycbcr, dtype=np.uint8):
+    """
+    YCbCr (float) -> RGB với kiểu dtype, làm tròn và cắt về dải của kiểu.
+    """
+    offset = (dtype_maximum(dtype) + 1) / 2
+    centered = np.array(ycbcr, dtype=np.float32)
+    centered[..., 1:] -= offset
+    rgb = centered @ YCBCR_TO_RGB.T
+    np.rint(rgb, out=rgb)
+    np.clip(rgb, 0, dtype_maximum(dtype), out=rgb)
+    return rgb.astype(dtype)
+
+def apply_luma(function, image):
+    """
+    Áp dụng function lên kênh Y của ảnh RGB, giữ nguyên Cb/Cr rồi chuyển lại về RGB.
+    Kết quả của function có thể là một ảnh (H, W) hoặc một chồng ảnh (n, H, W) (chế độ nhiều bán kính);
+    nếu độ sâu bit khác ảnh vào (ví dụ Laplacian trả về uint8) thì được đổi về độ sâu của ảnh vào.
+    Returns:
+        ndarray: (H, W, 3) hoặc (n, H, W, 3) cùng kiểu với image.
+    """
+    ycbcr = rgb_to_ycbcr(image)
+    maximum = dtype_maximum(image.dtype)
+    luma = np.clip(np.rint(ycbcr[..., 0]), 0, maximum).astype(image.dtype)
+    result = function(luma)
+
+    def merge(plane):
+        ycbcr[..., 0] = convert_depth(plane, image.dtype)
+        return ycbcr_to_rgb(ycbcr, image.dtype)
+
+    if result.ndim == 3:
+        return np.stack([merge(plane) for plane in result])
+    return merge(result)
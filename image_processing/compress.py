@@ -1,7 +1,16 @@
+import struct
+from functools import lru_cache
+
 import numpy as np
-from PIL import Image
-from scipy.fftpack import dct, idct  # Sử dụng FFT để tính DCT nhanh hơn
-import cv2
+from image_processing.color import JPEG_SUBSAMPLING, convert_to_grayscale, rgb_to_ycbcr, to_uint8
+from image_processing.lazy import LazyFunction, lazy_import
+
+Image = lazy_import('PIL.Image')
+cv2 = lazy_import('cv2')
+# Sử dụng FFT để tính DCT nhanh hơn; scipy.fftpack chỉ được import ở lần nén đầu tiên
+dct = LazyFunction('scipy.fftpack', 'dct')
+idct = LazyFunction('scipy.fftpack', 'idct')
+
 # Ma trận lượng tử hóa chuẩn JPEG
 JPEG_QUANTIZATION_TABLE = np.array([
     [16, 11, 10, 16, 24, 40, 51, 61],
@@ -14,24 +23,94 @@ JPEG_QUANTIZATION_TABLE = np.array([
     [72, 92, 95, 98, 112, 100, 103, 99]
 ])
 
-# Bước 1: Chuyển đổi ảnh sang grayscale (nếu cần)
-def convert_to_grayscale(image_array):
-    """
-    Chuyển đổi ảnh về định dạng grayscale.
-    """
-    if len(image_array.shape) == 2:  # Ảnh đã là grayscale
-        return image_array
-    elif len(image_array.shape) == 3:  # Ảnh có nhiều kênh (RGB hoặc RGBA)
-        return np.dot(image_array[..., :3], [0.299, 0.587, 0.114]).astype(np.uint8)
-    else:
-        raise ValueError("Unsupported image format.")
+# Ma trận lượng tử hóa chuẩn cho các kênh màu Cb/Cr (JPEG Annex K.1, bảng K.2)
+JPEG_CHROMINANCE_QUANTIZATION_TABLE = np.array([
+    [17, 18, 24, 47, 99, 99, 99, 99],
+    [18, 21, 26, 66, 99, 99, 99, 99],
+    [24, 26, 56, 99, 99, 99, 99, 99],
+    [47, 66, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99]
+])
+
+# Bảng thứ tự Zig-Zag dùng chung cho zigzag_scan và inverse_zigzag_scan
+ZIGZAG_ORDER = np.array([
+    0, 1, 5, 6, 14, 15, 27, 28,
+    2, 4, 7, 13, 16, 26, 29, 42,
+    3, 8, 12, 17, 25, 30, 41, 43,
+    9, 11, 18, 24, 31, 40, 44, 53,
+    10, 19, 23, 32, 39, 45, 52, 54,
+    20, 22, 33, 38, 46, 51, 55, 56,
+    21, 34, 37, 47, 50, 57, 58, 59,
+    35, 36, 48, 49, 60, 61, 62, 63
+])
+
+# Vị trí (theo hàng) của hệ số thứ k trong dòng bit JPEG chuẩn (ITU T.81, Hình A.6).
+# Khác ZIGZAG_ORDER ở ba hàng cuối, nên chỉ dùng bảng này khi ghi file .jpg thật.
+JPEG_NATURAL_ORDER = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10,
+    17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34,
+    27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36,
+    29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46,
+    53, 60, 61, 54, 47, 55, 62, 63
+])
+
+# Bảng Huffman chuẩn cho kênh độ sáng (JPEG Annex K.3): (BITS, HUFFVAL)
+STANDARD_DC_LUMINANCE_HUFFMAN = (
+    [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0],
+    list(range(12)),
+)
+STANDARD_AC_LUMINANCE_HUFFMAN = (
+    [0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7d],
+    [
+        0x01, 0x02, 0x03, 0x00, 0x04, 0x11, 0x05, 0x12, 0x21, 0x31, 0x41, 0x06, 0x13, 0x51, 0x61, 0x07,
+        0x22, 0x71, 0x14, 0x32, 0x81, 0x91, 0xa1, 0x08, 0x23, 0x42, 0xb1, 0xc1, 0x15, 0x52, 0xd1, 0xf0,
+        0x24, 0x33, 0x62, 0x72, 0x82, 0x09, 0x0a, 0x16, 0x17, 0x18, 0x19, 0x1a, 0x25, 0x26, 0x27, 0x28,
+        0x29, 0x2a, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3a, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48, 0x49,
+        0x4a, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5a, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69,
+        0x6a, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7a, 0x83, 0x84, 0x85, 0x86, 0x87, 0x88, 0x89,
+        0x8a, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9a, 0xa2, 0xa3, 0xa4, 0xa5, 0xa6, 0xa7,
+        0xa8, 0xa9, 0xaa, 0xb2, 0xb3, 0xb4, 0xb5, 0xb6, 0xb7, 0xb8, 0xb9, 0xba, 0xc2, 0xc3, 0xc4, 0xc5,
+        0xc6, 0xc7, 0xc8, 0xc9, 0xca, 0xd2, 0xd3, 0xd4, 0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0xda, 0xe1, 0xe2,
+        0xe3, 0xe4, 0xe5, 0xe6, 0xe7, 0xe8, 0xe9, 0xea, 0xf1, 0xf2, 0xf3, 0xf4, 0xf5, 0xf6, 0xf7, 0xf8,
+        0xf9, 0xfa,
+    ],
+)
+
+# Bảng Huffman chuẩn cho các kênh màu (JPEG Annex K.3)
+STANDARD_DC_CHROMINANCE_HUFFMAN = (
+    [0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0],
+    list(range(12)),
+)
+STANDARD_AC_CHROMINANCE_HUFFMAN = (
+    [0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77],
+    [
+        0x00, 0x01, 0x02, 0x03, 0x11, 0x04, 0x05, 0x21, 0x31, 0x06, 0x12, 0x41, 0x51, 0x07, 0x61, 0x71,
+        0x13, 0x22, 0x32, 0x81, 0x08, 0x14, 0x42, 0x91, 0xa1, 0xb1, 0xc1, 0x09, 0x23, 0x33, 0x52, 0xf0,
+        0x15, 0x62, 0x72, 0xd1, 0x0a, 0x16, 0x24, 0x34, 0xe1, 0x25, 0xf1, 0x17, 0x18, 0x19, 0x1a, 0x26,
+        0x27, 0x28, 0x29, 0x2a, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3a, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48,
+        0x49, 0x4a, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5a, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68,
+        0x69, 0x6a, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7a, 0x82, 0x83, 0x84, 0x85, 0x86, 0x87,
+        0x88, 0x89, 0x8a, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9a, 0xa2, 0xa3, 0xa4, 0xa5,
+        0xa6, 0xa7, 0xa8, 0xa9, 0xaa, 0xb2, 0xb3, 0xb4, 0xb5, 0xb6, 0xb7, 0xb8, 0xb9, 0xba, 0xc2, 0xc3,
+        0xc4, 0xc5, 0xc6, 0xc7, 0xc8, 0xc9, 0xca, 0xd2, 0xd3, 0xd4, 0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0xda,
+        0xe2, 0xe3, 0xe4, 0xe5, 0xe6, 0xe7, 0xe8, 0xe9, 0xea, 0xf2, 0xf3, 0xf4, 0xf5, 0xf6, 0xf7, 0xf8,
+        0xf9, 0xfa,
+    ],
+)
 
 # Bước 2: Chuyển dữ liệu từ [0, 255] sang [-128, 127]
 def shift_range(image_array):
     """
     Chuyển dữ liệu từ [0, 255] sang [-128, 127].
+    Ép sang int16 trước để phép trừ không bị tràn số trên ảnh uint8.
     """
-    return image_array - 128
+    return image_array.astype(np.int16) - 128
 
 # Bước 3: Chia ảnh thành các khối 8x8 (có padding nếu cần)
 def split_into_blocks(image_array):
@@ -74,17 +153,7 @@ def zigzag_scan(block):
     """
     Quét khối 8x8 theo thứ tự Zig-Zag.
     """
-    zigzag_order = [
-        0, 1, 5, 6, 14, 15, 27, 28,
-        2, 4, 7, 13, 16, 26, 29, 42,
-        3, 8, 12, 17, 25, 30, 41, 43,
-        9, 11, 18, 24, 31, 40, 44, 53,
-        10, 19, 23, 32, 39, 45, 52, 54,
-        20, 22, 33, 38, 46, 51, 55, 56,
-        21, 34, 37, 47, 50, 57, 58, 59,
-        35, 36, 48, 49, 60, 61, 62, 63
-    ]
-    return block.flatten()[zigzag_order]
+    return block.flatten()[ZIGZAG_ORDER]
 
 # Bước 7: Mã hóa Run-Length Coding (RLC)
 def run_length_encoding(quantized_block):
@@ -117,20 +186,9 @@ def inverse_zigzag_scan(zigzag_block):
     """
     Quét Zig-Zag ngược để khôi phục khối 8x8.
     """
-    block = np.zeros((8, 8))
-    zigzag_order = [
-        0, 1, 5, 6, 14, 15, 27, 28,
-        2, 4, 7, 13, 16, 26, 29, 42,
-        3, 8, 12, 17, 25, 30, 41, 43,
-        9, 11, 18, 24, 31, 40, 44, 53,
-        10, 19, 23, 32, 39, 45, 52, 54,
-        20, 22, 33, 38, 46, 51, 55, 56,
-        21, 34, 37, 47, 50, 57, 58, 59,
-        35, 36, 48, 49, 60, 61, 62, 63
-    ]
-    for i, value in enumerate(zigzag_block):
-        block[zigzag_order[i] // 8, zigzag_order[i] % 8] = value
-    return block
+    block = np.zeros(64)
+    block[ZIGZAG_ORDER] = zigzag_block
+    return block.reshape(8, 8)
 
 # Bước 10: Giải lượng tử hóa
 def dequantize(quantized_block, quantization_table):
@@ -150,33 +208,557 @@ def apply_idct(block):
 def reconstruct_image(blocks, original_height, original_width):
     """
     Khôi phục ảnh từ các khối 8x8.
-    Loại bỏ padding nếu có.
+    Mỗi khối được ghi thẳng vào ảnh kích thước gốc (phần nằm ngoài ảnh bị cắt bỏ), không tạo ảnh padding,
+    và ảnh giữ kiểu dữ liệu của các khối.
     """
-    # Tính toán kích thước ảnh đã được padding
-    padded_height = (original_height + 7) // 8 * 8
-    padded_width = (original_width + 7) // 8 * 8
-    
-    # Tạo ảnh mới với kích thước đã được padding
-    padded_image = np.zeros((padded_height, padded_width))
-    
-    # Gán các khối vào ảnh
+    reconstructed_image = np.empty((original_height, original_width), dtype=np.asarray(blocks[0]).dtype)
+
+    # Gán các khối vào ảnh theo thứ tự hàng rồi cột
     block_index = 0
-    for i in range(0, padded_height, 8):
-        for j in range(0, padded_width, 8):
-            padded_image[i:i+8, j:j+8] = blocks[block_index]
+    for i in range(0, original_height, 8):
+        for j in range(0, original_width, 8):
+            block = blocks[block_index]
+            reconstructed_image[i:i+8, j:j+8] = block[:original_height - i, :original_width - j]
             block_index += 1
-    
-    # Loại bỏ padding để khôi phục kích thước ảnh gốc
-    reconstructed_image = padded_image[:original_height, :original_width]
+
     return reconstructed_image
 
+# ---------------------------------------------------------------------------
+# Engine xử lý theo lô: toàn bộ các khối 8x8 được biểu diễn bằng mảng (N, 8, 8)
+# và mỗi bước được thực hiện một lần trên cả mảng thay vì lặp từng khối.
+# ---------------------------------------------------------------------------
+
+def split_into_blocks_batched(image_array):
+    """
+    Chia ảnh thành mảng các khối 8x8 có dạng (N, 8, 8), theo thứ tự hàng rồi cột
+    giống split_into_blocks. Nếu kích thước ảnh không chia hết cho 8, thêm padding.
+    """
+    height, width = image_array.shape
+    pad_height = (8 - height % 8) % 8
+    pad_width = (8 - width % 8) % 8
+    padded_image = np.pad(image_array, ((0, pad_height), (0, pad_width)), mode='constant', constant_values=0)
+
+    # View (số khối theo hàng, số khối theo cột, 8, 8) trên ảnh đã padding, không sao chép dữ liệu
+    block_rows, block_cols = padded_image.shape[0] // 8, padded_image.shape[1] // 8
+    blocks = padded_image.reshape(block_rows, 8, block_cols, 8).swapaxes(1, 2)
+    return blocks.reshape(-1, 8, 8), height, width
+
+def apply_dct_batched(blocks):
+    """
+    Áp dụng DCT 2D lên toàn bộ các khối (N, 8, 8) cùng lúc.
+    Thứ tự các trục giống apply_dct (theo cột trước, theo hàng sau).
+    """
+    return dct(dct(blocks, axis=1, norm='ortho'), axis=2, norm='ortho')
+
+def quantize_batched(dct_blocks, quantization_table):
+    """
+    Lượng tử hóa toàn bộ các khối DCT (N, 8, 8).
+    """
+    # Hệ số DCT của khối 8 bit không vượt quá 1024 về trị tuyệt đối nên vừa int16 (một phần tư bộ nhớ của int64);
+    # phép chia tạo mảng tạm duy nhất, làm tròn tại chỗ trên mảng đó
+    quantized = dct_blocks / quantization_table
+    np.rint(quantized, out=quantized)
+    return quantized.astype(np.int16)
+
+def zigzag_scan_batched(blocks):
+    """
+    Quét Zig-Zag toàn bộ các khối (N, 8, 8), trả về mảng (N, 64).
+    """
+    return blocks.reshape(-1, 64)[:, ZIGZAG_ORDER]
+
+def run_length_encoding_batched(zigzag_blocks):
+    """
+    Mã hóa Run-Length Coding cho toàn bộ các khối (N, 64).
+    Các run không vượt qua ranh giới giữa hai khối.
+    Trả về (values, counts, block_offsets): run thứ k có giá trị values[k], độ dài counts[k];
+    các run của khối i nằm trong đoạn [block_offsets[i], block_offsets[i + 1]).
+    """
+    num_blocks = zigzag_blocks.shape[0]
+    # Vị trí bắt đầu một run mới: đầu mỗi khối hoặc giá trị khác giá trị liền trước
+    run_start = np.ones(zigzag_blocks.shape, dtype=bool)
+    run_start[:, 1:] = zigzag_blocks[:, 1:] != zigzag_blocks[:, :-1]
+
+    flat_start = np.flatnonzero(run_start)
+    values = zigzag_blocks.reshape(-1)[flat_start]
+    counts = np.diff(np.append(flat_start, zigzag_blocks.size))
+
+    runs_per_block = run_start.sum(axis=1)
+    block_offsets = np.zeros(num_blocks + 1, dtype=np.int64)
+    np.cumsum(runs_per_block, out=block_offsets[1:])
+    return values, counts, block_offsets
+
+def run_length_decoding_batched(values, counts, num_blocks):
+    """
+    Giải mã Run-Length Coding, khôi phục mảng Zig-Zag (N, 64).
+    """
+    return np.repeat(values, counts).reshape(num_blocks, 64)
+
+def inverse_zigzag_scan_batched(zigzag_blocks):
+    """
+    Quét Zig-Zag ngược cho toàn bộ mảng (N, 64), trả về các khối (N, 8, 8).
+    """
+    blocks = np.empty_like(zigzag_blocks)
+    blocks[:, ZIGZAG_ORDER] = zigzag_blocks
+    return blocks.reshape(-1, 8, 8)
+
+def apply_idct_batched(blocks):
+    """
+    Áp dụng Inverse DCT 2D lên toàn bộ các khối (N, 8, 8) cùng lúc.
+    """
+    return idct(idct(blocks, axis=1, norm='ortho'), axis=2, norm='ortho')
+
+def reconstruct_image_batched(blocks, original_height, original_width):
+    """
+    Ghép mảng các khối (N, 8, 8) thành ảnh và loại bỏ padding nếu có.
+    """
+    block_rows = (original_height + 7) // 8
+    block_cols = (original_width + 7) // 8
+    padded_image = blocks.reshape(block_rows, block_cols, 8, 8).swapaxes(1, 2)
+    padded_image = padded_image.reshape(block_rows * 8, block_cols * 8)
+    return padded_image[:original_height, :original_width]
+
 # Hàm thử nghiệm toàn bộ quy trình nén và giải nén JPEG
 def jpeg_encode_decode_grayscale(image_array):
     """
     Thực hiện nén và giải nén JPEG trên ảnh grayscale.
+    Tất cả các khối 8x8 được xử lý cùng lúc dưới dạng mảng (N, 8, 8).
+    """
+    # Bước 1: Chuyển đổi ảnh sang grayscale (nếu cần)
+    image_array = to_uint8(convert_to_grayscale(image_array))
+
+    # Bước 2: Chuyển dữ liệu từ [0, 255] sang [-128, 127]
+    image_array = shift_range(image_array)
+
+    # Bước 3: Chia ảnh thành các khối 8x8 (có padding nếu cần)
+    blocks, original_height, original_width = split_into_blocks_batched(image_array)
+    num_blocks = blocks.shape[0]
+
+    # Bước 4-7: Nén toàn bộ các khối
+    quantized_blocks = quantize_batched(apply_dct_batched(blocks), JPEG_QUANTIZATION_TABLE)
+    values, counts, _ = run_length_encoding_batched(zigzag_scan_batched(quantized_blocks))
+
+    # Bước 8-11: Giải nén toàn bộ các khối
+    zigzag_blocks = run_length_decoding_batched(values, counts, num_blocks)
+    dct_blocks = dequantize(inverse_zigzag_scan_batched(zigzag_blocks), JPEG_QUANTIZATION_TABLE)
+    idct_blocks = apply_idct_batched(dct_blocks)
+
+    # Bước 12-13: Chuyển dữ liệu từ [-128, 127] sang [0, 255] tại chỗ trên các khối IDCT, rồi khôi phục ảnh
+    # (loại bỏ padding nếu có); chỉ phần ảnh thật được đổi sang uint8
+    idct_blocks += 128
+    np.clip(idct_blocks, 0, 255, out=idct_blocks)
+    return reconstruct_image_batched(idct_blocks, original_height, original_width).astype(np.uint8)
+
+# ---------------------------------------------------------------------------
+# Ghi file JPEG baseline thật: mã hóa vi sai DC, ký hiệu (run, size) cho AC,
+# mã Huffman (bảng chuẩn hoặc tối ưu theo từng ảnh) và đóng gói bit theo lô.
+# ---------------------------------------------------------------------------
+
+def magnitude_category(values):
+    """
+    Tính nhóm kích thước (số bit biểu diễn |v|) cho từng hệ số, 0 với v = 0.
+    """
+    _, exponent = np.frexp(np.abs(values).astype(np.float64))
+    return exponent.astype(np.int64)
+
+def huffman_codes(table):
+    """
+    Sinh mã Huffman từ bảng (BITS, HUFFVAL) theo JPEG Annex C.
+    Trả về (codes, lengths): hai mảng 256 phần tử đánh chỉ số theo ký hiệu.
+    """
+    bits, huffval = table
+    codes = np.zeros(256, dtype=np.int64)
+    lengths = np.zeros(256, dtype=np.int64)
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        for _ in range(bits[length - 1]):
+            codes[huffval[k]] = code
+            lengths[huffval[k]] = length
+            code += 1
+            k += 1
+        code <<= 1
+    return codes, lengths
+
+def optimize_huffman_table(frequencies):
+    """
+    Xây dựng bảng Huffman (BITS, HUFFVAL) tối ưu cho tần suất các ký hiệu,
+    độ dài mã tối đa 16 bit (JPEG Annex K.2).
+    """
+    freq = list(frequencies) + [1]  # Ký hiệu dự trữ 256 để không có mã toàn bit 1
+    codesize = [0] * 257
+    others = [-1] * 257
+
+    while True:
+        # v1: tần suất nhỏ nhất (ưu tiên ký hiệu lớn hơn khi bằng nhau), v2: nhỏ thứ hai
+        v1 = v2 = -1
+        for v in range(257):
+            if freq[v] > 0 and (v1 < 0 or freq[v] <= freq[v1]):
+                v1 = v
+        for v in range(257):
+            if freq[v] > 0 and v != v1 and (v2 < 0 or freq[v] <= freq[v2]):
+                v2 = v
+        if v2 < 0:
+            break
+
+        freq[v1] += freq[v2]
+        freq[v2] = 0
+        codesize[v1] += 1
+        while others[v1] >= 0:
+            v1 = others[v1]
+            codesize[v1] += 1
+        others[v1] = v2
+        codesize[v2] += 1
+        while others[v2] >= 0:
+            v2 = others[v2]
+            codesize[v2] += 1
+
+    bits = [0] * 33
+    for size in codesize:
+        if size:
+            bits[size] += 1
+
+    # Giới hạn độ dài mã ở 16 bit
+    for i in range(32, 16, -1):
+        while bits[i] > 0:
+            j = i - 2
+            while bits[j] == 0:
+                j -= 1
+            bits[i] -= 2
+            bits[i - 1] += 1
+            bits[j + 1] += 2
+            bits[j] -= 1
+    # Bỏ ký hiệu dự trữ khỏi nhóm mã dài nhất
+    i = 16
+    while bits[i] == 0:
+        i -= 1
+    bits[i] -= 1
+
+    huffval = [v for size in range(1, 33) for v in range(256) if codesize[v] == size]
+    return bits[1:17], huffval
+
+def entropy_symbols(zigzag_blocks, block_slots=None):
+    """
+    Sinh dãy ký hiệu entropy cho các khối đã lượng tử hóa (N, 64) theo thứ tự Zig-Zag chuẩn.
+    Vi sai DC được tính theo thứ tự các khối trong mảng (thứ tự mã hóa của một thành phần màu).
+    Args:
+        zigzag_blocks (ndarray): Các khối (N, 64).
+        block_slots (ndarray): Vị trí của từng khối trong dòng bit khi ghép nhiều thành phần màu
+            (xem encode_jpeg_color); None nghĩa là khối i nằm ở vị trí i.
+    Returns:
+        tuple: (dc_symbols, dc_extra, ac_symbols, ac_extra, keys):
+        - dc_*: ký hiệu size và bit bổ sung của vi sai DC, mỗi khối một phần tử;
+        - ac_*: ký hiệu (run << 4 | size), ZRL (0xF0), EOB (0x00) và bit bổ sung;
+        - keys: khóa sắp xếp của tất cả ký hiệu DC rồi AC; sắp xếp ổn định theo keys cho thứ tự dòng bit.
+    """
+    num_blocks = zigzag_blocks.shape[0]
+    block_ids = np.arange(num_blocks, dtype=np.int64)
+    slots = block_ids if block_slots is None else np.asarray(block_slots, dtype=np.int64)
+
+    # DC: mã hóa vi sai so với khối liền trước
+    dc_diff = np.diff(zigzag_blocks[:, 0].astype(np.int64), prepend=0)
+    dc_symbols = magnitude_category(dc_diff)
+    dc_extra = np.where(dc_diff >= 0, dc_diff, dc_diff + (1 << dc_symbols) - 1)
+
+    # AC: các hệ số khác 0, theo thứ tự khối rồi vị trí
+    ac = zigzag_blocks[:, 1:]
+    blocks, columns = np.nonzero(ac)
+    positions = columns.astype(np.int64) + 1
+    values = ac[blocks, columns].astype(np.int64)
+
+    previous = np.zeros_like(positions)
+    previous[1:] = positions[:-1]
+    first_in_block = np.ones(len(positions), dtype=bool)
+    first_in_block[1:] = blocks[1:] != blocks[:-1]
+    previous[first_in_block] = 0
+    runs = positions - previous - 1
+
+    sizes = magnitude_category(values)
+    symbols = ((runs & 15) << 4) | sizes
+    extra = np.where(values >= 0, values, values + (1 << sizes) - 1)
+
+    # ZRL (16 số 0 liên tiếp) đứng trước hệ số có run >= 16
+    zrl_counts = runs >> 4
+    zrl_owner = np.repeat(np.arange(len(positions)), zrl_counts)
+    zrl_index = np.arange(len(zrl_owner)) - np.repeat(np.cumsum(zrl_counts) - zrl_counts, zrl_counts)
+
+    # EOB cho các khối mà hệ số khác 0 cuối cùng không nằm ở vị trí 63
+    last_position = np.zeros(num_blocks, dtype=np.int64)
+    last_position[blocks] = positions
+    eob_blocks = block_ids[last_position != 63]
+
+    # Khóa sắp xếp: vị trí khối * 512 + vị trí trong khối (DC = 0, EOB = 511)
+    keys = np.concatenate([
+        slots * 512,
+        slots[blocks[zrl_owner]] * 512 + positions[zrl_owner] * 4 + zrl_index,
+        slots[blocks] * 512 + positions * 4 + 3,
+        slots[eob_blocks] * 512 + 511,
+    ])
+    ac_symbols = np.concatenate([np.full(len(zrl_owner), 0xF0), symbols, np.zeros(len(eob_blocks), dtype=np.int64)])
+    ac_extra = np.concatenate([np.zeros(len(zrl_owner), dtype=np.int64), extra, np.zeros(len(eob_blocks), dtype=np.int64)])
+    return dc_symbols, dc_extra, ac_symbols, ac_extra, keys
+
+def symbol_codes(symbols, dc_table, ac_table):
+    """
+    Mã hóa dãy ký hiệu của entropy_symbols bằng một cặp bảng Huffman (DC, AC).
+    Returns:
+        tuple: (codes, lengths) theo cùng thứ tự với keys; mỗi phần tử là mã Huffman nối với các bit bổ sung.
+    """
+    dc_symbols, dc_extra, ac_symbols, ac_extra = symbols[:4]
+    dc_codes, dc_lengths = huffman_codes(dc_table)
+    ac_codes, ac_lengths = huffman_codes(ac_table)
+
+    extra_sizes = np.concatenate([dc_symbols, ac_symbols & 15])
+    codes = np.concatenate([dc_codes[dc_symbols], ac_codes[ac_symbols]])
+    lengths = np.concatenate([dc_lengths[dc_symbols], ac_lengths[ac_symbols]])
+    extra = np.concatenate([dc_extra, ac_extra])
+    return (codes << extra_sizes) | extra, lengths + extra_sizes
+
+def quality_scaled_table(quantization_table, quality):
+    """
+    Co giãn ma trận lượng tử hóa theo chất lượng 1..100 như libjpeg (IJG):
+    quality < 50 nhân bảng với 50 / quality, quality >= 50 nhân với (200 - 2 * quality) / 100;
+    quality 50 giữ nguyên bảng chuẩn. Giá trị được cắt về [1, 255] cho JPEG baseline.
+    """
+    quality = int(quality)
+    if not 1 <= quality <= 100:
+        raise ValueError("JPEG quality must be between 1 and 100.")
+    scale = 5000 // quality if quality < 50 else 200 - 2 * quality
+    table = (np.asarray(quantization_table, dtype=np.int64) * scale + 50) // 100
+    return np.clip(table, 1, 255)
+
+@lru_cache(maxsize=None)
+def quality_tables(quality):
+    """
+    Cặp ma trận lượng tử hóa (độ sáng, màu) đã co giãn theo chất lượng, tính một lần cho mỗi quality.
+    Mảng trả về chỉ đọc vì được dùng chung giữa các lần nén (và giữa các worker, xem preload_quality_tables).
+    """
+    tables = (quality_scaled_table(JPEG_QUANTIZATION_TABLE, quality),
+              quality_scaled_table(JPEG_CHROMINANCE_QUANTIZATION_TABLE, quality))
+    for table in tables:
+        table.flags.writeable = False
+    return tables
+
+def preload_quality_tables():
+    """
+    Tính trước quality_tables cho mọi chất lượng 1..100.
+    Returns:
+        int: Số byte của các bảng.
+    """
+    return sum(table.nbytes for quality in range(1, 101) for table in quality_tables(quality))
+
+def pack_bits(codes, lengths):
+    """
+    Ghép dãy mã (codes[i] dài lengths[i] bit, tối đa 32 bit) thành dòng byte.
+    Bit thừa cuối cùng được điền 1, sau mỗi byte 0xFF chèn thêm 0x00 (byte stuffing).
+    """
+    lengths = lengths.astype(np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    total_bits = int(ends[-1]) if len(ends) else 0
+    num_bytes = (total_bits + 7) // 8
+
+    # Mỗi mã nằm gọn trong cửa sổ 40 bit bắt đầu từ byte chứa bit đầu tiên của nó.
+    # Các mã không chồng bit lên nhau nên cộng từng byte tương đương với phép OR.
+    byte_index = starts >> 3
+    shift = (40 - (starts & 7) - lengths).astype(np.uint64)
+    window = codes.astype(np.uint64) << shift
+    output = np.zeros(num_bytes + 5)
+    for k in range(5):
+        byte_values = ((window >> np.uint64(8 * (4 - k))) & np.uint64(0xFF)).astype(np.float64)
+        output += np.bincount(byte_index + k, weights=byte_values, minlength=num_bytes + 5)
+    output = output[:num_bytes].astype(np.uint8)
+
+    padding = num_bytes * 8 - total_bits
+    if padding:
+        output[-1] |= (1 << padding) - 1
+
+    stuffing = np.flatnonzero(output == 0xFF)
+    return np.insert(output, stuffing + 1, 0).tobytes()
+
+def marker_segment(marker, payload):
+    """
+    Tạo một segment JPEG: marker 2 byte, độ dài 2 byte (gồm cả chính nó) và dữ liệu.
+    """
+    return struct.pack('>HH', marker, len(payload) + 2) + payload
+
+def huffman_segment(table_class, table_id, table):
+    """
+    Tạo segment DHT cho một bảng Huffman (table_class: 0 = DC, 1 = AC).
+    """
+    bits, huffval = table
+    return marker_segment(0xFFC4, bytes([(table_class << 4) | table_id]) + bytes(bits) + bytes(huffval))
+
+def jpeg_headers(height, width, quantization_tables, components, huffman_tables):
+    """
+    Các segment đầu file JPEG baseline, từ SOI đến SOS.
+    Args:
+        quantization_tables (list): Các ma trận lượng tử hóa 8x8, bảng thứ i có id i.
+        components (list): (hệ số lấy mẫu (H << 4 | V), id bảng lượng tử hóa, id bảng Huffman) của từng thành phần.
+        huffman_tables (list): Các cặp bảng (DC, AC), cặp thứ i có id i.
+    """
+    quantization = b''.join(
+        bytes([table_id]) + np.asarray(table).reshape(64)[JPEG_NATURAL_ORDER].astype(np.uint8).tobytes()
+        for table_id, table in enumerate(quantization_tables))
+    frame = struct.pack('>BHHB', 8, height, width, len(components)) + b''.join(
+        bytes([index + 1, sampling, table_id]) for index, (sampling, table_id, _) in enumerate(components))
+    huffman = b''.join(
+        huffman_segment(0, table_id, dc_table) + huffman_segment(1, table_id, ac_table)
+        for table_id, (dc_table, ac_table) in enumerate(huffman_tables))
+    scan = bytes([len(components)]) + b''.join(
+        bytes([index + 1, (table_id << 4) | table_id]) for index, (_, _, table_id) in enumerate(components))
+    return b''.join([
+        b'\xff\xd8',                                                            # SOI
+        marker_segment(0xFFE0, b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'),  # APP0 (JFIF)
+        marker_segment(0xFFDB, quantization),                                    # DQT
+        marker_segment(0xFFC0, frame),                                           # SOF0
+        huffman,                                                                 # DHT
+        marker_segment(0xFFDA, scan + b'\x00\x3f\x00'),                         # SOS
+    ])
+
+def encode_jpeg_grayscale(image_array, quantization_table=JPEG_QUANTIZATION_TABLE, optimize_huffman=False):
+    """
+    Nén ảnh grayscale thành file JPEG baseline (SOF0) hoàn chỉnh.
+    Args:
+        image_array (ndarray): Ảnh đầu vào.
+        quantization_table (ndarray): Ma trận lượng tử hóa 8x8 (giá trị 1..255).
+        optimize_huffman (bool): True để xây dựng bảng Huffman tối ưu cho ảnh này,
+            False để dùng bảng chuẩn Annex K.
+    Returns:
+        bytes: Nội dung file .jpg.
+    """
+    image_array = to_uint8(convert_to_grayscale(image_array))
+    height, width = image_array.shape
+    if not (0 < height <= 65535 and 0 < width <= 65535):
+        raise ValueError("Image dimensions must be between 1 and 65535 for baseline JPEG.")
+
+    # Biến đổi DCT và lượng tử hóa theo lô, sau đó sắp xếp hệ số theo Zig-Zag chuẩn
+    blocks, _, _ = split_into_blocks_batched(shift_range(image_array))
+    quantized_blocks = quantize_batched(apply_dct_batched(blocks), quantization_table)
+    zigzag_blocks = quantized_blocks.reshape(-1, 64)[:, JPEG_NATURAL_ORDER]
+
+    symbols = entropy_symbols(zigzag_blocks)
+    if optimize_huffman:
+        dc_table = optimize_huffman_table(np.bincount(symbols[0], minlength=256))
+        ac_table = optimize_huffman_table(np.bincount(symbols[2], minlength=256))
+    else:
+        dc_table = STANDARD_DC_LUMINANCE_HUFFMAN
+        ac_table = STANDARD_AC_LUMINANCE_HUFFMAN
+
+    codes, lengths = symbol_codes(symbols, dc_table, ac_table)
+    order = np.argsort(symbols[4], kind='stable')
+    scan_data = pack_bits(codes[order], lengths[order])
+
+    header = jpeg_headers(height, width, [quantization_table], [(0x11, 0, 0)], [(dc_table, ac_table)])
+    return header + scan_data + b'\xff\xd9'                                    # EOI
+
+def encode_jpeg_color(image_array, quality=50, subsampling='4:2:0', optimize_huffman=False):
+    """
+    Nén ảnh màu RGB thành file JPEG baseline YCbCr ba thành phần (JFIF).
+    Với 4:2:0, Cb/Cr được lấy trung bình theo khối 2x2 trước DCT nên số khối cần biến đổi
+    chỉ bằng một nửa so với ba kênh đủ độ phân giải (4 khối Y + 1 Cb + 1 Cr cho mỗi MCU 16x16).
+    Args:
+        image_array (ndarray): Ảnh (H, W, 3) theo thứ tự RGB; ảnh 16 bit được đổi về 8 bit, alpha bị bỏ qua.
+        quality (int): Chất lượng 1..100 (co giãn bảng lượng tử hóa theo quality_scaled_table).
+        subsampling (str): '4:2:0' hoặc '4:4:4'.
+        optimize_huffman (bool): True để xây dựng bảng Huffman tối ưu (một cặp cho Y, một cặp dùng chung cho Cb/Cr).
+    Returns:
+        bytes: Nội dung file .jpg.
+    """
+    if subsampling not in JPEG_SUBSAMPLING:
+        raise ValueError(f"Subsampling must be one of {', '.join(JPEG_SUBSAMPLING)}.")
+    image_array = to_uint8(image_array)
+    if image_array.ndim != 3 or image_array.shape[2] < 3:
+        raise ValueError("Color JPEG expects an (H, W, 3) RGB image.")
+    height, width = image_array.shape[:2]
+    if not (0 < height <= 65535 and 0 < width <= 65535):
+        raise ValueError("Image dimensions must be between 1 and 65535 for baseline JPEG.")
+    luma_table, chroma_table = quality_tables(int(quality))
+
+    # Padding lặp lại pixel biên tới bội số của MCU (16 với 4:2:0, 8 với 4:4:4) để không tạo cạnh giả ở mép ảnh
+    factor = 2 if subsampling == '4:2:0' else 1
+    mcu = 8 * factor
+    ycbcr = rgb_to_ycbcr(image_array[..., :3])
+    ycbcr = np.pad(ycbcr, ((0, -height % mcu), (0, -width % mcu), (0, 0)), mode='edge')
+    ycbcr -= 128
+    mcu_rows, mcu_cols = ycbcr.shape[0] // mcu, ycbcr.shape[1] // mcu
+
+    luma = ycbcr[..., 0]
+    chroma = ycbcr[..., 1:]
+    if factor > 1:
+        # Trung bình 2x2 bằng tổng bốn lát cắt bước 2 (nhanh hơn nhiều so với mean trên các trục xen kẽ)
+        chroma = (chroma[0::2, 0::2] + chroma[0::2, 1::2] + chroma[1::2, 0::2] + chroma[1::2, 1::2]) * 0.25
+
+    # Khối Y theo thứ tự MCU: trong mỗi MCU, factor x factor khối theo hàng rồi cột
+    luma_blocks, _, _ = split_into_blocks_batched(luma)
+    luma_blocks = luma_blocks.reshape(mcu_rows, factor, mcu_cols, factor, 8, 8).swapaxes(1, 2).reshape(-1, 8, 8)
+    blocks_per_mcu = factor * factor + 2
+    mcu_ids = np.arange(mcu_rows * mcu_cols, dtype=np.int64)
+
+    components = [(luma_blocks, luma_table, np.arange(len(luma_blocks)) // (factor * factor) * blocks_per_mcu
+                   + np.arange(len(luma_blocks)) % (factor * factor))]
+    for index in range(2):
+        chroma_blocks, _, _ = split_into_blocks_batched(np.ascontiguousarray(chroma[..., index]))
+        components.append((chroma_blocks, chroma_table, mcu_ids * blocks_per_mcu + factor * factor + index))
+
+    symbols = []
+    for blocks, table, slots in components:
+        zigzag_blocks = quantize_batched(apply_dct_batched(blocks), table).reshape(-1, 64)[:, JPEG_NATURAL_ORDER]
+        symbols.append(entropy_symbols(zigzag_blocks, slots))
+
+    if optimize_huffman:
+        huffman_tables = [
+            (optimize_huffman_table(np.bincount(np.concatenate([s[0] for s in group]), minlength=256)),
+             optimize_huffman_table(np.bincount(np.concatenate([s[2] for s in group]), minlength=256)))
+            for group in (symbols[:1], symbols[1:])
+        ]
+    else:
+        huffman_tables = [(STANDARD_DC_LUMINANCE_HUFFMAN, STANDARD_AC_LUMINANCE_HUFFMAN),
+                          (STANDARD_DC_CHROMINANCE_HUFFMAN, STANDARD_AC_CHROMINANCE_HUFFMAN)]
+
+    encoded = [symbol_codes(s, *huffman_tables[min(index, 1)]) for index, s in enumerate(symbols)]
+    codes = np.concatenate([c for c, _ in encoded])
+    lengths = np.concatenate([length for _, length in encoded])
+    order = np.argsort(np.concatenate([s[4] for s in symbols]), kind='stable')
+    scan_data = pack_bits(codes[order], lengths[order])
+
+    sampling = (factor << 4) | factor
+    header = jpeg_headers(height, width, [luma_table, chroma_table],
+                          [(sampling, 0, 0), (0x11, 1, 1), (0x11, 1, 1)], huffman_tables)
+    return header + scan_data + b'\xff\xd9'                                    # EOI
+
+def encode_jpeg(image_array, quality=50, subsampling='4:2:0', optimize_huffman=False):
+    """
+    Nén ảnh bằng bộ mã hóa JPEG tự xây dựng: ảnh một kênh dùng encode_jpeg_grayscale,
+    ảnh màu (3 hoặc 4 kênh, RGB) dùng encode_jpeg_color.
+    Args:
+        quality (int): Chất lượng 1..100; 50 tương ứng với bảng lượng tử hóa chuẩn.
+        subsampling (str): Lấy mẫu màu, bỏ qua với ảnh grayscale.
+    Returns:
+        bytes: Nội dung file .jpg.
+    """
+    if image_array.ndim == 3 and image_array.shape[2] >= 3:
+        return encode_jpeg_color(image_array, quality, subsampling, optimize_huffman)
+    return encode_jpeg_grayscale(image_array, quality_tables(int(quality))[0], optimize_huffman)
+
+def save_jpeg_grayscale(image_array, output_path, optimize_huffman=False):
+    """
+    Nén ảnh grayscale bằng bộ mã hóa JPEG tự xây dựng và ghi ra file.
+    Returns:
+        int: Số byte đã ghi.
+    """
+    data = encode_jpeg_grayscale(image_array, optimize_huffman=optimize_huffman)
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+# Phiên bản xử lý từng khối (giữ lại để đối chiếu và benchmark)
+def jpeg_encode_decode_grayscale_blockwise(image_array):
+    """
+    Thực hiện nén và giải nén JPEG trên ảnh grayscale, xử lý lần lượt từng khối 8x8.
+    Kết quả giống hệt jpeg_encode_decode_grayscale nhưng chậm hơn nhiều.
     """
     # Bước 1: Chuyển đổi ảnh sang grayscale (nếu cần)
-    image_array = convert_to_grayscale(image_array)
+    image_array = to_uint8(convert_to_grayscale(image_array))
     height, width = image_array.shape
     
     # Bước 2: Chuyển dữ liệu từ [0, 255] sang [-128, 127]
@@ -226,4 +808,27 @@ def compress_jpeg_with_opencv(image_array, output_path, quality=50):
         return success
     except Exception as e:
         print(f"Error during JPEG compression: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def encode_jpeg_with_opencv(image_array, quality=50, subsampling=None):
+    """
+    Nén ảnh JPEG sử dụng OpenCV vào bộ nhớ (không ghi file).
+    Ảnh màu theo thứ tự RGB được đổi sang BGR của OpenCV; ảnh 16 bit được đổi về 8 bit theo tỷ lệ.
+    Args:
+        subsampling (str): '4:2:0' hoặc '4:4:4'; None để dùng mặc định của libjpeg.
+    Returns:
+        bytes: Nội dung file .jpg.
+    """
+    image_array = to_uint8(image_array)
+    if image_array.ndim == 3:
+        image_array = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if subsampling is not None:
+        if subsampling not in JPEG_SUBSAMPLING:
+            raise ValueError(f"Subsampling must be one of {', '.join(JPEG_SUBSAMPLING)}.")
+        factor = cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420 if subsampling == '4:2:0' else cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444
+        params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factor]
+    success, buffer = cv2.imencode('.jpg', image_array, params)
+    if not success:
+        raise RuntimeError("Failed to compress the image using OpenCV.")
+    return buffer.tobytes()
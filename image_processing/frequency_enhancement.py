@@ -1,129 +1,355 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
-def distance_matrix(shape):
+from image_processing.lazy import lazy_import
+
+scipy_fft = lazy_import('scipy.fft')
+
+def distance_matrix(shape, dtype=np.float64):
     """
     Tính ma trận khoảng cách từ tâm ảnh trong miền tần số.
     Args:
         shape (tuple): Kích thước ảnh (rows, cols).
+        dtype: Kiểu dữ liệu của kết quả.
     Returns:
         ndarray: Ma trận khoảng cách.
     """
     rows, cols = shape
     crow, ccol = rows // 2, cols // 2
-    u, v = np.meshgrid(range(cols), range(rows))
-    return np.sqrt((u - ccol) ** 2 + (v - crow) ** 2)
+    v = (np.arange(rows, dtype=dtype) - crow)[:, None]
+    u = (np.arange(cols, dtype=dtype) - ccol)[None, :]
+    # Chỉ cấp phát một ảnh: tổng bình phương (broadcast hai vector) rồi căn bậc hai tại chỗ
+    D = u ** 2 + v ** 2
+    return np.sqrt(D, out=D)
+
+def rfft_distance_matrix(shape, dtype=np.float32):
+    """
+    Ma trận khoảng cách tới tần số 0 cho phổ rfft2 (chưa fftshift, chỉ nửa trục cột).
+    Args:
+        shape (tuple): Kích thước ảnh (rows, cols).
+        dtype: Kiểu dữ liệu của kết quả.
+    Returns:
+        ndarray: Ma trận khoảng cách kích thước (rows, cols // 2 + 1).
+    """
+    rows, cols = shape
+    v = (np.fft.fftfreq(rows) * rows).astype(dtype)[:, None]
+    u = (np.fft.rfftfreq(cols) * cols).astype(dtype)[None, :]
+    D = u ** 2 + v ** 2
+    return np.sqrt(D, out=D)
+
+FILTER_TYPES = (
+    'ideal_low', 'gaussian_low', 'butterworth_low',
+    'ideal_high', 'gaussian_high', 'butterworth_high',
+)
+
+class ByteLimitedCache:
+    """
+    Cache LRU giới hạn theo tổng số byte của các giá trị (giá trị mới nhất luôn được giữ lại, kể cả khi
+    lớn hơn giới hạn). Dùng được từ nhiều luồng: danh sách LRU chỉ được đọc/sửa trong lock, còn giá trị
+    được tính ngoài lock để các luồng không phải chờ nhau.
+    """
+
+    def __init__(self, max_bytes, size):
+        """
+        Args:
+            max_bytes (int): Tổng số byte tối đa.
+            size (callable): size(value) -> số byte của một giá trị.
+        """
+        self.max_bytes = max_bytes
+        self.size = size
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, key, compute):
+        """
+        Lấy giá trị theo khóa, gọi compute() để tính mới nếu chưa có.
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return value
+            self.misses += 1
+
+        value = compute()
+        with self.lock:
+            # Luồng khác có thể đã tính xong cùng khóa trong lúc chờ: giữ bản đã có
+            existing = self.entries.get(key)
+            if existing is not None:
+                self.entries.move_to_end(key)
+                return existing
+            self.entries[key] = value
+            self.total_bytes += self.size(value)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= self.size(evicted)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+# Hàm truyền theo (shape, filter_type, radius, order, use_rfft); một hàm truyền float64 của ảnh 1024x1024 là 8 MiB
+TRANSFER_FUNCTIONS = ByteLimitedCache(256 * 1024 * 1024, size=lambda H: H.nbytes)
+
+def transfer_function(shape, filter_type, radius, order=None, use_rfft=False):
+    """
+    Hàm truyền H của bộ lọc, được lưu trong TRANSFER_FUNCTIONS (giới hạn theo số byte).
+    Mảng trả về chỉ đọc vì được dùng chung giữa các lần gọi.
+    Args:
+        shape (tuple): Kích thước ảnh (rows, cols).
+        filter_type (str): Một trong FILTER_TYPES.
+        radius (float): Bán kính cut-off.
+        order (int): Bậc của bộ lọc Butterworth (bỏ qua với các bộ lọc khác).
+        use_rfft (bool): True để tạo H cho phổ rfft2 (float32), False cho phổ fft2 đã fftshift (float64).
+    Returns:
+        ndarray: Hàm truyền H.
+    """
+    if filter_type not in FILTER_TYPES:
+        raise ValueError(f"Unsupported filter type: {filter_type}")
+    if filter_type.startswith('butterworth') and order is None:
+        raise ValueError("Butterworth filters require an order.")
+    shape = tuple(int(n) for n in shape)
+    key = (shape, filter_type, float(radius), order, bool(use_rfft))
+    return TRANSFER_FUNCTIONS.lookup(key, lambda: compute_transfer_function(shape, filter_type, radius, order, use_rfft))
+
+def compute_transfer_function(shape, filter_type, radius, order, use_rfft):
+    """
+    Tính hàm truyền H (không qua cache), xem transfer_function.
+    """
+    D = rfft_distance_matrix(shape) if use_rfft else distance_matrix(shape)
+    with np.errstate(divide='ignore', over='ignore'):
+        if filter_type == 'ideal_low':
+            H = (D <= radius).astype(D.dtype)
+        elif filter_type == 'ideal_high':
+            H = (D > radius).astype(D.dtype)
+        elif filter_type == 'gaussian_low':
+            H = np.exp(-(D ** 2) / (2 * (radius ** 2)))
+        elif filter_type == 'gaussian_high':
+            H = 1 - np.exp(-(D ** 2) / (2 * (radius ** 2)))
+        elif filter_type == 'butterworth_low':
+            H = 1 / (1 + (D / radius) ** (2 * order))
+        else:
+            H = 1 / (1 + (radius / D) ** (2 * order))
+    H = H.astype(D.dtype, copy=False)
+    H.setflags(write=False)
+    return H
+
+def preload_transfer_functions(shapes, radius=30.0, order=2):
+    """
+    Tính trước hàm truyền của mọi FILTER_TYPES (cả fft2 và rfft2) cho các kích thước ảnh thường gặp, với
+    bán kính và bậc mặc định của form, để các worker của server preforking dùng chung thay vì tự tính.
+    Args:
+        shapes (iterable): Các kích thước (rows, cols).
+    Returns:
+        int: Số byte của các hàm truyền.
+    Raises:
+        ValueError: Các hàm truyền vượt quá giới hạn byte của TRANSFER_FUNCTIONS.
+    """
+    shapes = [tuple(int(n) for n in shape) for shape in shapes]
+    # fft2: float64 (rows, cols); rfft2: float32 (rows, cols // 2 + 1)
+    required = len(FILTER_TYPES) * sum(rows * cols * 8 + rows * (cols // 2 + 1) * 4 for rows, cols in shapes)
+    if required > TRANSFER_FUNCTIONS.max_bytes:
+        raise ValueError(f"{required} bytes of transfer functions do not fit in the cache "
+                         f"({TRANSFER_FUNCTIONS.max_bytes} bytes).")
+    return sum(transfer_function(shape, filter_type, radius, order, use_rfft).nbytes
+               for shape in shapes for filter_type in FILTER_TYPES for use_rfft in (False, True))
+
+class Spectrum:
+    """
+    Phổ của một ảnh, tính một lần và dùng lại cho nhiều bộ lọc. Ảnh có thể có thêm các trục ở đầu
+    (ví dụ (C, H, W) cho ảnh màu): phổ được tính theo hai trục cuối cho mọi kênh trong một lần gọi.
+    - use_rfft=False: fft2 ở complex128 (giống các hàm lọc gốc). Phổ được giữ chưa fftshift; thay vào đó
+      hàm truyền (đã căn giữa) được ifftshift khi áp dụng, nên không cần thêm hai bản sao complex128 cho
+      fftshift/ifftshift mà kết quả vẫn giống hệt (cùng các cặp phần tử được nhân với nhau).
+    - use_rfft=True: rfft2 ở float32/complex64, chỉ giữ nửa phổ nên tốn khoảng 1/4 bộ nhớ.
+    """
+
+    def __init__(self, image, use_rfft=False):
+        self.shape = image.shape
+        self.use_rfft = use_rfft
+        if use_rfft:
+            self.data = scipy_fft.rfft2(np.asarray(image, dtype=np.float32))
+        else:
+            self.data = np.fft.fft2(image)
+        self.data.setflags(write=False)
+
+    def apply(self, H):
+        """
+        Nhân phổ với hàm truyền H và biến đổi ngược về miền không gian.
+        Args:
+            H (ndarray): Hàm truyền cùng kích thước với phổ (có thể có thêm trục đầu để lọc theo lô).
+        Returns:
+            ndarray: Biên độ ảnh sau lọc.
+        """
+        if self.use_rfft:
+            # irfft2 được ghi đè lên filtered, giá trị tuyệt đối tính tại chỗ trên kết quả float32
+            filtered = self.data * H
+            result = scipy_fft.irfft2(filtered, s=self.shape[-2:], axes=(-2, -1), overwrite_x=True)
+            return np.abs(result, out=result)
+        filtered = self.data * np.fft.ifftshift(H, axes=(-2, -1))
+        # Không dùng out= của np.fft (chỉ có từ NumPy 2.0, requirements.txt ghim NumPy 1.26)
+        return np.abs(np.fft.ifft2(filtered, axes=(-2, -1)))
 
-def ideal_low_pass_filter(image, radius):
+def fft_convolve(image, kernel, dtype=np.float64):
+    """
+    Tích chập tuyến tính đầy đủ (full) của ảnh với kernel theo hai trục đầu, qua rfft2.
+    Kích thước FFT được làm tròn lên kích thước nhanh (scipy_fft.next_fast_len) nên không bị tích chập vòng.
+    Args:
+        image (ndarray): Ảnh (H, W) hoặc (H, W, C); các kênh được biến đổi trong một lần gọi.
+        kernel (ndarray): Kernel 2D (kh, kw).
+        dtype: np.float64 (phổ complex128) hoặc np.float32 (phổ complex64, một nửa bộ nhớ).
+    Returns:
+        ndarray: Kết quả kiểu dtype kích thước (H + kh - 1, W + kw - 1[, C]).
+    """
+    full = (image.shape[0] + kernel.shape[0] - 1, image.shape[1] + kernel.shape[1] - 1)
+    shape = tuple(scipy_fft.next_fast_len(n, real=True) for n in full)
+    kernel = np.asarray(kernel, dtype=dtype).reshape(kernel.shape + (1,) * (image.ndim - 2))
+    spectrum = scipy_fft.rfft2(np.asarray(image, dtype=dtype), s=shape, axes=(0, 1))
+    spectrum *= scipy_fft.rfft2(kernel, s=shape, axes=(0, 1))
+    return scipy_fft.irfft2(spectrum, s=shape, axes=(0, 1), overwrite_x=True)[:full[0], :full[1]]
+
+def image_digest(image):
+    """
+    Mã băm nội dung ảnh (gồm cả kích thước và kiểu dữ liệu), dùng làm khóa cache.
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(image.data, digest_size=16)
+    digest.update(str((image.shape, image.dtype.str)).encode())
+    return digest.hexdigest()
+
+
+class SpectrumCache(ByteLimitedCache):
+    """
+    Cache LRU các đối tượng Spectrum theo mã băm nội dung ảnh, để khi quét nhiều bán kính/bậc
+    trên cùng một ảnh chỉ cần một lần FFT thuận. Giới hạn theo tổng số byte của các phổ.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        super().__init__(max_bytes, size=lambda spectrum: spectrum.data.nbytes)
+
+    def get(self, image, use_rfft=False):
+        """
+        Lấy phổ của ảnh từ cache, tính mới nếu chưa có.
+        """
+        return self.lookup((image_digest(image), use_rfft), lambda: Spectrum(image, use_rfft=use_rfft))
+
+SPECTRUM_CACHE = SpectrumCache()
+
+def frequency_filter(image, filter_type, radius, order=None, use_rfft=False):
+    """
+    Lọc ảnh trong miền tần số, dùng lại phổ và hàm truyền đã lưu trong cache.
+    Args:
+        image (ndarray): Ảnh đầu vào (H, W), hoặc (C, H, W) để lọc mọi kênh cùng lúc.
+        filter_type (str): Một trong FILTER_TYPES.
+        radius (float): Bán kính cut-off.
+        order (int): Bậc của bộ lọc Butterworth.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
+    Returns:
+        ndarray: Ảnh đã xử lý.
+    """
+    spectrum = SPECTRUM_CACHE.get(image, use_rfft=use_rfft)
+    H = transfer_function(tuple(image.shape[-2:]), filter_type, radius, order, use_rfft)
+    return spectrum.apply(H)
+
+def frequency_filter_batch(image, filter_type, radii, order=None, use_rfft=False):
+    """
+    Lọc ảnh với nhiều bán kính cut-off cùng lúc: một lần FFT thuận, các hàm truyền H được
+    xếp chồng và nhân với phổ trong một phép broadcast, rồi biến đổi ngược cả chồng.
+    Args:
+        image (ndarray): Ảnh đầu vào (H, W), hoặc (C, H, W) để lọc mọi kênh cùng lúc.
+        filter_type (str): Một trong FILTER_TYPES.
+        radii (list): Danh sách bán kính cut-off.
+        order (int): Bậc của bộ lọc Butterworth.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
+    Returns:
+        ndarray: Chồng ảnh kết quả kích thước (len(radii), rows, cols) (hoặc (len(radii), C, rows, cols)).
+    """
+    spectrum = SPECTRUM_CACHE.get(image, use_rfft=use_rfft)
+    H = np.stack([transfer_function(tuple(image.shape[-2:]), filter_type, radius, order, use_rfft) for radius in radii])
+    # Thêm trục kênh để mỗi hàm truyền được nhân với mọi kênh
+    return spectrum.apply(H.reshape(H.shape[:1] + (1,) * (image.ndim - 2) + H.shape[1:]))
+
+def ideal_low_pass_filter(image, radius, use_rfft=False):
     """
     Bộ lọc thông thấp lý tưởng (Ideal Low-Pass Filter).
     Args:
         image (ndarray): Ảnh đầu vào.
         radius (int): Bán kính cut-off.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
     Returns:
         ndarray: Ảnh đã xử lý.
     """
-    fft_image = np.fft.fft2(image)
-    fft_shift = np.fft.fftshift(fft_image)
-
-    D = distance_matrix(image.shape)
-    H = (D <= radius).astype(np.float32)
-
-    filtered_fft = fft_shift * H
-    filtered_image = np.fft.ifft2(np.fft.ifftshift(filtered_fft))
-    return np.abs(filtered_image)
+    return frequency_filter(image, 'ideal_low', radius, use_rfft=use_rfft)
 
-def gaussian_low_pass_filter(image, radius):
+def gaussian_low_pass_filter(image, radius, use_rfft=False):
     """
     Bộ lọc thông thấp Gaussian.
     Args:
         image (ndarray): Ảnh đầu vào.
         radius (int): Bán kính cut-off.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
     Returns:
         ndarray: Ảnh đã xử lý.
     """
-    fft_image = np.fft.fft2(image)
-    fft_shift = np.fft.fftshift(fft_image)
+    return frequency_filter(image, 'gaussian_low', radius, use_rfft=use_rfft)
 
-    D = distance_matrix(image.shape)
-    H = np.exp(-(D ** 2) / (2 * (radius ** 2)))
-
-    filtered_fft = fft_shift * H
-    filtered_image = np.fft.ifft2(np.fft.ifftshift(filtered_fft))
-    return np.abs(filtered_image)
-
-def butterworth_low_pass_filter(image, radius, order):
+def butterworth_low_pass_filter(image, radius, order, use_rfft=False):
     """
     Bộ lọc thông thấp Butterworth.
     Args:
         image (ndarray): Ảnh đầu vào.
         radius (int): Bán kính cut-off.
         order (int): Bậc của bộ lọc.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
     Returns:
         ndarray: Ảnh đã xử lý.
     """
-    fft_image = np.fft.fft2(image)
-    fft_shift = np.fft.fftshift(fft_image)
-
-    D = distance_matrix(image.shape)
-    H = 1 / (1 + (D / radius) ** (2 * order))
+    return frequency_filter(image, 'butterworth_low', radius, order, use_rfft=use_rfft)
 
-    filtered_fft = fft_shift * H
-    filtered_image = np.fft.ifft2(np.fft.ifftshift(filtered_fft))
-    return np.abs(filtered_image)
-def ideal_high_pass_filter(image, radius):
+def ideal_high_pass_filter(image, radius, use_rfft=False):
     """
     Bộ lọc thông cao lý tưởng (Ideal High-Pass Filter).
     Args:
         image (ndarray): Ảnh đầu vào.
         radius (int): Bán kính cut-off.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
     Returns:
         ndarray: Ảnh đã xử lý.
     """
-    fft_image = np.fft.fft2(image)
-    fft_shift = np.fft.fftshift(fft_image)
-
-    D = distance_matrix(image.shape)
-    H = (D > radius).astype(np.float32)
-
-    filtered_fft = fft_shift * H
-    filtered_image = np.fft.ifft2(np.fft.ifftshift(filtered_fft))
-    return np.abs(filtered_image)
+    return frequency_filter(image, 'ideal_high', radius, use_rfft=use_rfft)
 
-def gaussian_high_pass_filter(image, radius):
+def gaussian_high_pass_filter(image, radius, use_rfft=False):
     """
     Bộ lọc thông cao Gaussian.
     Args:
         image (ndarray): Ảnh đầu vào.
         radius (int): Bán kính cut-off.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
     Returns:
         ndarray: Ảnh đã xử lý.
     """
-    fft_image = np.fft.fft2(image)
-    fft_shift = np.fft.fftshift(fft_image)
+    return frequency_filter(image, 'gaussian_high', radius, use_rfft=use_rfft)
 
-    D = distance_matrix(image.shape)
-    H = 1 - np.exp(-(D ** 2) / (2 * (radius ** 2)))
-
-    filtered_fft = fft_shift * H
-    filtered_image = np.fft.ifft2(np.fft.ifftshift(filtered_fft))
-    return np.abs(filtered_image)
-
-def butterworth_high_pass_filter(image, radius, order):
+def butterworth_high_pass_filter(image, radius, order, use_rfft=False):
     """
     Bộ lọc thông cao Butterworth.
     Args:
         image (ndarray): Ảnh đầu vào.
         radius (int): Bán kính cut-off.
         order (int): Bậc của bộ lọc.
+        use_rfft (bool): True để dùng đường rfft2 float32 (tiết kiệm bộ nhớ).
     Returns:
         ndarray: Ảnh đã xử lý.
     """
-    fft_image = np.fft.fft2(image)
-    fft_shift = np.fft.fftshift(fft_image)
-
-    D = distance_matrix(image.shape)
-    H = 1 / (1 + (radius / D) ** (2 * order))
-
-    filtered_fft = fft_shift * H
-    filtered_image = np.fft.ifft2(np.fft.ifftshift(filtered_fft))
-    return np.abs(filtered_image)
+    return frequency_filter(image, 'butterworth_high', radius, order, use_rfft=use_rfft)
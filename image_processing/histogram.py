@@ -1,45 +1,116 @@
 import numpy as np
-import cv2
-def histogram_equalization(image):
+from image_processing.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+class Histogram:
+    """
+    Histogram của ảnh grayscale (256 bin với uint8, 65536 bin với uint16), dùng chung giữa
+    cân bằng histogram và Otsu. Sau khi ánh xạ ảnh qua một LUT, histogram của ảnh mới được
+    suy ra bằng remap(lut) mà không cần duyệt lại các pixel.
+    """
+
+    def __init__(self, counts):
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.total = int(self.counts.sum())
+        self._cdf = None
+
+    @classmethod
+    def from_image(cls, image):
+        """
+        Tính histogram của ảnh uint8 hoặc uint16 bằng np.bincount.
+        """
+        if image.dtype not in (np.uint8, np.uint16):
+            raise ValueError("Histogram only supports uint8 and uint16 images.")
+        return cls(np.bincount(image.ravel(), minlength=np.iinfo(image.dtype).max + 1))
+
+    @property
+    def levels(self):
+        """
+        Số mức sáng (256 hoặc 65536).
+        """
+        return len(self.counts)
+
+    @property
+    def dtype(self):
+        """
+        Kiểu dữ liệu của ảnh và của các LUT tương ứng.
+        """
+        return np.uint8 if self.levels <= 256 else np.uint16
+
+    @property
+    def cdf(self):
+        """
+        Hàm phân phối tích lũy (số pixel có giá trị <= i).
+        """
+        if self._cdf is None:
+            self._cdf = np.cumsum(self.counts)
+        return self._cdf
+
+    def remap(self, lut):
+        """
+        Histogram của ảnh sau khi ánh xạ qua LUT (levels phần tử).
+        """
+        return Histogram(np.bincount(np.asarray(lut, dtype=np.intp), weights=self.counts, minlength=self.levels).astype(np.int64))
+
+def apply_lut(image, lut, out=None):
+    """
+    Ánh xạ từng pixel của ảnh qua bảng tra cứu (LUT) 256 phần tử (uint8) hoặc 65536 phần tử (uint16).
+    """
+    return np.take(lut, image, out=out)
+
+def map_channels(image, lut_function, out=None):
+    """
+    Áp dụng một LUT tính từ histogram riêng của từng kênh lên ảnh nhiều kênh (H, W, C).
+    Mỗi kênh được đọc và ghi qua view của ảnh, không tách ra thành các ảnh riêng.
+    :param image: Ảnh (H, W, C) uint8 hoặc uint16.
+    :param lut_function: lut_function(histogram) -> LUT.
+    :param out: Mảng nhận kết quả (tùy chọn), có thể chính là image.
+    :return: Ảnh kết quả.
+    """
+    if out is None:
+        out = np.empty_like(image)
+    for channel in range(image.shape[2]):
+        lut = lut_function(Histogram.from_image(image[..., channel]))
+        out[..., channel] = np.take(lut, image[..., channel])
+    return out
+
+def equalization_lut(histogram):
+    """
+    Bảng tra cứu cân bằng histogram: (cdf - cdf_min) / (total - cdf_min) * (levels - 1).
+    :param histogram: Đối tượng Histogram.
+    :return: LUT uint8 256 phần tử (uint16 65536 phần tử với histogram của ảnh 16 bit).
+    """
+    cdf = histogram.cdf
+    cdf_min = cdf[np.argmax(cdf > 0)]
+    maximum = histogram.levels - 1
+    if histogram.total == cdf_min:
+        # Ảnh chỉ có một mức xám: giữ nguyên ảnh
+        return np.arange(histogram.levels, dtype=histogram.dtype)
+    cdf_normalized = (cdf - cdf_min) / (histogram.total - cdf_min) * maximum
+    # Các mức nhỏ hơn mức xám nhỏ nhất không xuất hiện trong ảnh, chỉ cần tránh giá trị âm
+    return np.clip(cdf_normalized, 0, maximum).astype(histogram.dtype)
+
+def histogram_equalization(image, histogram=None, out=None):
     """
     Hàm cân bằng histogram cho ảnh grayscale.
-    :param image: Mảng numpy 2D đại diện cho ảnh grayscale.
+    :param image: Mảng numpy 2D đại diện cho ảnh grayscale (uint8 hoặc uint16), hoặc ảnh (H, W, C)
+        (mỗi kênh được cân bằng theo histogram riêng).
+    :param histogram: Histogram của ảnh 2D nếu đã tính trước (tùy chọn).
+    :param out: Mảng nhận kết quả (tùy chọn), có thể chính là image.
     :return: Ảnh sau khi cân bằng histogram.
+
+    Để chạy tiếp Otsu trên ảnh đã cân bằng mà không tính lại histogram:
+        histogram = Histogram.from_image(image)
+        lut = equalization_lut(histogram)
+        equalized = apply_lut(image, lut)
+        binary = otsu_thresholding(equalized, histogram=histogram.remap(lut))
     """
-    total_pixels = image.size
-    # Bước 1: Tính histogram
-    hist = [0] * 256 
-    for pixel_value in image.flatten(): 
-        hist[pixel_value] += 1 
-
-    # Bước 2: Tính hàm phân phối tích lũy (CDF)
-    cdf = []  
-    cumulative_sum = 0  
-    for frequency in hist:
-        cumulative_sum += frequency 
-        cdf.append(cumulative_sum)  
-
-    # Bước 3: Tìm giá trị CDF nhỏ nhất(cdf_min)
-    cdf_min = None
-    for value in cdf:
-        if value > 0:
-            cdf_min = value  
-            break
-
-    # Bước 4: Chuẩn hóa CDF
-    cdf_normalized = []
-    for value in cdf:
-        normalized_value = (value - cdf_min) / (total_pixels - cdf_min) * 255
-        cdf_normalized.append(normalized_value)
-
-    # Bước 5: Ánh xạ giá trị pixel theo CDF đã chuẩn hóa
-    equalized_image = [] 
-    for pixel_value in image.flatten():
-        new_pixel_value = cdf_normalized[pixel_value]
-        equalized_image.append(new_pixel_value)
-    equalized_image = np.array(equalized_image).reshape(image.shape).astype(np.uint8)
-
-    return equalized_image
+    if image.ndim == 3:
+        return map_channels(image, equalization_lut, out=out)
+    if histogram is None:
+        histogram = Histogram.from_image(image)
+    return apply_lut(image, equalization_lut(histogram), out=out)
 
 def histogram_equalization_opencv(image):
     """
@@ -0,0 +1,91 @@
+import importlib
+import sys
+import time
+
+# Thời gian (giây) của các lần import trễ: tên module -> số giây ở lần dùng đầu tiên
+IMPORT_SECONDS = {}
+# Tên các module được import trễ (LazyModule, LazyFunction), xem import_deferred
+DEFERRED_MODULES = set()
+
+def import_module(name):
+    """
+    Import module theo tên và ghi lại thời gian vào IMPORT_SECONDS nếu đây là lần import đầu tiên trong tiến trình.
+    """
+    # Luôn đi qua importlib: một module có trong sys.modules vẫn có thể đang được luồng khác khởi tạo dở,
+    # importlib chờ luồng đó import xong thay vì trả về module chưa đủ thuộc tính
+    first = name not in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if first:
+        IMPORT_SECONDS.setdefault(name, time.perf_counter() - start)
+    return module
+
+class LazyModule:
+    """
+    Module được import ở lần truy cập thuộc tính đầu tiên (cv2.imdecode, scipy.fft.rfft2, Image.open, ...).
+    Các thư viện nặng (OpenCV, SciPy, PIL) chiếm phần lớn thời gian import server; phần lớn request chỉ
+    dùng một phương pháp nên chúng được nạp khi cần, hoặc trước khi nhận request bằng processing.warm_up.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        DEFERRED_MODULES.add(name)
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+def lazy_import(name):
+    """
+    Thay cho `import name`: trả về module nếu đã được import, ngược lại là một LazyModule.
+    """
+    if name in sys.modules:
+        DEFERRED_MODULES.add(name)
+        return sys.modules[name]
+    return LazyModule(name)
+
+def import_deferred():
+    """
+    Import ngay mọi module đang được import trễ, ví dụ trong tiến trình master của server preforking
+    để các worker dùng chung (copy-on-write) thay vì mỗi worker tự import.
+    Returns:
+        list: Tên các module.
+    """
+    # Module vừa import có thể khai báo thêm module import trễ (compress -> scipy.fftpack)
+    names = set()
+    while DEFERRED_MODULES - names:
+        for name in sorted(DEFERRED_MODULES - names):
+            import_module(name)
+            names.add(name)
+    return sorted(names)
+
+class LazyFunction:
+    """
+    Hàm module.name, module chỉ được import ở lần gọi đầu tiên. Chỉ giữ tên nên gửi được sang tiến trình
+    worker (pickle) như một hàm cấp module.
+    """
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        DEFERRED_MODULES.add(module)
+
+    def resolve(self):
+        return getattr(import_module(self.module), self.name)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<lazy function {self.module}.{self.name}>"
@@ -1,9 +1,253 @@
 import numpy as np
-import cv2
+from image_processing.lazy import lazy_import
 
-def dilation(image, kernel_size=3):
+cv2 = lazy_import('cv2')
+
+# ---------------------------------------------------------------------------
+# Engine van Herk/Gil-Werman: max/min trên cửa sổ trượt với khoảng 3 phép so sánh
+# mỗi pixel, không phụ thuộc kích thước kernel. Kernel chữ nhật được tách thành hai
+# lượt 1D; kernel bất kỳ được phân rã thành hợp của các hình chữ nhật.
+# ---------------------------------------------------------------------------
+
+def neutral_value(dtype, maximum):
+    """
+    Giá trị trung hòa của phép max (giá trị nhỏ nhất của kiểu) hoặc min (giá trị lớn nhất).
+    """
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+    else:
+        info = np.finfo(dtype)
+    return info.min if maximum else info.max
+
+def sliding_extreme_1d(array, window, axis, maximum=True, out=None):
+    """
+    Tính max (hoặc min) trên mọi cửa sổ gồm window phần tử liên tiếp theo trục axis
+    bằng thuật toán van Herk/Gil-Werman (chỉ lấy các cửa sổ nằm trọn trong mảng).
+
+    :param array: Mảng đầu vào (2D, hoặc có thêm trục kênh ở cuối).
+    :param window: Độ dài cửa sổ.
+    :param axis: Trục trượt (0 hoặc 1).
+    :param maximum: True để lấy max (dilation), False để lấy min (erosion).
+    :param out: Mảng nhận kết quả (tùy chọn).
+    :return: Mảng có kích thước theo trục axis là n - window + 1.
+    """
+    op = np.maximum if maximum else np.minimum
+    length = array.shape[axis]
+    output_length = length - window + 1
+    if window == 1:
+        if out is None:
+            return array.copy()
+        np.copyto(out, array)
+        return out
+
+    # Chia trục thành các khối độ dài window (phần dư điền giá trị trung hòa)
+    num_blocks = -(-length // window)
+    shape = list(array.shape)
+    shape[axis] = num_blocks * window
+    blocks = np.full(shape, neutral_value(array.dtype, maximum), dtype=array.dtype)
+    blocks[(slice(None),) * axis + (slice(0, length),)] = array
+    block_shape = shape[:axis] + [num_blocks, window] + shape[axis + 1:]
+    blocks = blocks.reshape(block_shape)
+
+    # g: tích lũy xuôi trong mỗi khối, h: tích lũy ngược trong mỗi khối
+    forward = op.accumulate(blocks, axis=axis + 1)
+    backward = np.empty_like(blocks)
+    op.accumulate(np.flip(blocks, axis + 1), axis=axis + 1, out=np.flip(backward, axis + 1))
+    forward = forward.reshape(shape)
+    backward = backward.reshape(shape)
+
+    # Cửa sổ [i, i + window) = h[i] ∪ g[i + window - 1]
+    head = (slice(None),) * axis
+    return op(backward[head + (slice(0, output_length),)],
+              forward[head + (slice(window - 1, window - 1 + output_length),)], out=out)
+
+def kernel_rectangles(kernel):
+    """
+    Phân rã phần tử cấu trúc (mảng 0/1) thành hợp của các hình chữ nhật.
+    Mỗi đoạn liên tiếp các số 1 trên một hàng được kéo dài xuống dưới
+    chừng nào các hàng bên dưới vẫn toàn 1 trên đoạn đó.
+
+    :param kernel: Phần tử cấu trúc 2D.
+    :return: Danh sách (top, left, height, width) theo tọa độ trong kernel.
+    """
+    mask = np.asarray(kernel) != 0
+    if not mask.any():
+        raise ValueError("Structuring element must contain at least one non-zero entry.")
+    covered = np.zeros_like(mask)
+    rectangles = []
+    for top in range(mask.shape[0]):
+        row = np.concatenate(([False], mask[top], [False]))
+        changes = np.flatnonzero(row[1:] != row[:-1])
+        for left, right in zip(changes[::2], changes[1::2]):
+            if covered[top, left:right].all():
+                continue
+            bottom = top + 1
+            while bottom < mask.shape[0] and mask[bottom, left:right].all():
+                bottom += 1
+            covered[top:bottom, left:right] = True
+            rectangles.append((top, left, bottom - top, right - left))
+    return rectangles
+
+def structuring_element(kernel, kernel_size):
+    """
+    Trả về phần tử cấu trúc: kernel nếu được cung cấp, ngược lại kernel hình chữ nhật
+    kích thước kernel_size x kernel_size.
+    """
+    if kernel is None:
+        kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    return np.asarray(kernel)
+
+def pad_for_kernel(image, kernel_shape, fill=0):
+    """
+    Tạo ảnh đã padding cho kernel (padding bằng fill, mặc định 0 như các hàm dilation/erosion).
+    Chỉ padding theo hai trục không gian; trục kênh của ảnh (H, W, C) được giữ nguyên.
+    """
+    pad_height, pad_width = kernel_shape[0] // 2, kernel_shape[1] // 2
+    height, width = image.shape[:2]
+    padded = np.full((height + 2 * pad_height, width + 2 * pad_width) + image.shape[2:], fill, dtype=image.dtype)
+    padded[pad_height:pad_height + height, pad_width:pad_width + width] = image
+    return padded
+
+def morphology_pass(padded_image, kernel, output_shape, maximum, out=None):
+    """
+    Một lượt dilation (maximum=True) hoặc erosion (maximum=False) trên ảnh đã padding.
+
+    :param padded_image: Ảnh đã padding theo pad_for_kernel.
+    :param kernel: Phần tử cấu trúc 2D.
+    :param output_shape: Kích thước ảnh kết quả (height, width) hoặc (height, width, channels).
+    :param maximum: True cho dilation, False cho erosion.
+    :param out: Mảng nhận kết quả (tùy chọn), có thể là view bên trong một ảnh đã padding khác.
+    :return: Ảnh kết quả.
+    """
+    height, width = output_shape[:2]
+    op = np.maximum if maximum else np.minimum
+    if out is None:
+        out = np.empty(output_shape, dtype=padded_image.dtype)
+
+    for index, (top, left, rect_height, rect_width) in enumerate(kernel_rectangles(kernel)):
+        # Chỉ lấy phần ảnh mà hình chữ nhật này chạm tới
+        region = padded_image[top:top + height + rect_height - 1, left:left + width + rect_width - 1]
+        columns = sliding_extreme_1d(region, rect_height, axis=0, maximum=maximum)
+        if index == 0:
+            sliding_extreme_1d(columns, rect_width, axis=1, maximum=maximum, out=out)
+        else:
+            op(out, sliding_extreme_1d(columns, rect_width, axis=1, maximum=maximum), out=out)
+    return out
+
+def dilation(image, kernel_size=3, kernel=None, out=None):
+    """
+    Thực hiện phép dilation trên ảnh grayscale hoặc nhị phân (engine van Herk/Gil-Werman).
+    Kết quả giống dilation_loop (padding bằng 0). Ảnh (H, W, C) được xử lý mọi kênh trong cùng một lượt.
+
+    :param image: Ảnh đầu vào (grayscale hoặc nhị phân, 2D hoặc (H, W, C)).
+    :param kernel_size: Kích thước kernel (mặc định là 3x3).
+    :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
+    :param out: Mảng nhận kết quả (tùy chọn); có thể chính là image vì ảnh vào được sao chép sang ảnh padding trước.
+    :return: Ảnh sau khi áp dụng dilation.
+    """
+    kernel = structuring_element(kernel, kernel_size)
+    return morphology_pass(pad_for_kernel(image, kernel.shape), kernel, image.shape, maximum=True, out=out)
+
+def erosion(image, kernel=None, kernel_size=3, out=None):
+    """
+    Thực hiện phép erosion trên ảnh grayscale hoặc nhị phân (engine van Herk/Gil-Werman).
+    Kết quả giống erosion_loop (padding bằng 0). Ảnh (H, W, C) được xử lý mọi kênh trong cùng một lượt.
+
+    :param image: Ảnh đầu vào (grayscale hoặc nhị phân, 2D hoặc (H, W, C)).
+    :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
+    :param kernel_size: Kích thước kernel mặc định nếu kernel không được cung cấp.
+    :param out: Mảng nhận kết quả (tùy chọn); có thể chính là image vì ảnh vào được sao chép sang ảnh padding trước.
+    :return: Ảnh sau khi áp dụng erosion.
+    """
+    kernel = structuring_element(kernel, kernel_size)
+    return morphology_pass(pad_for_kernel(image, kernel.shape), kernel, image.shape, maximum=False, out=out)
+
+def chained_passes(image, kernel, first_maximum):
+    """
+    Hai lượt liên tiếp (erosion rồi dilation hoặc ngược lại). Lượt đầu ghi thẳng vào phần
+    bên trong của ảnh đã padding dùng cho lượt sau, nên không cần tạo thêm ảnh trung gian.
+    """
+    padded = pad_for_kernel(image, kernel.shape)
+    second_input = np.zeros_like(padded)
+    pad_height, pad_width = kernel.shape[0] // 2, kernel.shape[1] // 2
+    height, width = image.shape[:2]
+    interior = second_input[pad_height:pad_height + height, pad_width:pad_width + width]
+    morphology_pass(padded, kernel, image.shape, maximum=first_maximum, out=interior)
+    # Lượt sau chỉ đọc second_input, nên bộ nhớ của padded được tái sử dụng làm ảnh kết quả (liên tục)
+    output = padded.reshape(-1)[:image.size].reshape(image.shape)
+    morphology_pass(second_input, kernel, image.shape, maximum=not first_maximum, out=output)
+    return output
+
+def opening(image, kernel=None, kernel_size=3):
+    """
+    Phép mở (opening): erosion rồi dilation với cùng phần tử cấu trúc.
+
+    :param image: Ảnh đầu vào (grayscale hoặc nhị phân).
+    :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
+    :param kernel_size: Kích thước kernel mặc định nếu kernel không được cung cấp.
+    :return: Ảnh sau khi áp dụng opening.
+    """
+    return chained_passes(image, structuring_element(kernel, kernel_size), first_maximum=False)
+
+def closing(image, kernel=None, kernel_size=3):
+    """
+    Phép đóng (closing): dilation rồi erosion với cùng phần tử cấu trúc.
+
+    :param image: Ảnh đầu vào (grayscale hoặc nhị phân).
+    :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
+    :param kernel_size: Kích thước kernel mặc định nếu kernel không được cung cấp.
+    :return: Ảnh sau khi áp dụng closing.
+    """
+    return chained_passes(image, structuring_element(kernel, kernel_size), first_maximum=True)
+
+def morphological_gradient(image, kernel=None, kernel_size=3):
+    """
+    Gradient hình thái học: dilation - erosion. Hai lượt dùng chung một ảnh đã padding
+    và phép trừ được thực hiện tại chỗ trên kết quả dilation.
+
+    :param image: Ảnh đầu vào (grayscale hoặc nhị phân).
+    :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
+    :param kernel_size: Kích thước kernel mặc định nếu kernel không được cung cấp.
+    :return: Ảnh gradient.
+    """
+    kernel = structuring_element(kernel, kernel_size)
+    padded = pad_for_kernel(image, kernel.shape)
+    output = morphology_pass(padded, kernel, image.shape, maximum=True)
+    eroded = morphology_pass(padded, kernel, image.shape, maximum=False)
+    # Bão hòa tại 0 phòng trường hợp kernel không chứa tâm
+    np.minimum(eroded, output, out=eroded)
+    return np.subtract(output, eroded, out=output)
+
+def top_hat(image, kernel=None, kernel_size=3):
+    """
+    White top-hat: ảnh gốc - opening, giữ lại các chi tiết sáng nhỏ hơn phần tử cấu trúc.
+
+    :param image: Ảnh đầu vào (grayscale hoặc nhị phân).
+    :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
+    :param kernel_size: Kích thước kernel mặc định nếu kernel không được cung cấp.
+    :return: Ảnh top-hat.
+    """
+    opened = opening(image, kernel, kernel_size)
+    np.minimum(opened, image, out=opened)
+    return np.subtract(image, opened, out=opened)
+
+def black_hat(image, kernel=None, kernel_size=3):
+    """
+    Black top-hat: closing - ảnh gốc, giữ lại các chi tiết tối nhỏ hơn phần tử cấu trúc.
+
+    :param image: Ảnh đầu vào (grayscale hoặc nhị phân).
+    :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
+    :param kernel_size: Kích thước kernel mặc định nếu kernel không được cung cấp.
+    :return: Ảnh black-hat.
+    """
+    closed = closing(image, kernel, kernel_size)
+    np.maximum(closed, image, out=closed)
+    return np.subtract(closed, image, out=closed)
+
+def dilation_loop(image, kernel_size=3):
     """
-    Thực hiện phép dilation trên ảnh grayscale hoặc nhị phân.
+    Thực hiện phép dilation trên ảnh grayscale hoặc nhị phân bằng vòng lặp qua từng pixel
+    (phiên bản gốc, giữ lại để đối chiếu và benchmark).
     
     :param image: Ảnh đầu vào (grayscale hoặc nhị phân).
     :param kernel_size: Kích thước kernel (mặc định là 3x3).
@@ -52,9 +296,10 @@ def dilation_opencv(image, kernel_size=3):
     
     return dilated_image
 
-def erosion(image, kernel=None, kernel_size=3):
+def erosion_loop(image, kernel=None, kernel_size=3):
     """
-    Thực hiện phép erosion trên ảnh grayscale hoặc nhị phân.
+    Thực hiện phép erosion trên ảnh grayscale hoặc nhị phân bằng vòng lặp qua từng pixel
+    (phiên bản gốc, giữ lại để đối chiếu và benchmark).
     
     :param image: Ảnh đầu vào (grayscale hoặc nhị phân).
     :param kernel: Phần tử cấu trúc (kernel). Nếu None, sử dụng kernel hình chữ nhật kích thước kernel_size x kernel_size.
@@ -0,0 +1,154 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from image_processing.lazy import LazyFunction, lazy_import
+from image_processing.registry import OPERATORS
+
+# processing.run_method import module này: các module của từng phương pháp chỉ được import khi cần
+tiling = lazy_import('image_processing.tiling')
+jpeg_encode_decode_grayscale = LazyFunction('image_processing.compress', 'jpeg_encode_decode_grayscale')
+laplacian_response = LazyFunction('image_processing.spatial_enhancement', 'laplacian_response')
+normalize_laplacian = LazyFunction('image_processing.spatial_enhancement', 'normalize_laplacian')
+
+# Các toán tử chạy song song theo dải hàng: tên -> (hàm nhận kernel_size, số lượt kernel), lấy từ registry.
+# Halo của mỗi dải = số lượt * (kernel_size // 2), giống tiling.TILEABLE_OPERATORS.
+# Dùng Operator.function (hàm cấp module, không phải lambda) để gửi được sang tiến trình worker.
+KERNEL_OPERATORS = {name: (operator.function, operator.passes) for name, operator in OPERATORS.items()
+                    if operator.passes and operator.output == 'image'}
+
+PARALLEL_METHODS = sorted(KERNEL_OPERATORS) + ['laplacian_filter', 'jpeg_encode_decode_grayscale']
+
+def band_operator(method, kernel_size=3):
+    """
+    Toán tử áp dụng cho từng dải của một phương pháp.
+    Returns:
+        tuple: (operator, halo, row_multiple, output_dtype); output_dtype None nghĩa là giữ dtype ảnh vào.
+    """
+    if method in KERNEL_OPERATORS:
+        function, passes = KERNEL_OPERATORS[method]
+        return partial(function, kernel_size=kernel_size), passes * (kernel_size // 2), 1, None
+    if method == 'laplacian_filter':
+        # Đáp ứng Laplacian tính theo dải; chuẩn hóa min/max là bước toàn cục làm sau khi ghép
+        return laplacian_response, 1, 1, np.float32
+    if method == 'jpeg_encode_decode_grayscale':
+        # Các khối 8x8 độc lập: dải bắt đầu ở bội số của 8 thì không cần halo
+        return jpeg_encode_decode_grayscale, 0, 8, None
+    raise ValueError(f"Method '{method}' cannot be run in parallel bands.")
+
+def band_height_for(height, workers, halo, row_multiple=1):
+    """
+    Chiều cao dải: chia đều cho các worker, nhưng không nhỏ hơn 4 lần halo
+    (để phần tính lặp lại ở vùng chồng lấn không lấn át phần việc có ích).
+    """
+    band_height = max(math.ceil(height / workers), 4 * halo, 1)
+    return math.ceil(band_height / row_multiple) * row_multiple
+
+def run_band_shared(input_spec, output_spec, operator, halo, bounds):
+    """
+    Hàm chạy trong tiến trình worker: gắn vào vùng shared memory của ảnh vào/ra và xử lý một dải.
+    Args:
+        input_spec, output_spec (tuple): (tên shared memory, shape, dtype).
+    """
+    input_memory = shared_memory.SharedMemory(name=input_spec[0])
+    output_memory = shared_memory.SharedMemory(name=output_spec[0])
+    try:
+        source = np.ndarray(input_spec[1], dtype=input_spec[2], buffer=input_memory.buf)
+        out = np.ndarray(output_spec[1], dtype=output_spec[2], buffer=output_memory.buf)
+        tiling.process_tile(source, operator, halo, out, bounds)
+        del source, out  # Bỏ các view trước khi đóng vùng nhớ
+    finally:
+        input_memory.close()
+        output_memory.close()
+
+def process_bands(image, operator, halo, out, workers=None, backend='thread', row_multiple=1, executor=None):
+    """
+    Chạy một toán tử cục bộ song song trên các dải hàng có halo và ghi kết quả thẳng vào out.
+    Args:
+        image (ndarray): Ảnh 2D.
+        operator (callable): Hàm nhận một dải ndarray và trả về kết quả cùng kích thước.
+        halo (int): Số hàng chồng lấn, tối thiểu bằng bán kính kernel.
+        out (ndarray): Mảng đích cùng kích thước với image.
+        workers (int): Số worker, mặc định bằng số lõi CPU.
+        backend (str): 'thread' cho các toán tử NumPy nhả GIL (không sao chép, các dải ghi trực tiếp
+            vào out), 'process' cho các toán tử giữ GIL (vòng lặp Python); ảnh vào/ra được đặt trong
+            shared memory nên mỗi chiều chỉ sao chép một lần, không gửi dữ liệu ảnh qua pipe.
+        row_multiple (int): Dải bắt đầu ở bội số của giá trị này (ví dụ 8 cho khối JPEG).
+        executor (Executor): Pool dùng lại giữa các lần gọi; None để tạo pool tạm.
+    Returns:
+        out
+    """
+    workers = workers or os.cpu_count() or 1
+    height = image.shape[0]
+    bands = list(tiling.iter_tiles(image.shape, band_height_for(height, workers, halo, row_multiple)))
+
+    if workers == 1 or len(bands) == 1:
+        for bounds in bands:
+            tiling.process_tile(image, operator, halo, out, bounds)
+        return out
+
+    if backend == 'thread':
+        pool = executor or ThreadPoolExecutor(max_workers=workers)
+        try:
+            list(pool.map(lambda bounds: tiling.process_tile(image, operator, halo, out, bounds), bands))
+        finally:
+            if executor is None:
+                pool.shutdown()
+        return out
+
+    if backend != 'process':
+        raise ValueError("backend must be 'thread' or 'process'.")
+
+    input_memory = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+    output_memory = shared_memory.SharedMemory(create=True, size=max(out.nbytes, 1))
+    pool = executor or ProcessPoolExecutor(max_workers=workers)
+    try:
+        shared_input = np.ndarray(image.shape, dtype=image.dtype, buffer=input_memory.buf)
+        shared_input[...] = image
+        shared_output = np.ndarray(out.shape, dtype=out.dtype, buffer=output_memory.buf)
+        input_spec = (input_memory.name, image.shape, image.dtype.str)
+        output_spec = (output_memory.name, out.shape, out.dtype.str)
+        futures = [pool.submit(run_band_shared, input_spec, output_spec, operator, halo, bounds) for bounds in bands]
+        for future in futures:
+            future.result()
+        out[...] = shared_output
+        del shared_input, shared_output
+    finally:
+        if executor is None:
+            pool.shutdown()
+        input_memory.close()
+        input_memory.unlink()
+        output_memory.close()
+        output_memory.unlink()
+    return out
+
+def parallel_filter(image, method, kernel_size=3, workers=None, backend='thread', out=None, executor=None):
+    """
+    Chạy một phương pháp xử lý trên nhiều lõi CPU theo dải hàng. Kết quả giống hệt khi chạy một luồng.
+    Args:
+        image (ndarray): Ảnh grayscale 2D.
+        method (str): Tên phương pháp trong PARALLEL_METHODS.
+        kernel_size (int): Kích thước kernel (bỏ qua với laplacian_filter và JPEG).
+        workers (int): Số worker, mặc định bằng số lõi CPU.
+        backend (str): 'thread' hoặc 'process' (xem process_bands).
+        out (ndarray): Mảng đích, None để cấp phát mới.
+        executor (Executor): Pool dùng lại giữa các lần gọi.
+    Returns:
+        ndarray: Ảnh kết quả.
+    """
+    if image.ndim != 2:
+        raise ValueError("Parallel processing expects a single-channel (2D) image.")
+    operator, halo, row_multiple, output_dtype = band_operator(method, kernel_size)
+
+    if method == 'laplacian_filter':
+        response = process_bands(image, operator, halo, np.empty(image.shape, dtype=output_dtype), workers, backend,
+                                 row_multiple, executor)
+        return normalize_laplacian(response, out=out)
+
+    if out is None:
+        out = np.empty(image.shape, dtype=output_dtype or image.dtype)
+    return process_bands(image, operator, halo, out, workers, backend, row_multiple, executor)
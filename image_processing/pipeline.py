@@ -0,0 +1,119 @@
+import json
+import time
+
+import numpy as np
+
+from image_processing.histogram import Histogram, apply_lut, map_channels
+from image_processing.registry import OPERATORS
+
+class Pipeline:
+    """
+    Chuỗi các bước xử lý chạy liên tiếp trong bộ nhớ trên một ảnh, không ghi/đọc file giữa các bước.
+    Các bước là các toán tử output='image' trong registry.
+    - Ảnh vào không bị sửa; các bước sau ghi đè tại chỗ lên ảnh trung gian khi toán tử cho phép
+      (Operator.in_place: nhóm LUT, dilation/erosion, lọc miền tần số).
+    - Các bước LUT liên tiếp (Operator.lut: equalize, otsu) được gộp thành một LUT duy nhất; histogram
+      của ảnh trung gian được suy ra bằng Histogram.remap nên cả nhóm chỉ duyệt ảnh hai lần
+      (với ảnh (H, W, C), mỗi kênh có LUT gộp riêng).
+    - Thời gian từng bước được ghi vào timings sau mỗi lần run.
+
+    Ví dụ:
+        pipeline = Pipeline([('median_filter', {'kernel_size': 5}), ('equalize', {}), ('otsu', {}),
+                             ('opening', {'kernel_size': 3})])
+        binary = pipeline.run(image)
+        print(pipeline.timings)
+    """
+
+    def __init__(self, stages):
+        """
+        Args:
+            stages (list): Danh sách (method, params) hoặc {'method': ..., 'params': {...}}.
+        """
+        self.stages = []
+        for stage in stages:
+            method, params = (stage['method'], stage.get('params', {})) if isinstance(stage, dict) else stage
+            operator = OPERATORS.get(method)
+            if operator is None or operator.output != 'image':
+                raise ValueError(f"Unsupported pipeline stage '{method}'.")
+            self.stages.append((operator, operator.validate(dict(params or {}))))
+        if not self.stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        self.timings = []
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Tạo Pipeline từ chuỗi JSON dạng [{"method": "median_filter", "params": {"kernel_size": 5}}, ...].
+        """
+        return cls(json.loads(text))
+
+    def scaled(self, factor):
+        """
+        Pipeline tương ứng trên ảnh thu nhỏ factor lần (ảnh xem trước): kernel của các bước được thu nhỏ theo.
+        """
+        return Pipeline([(operator.name, operator.scale_params(params, factor)) for operator, params in self.stages])
+
+    def estimate_seconds(self, shape):
+        """
+        Tổng thời gian ước lượng (giây) của các bước.
+        """
+        return sum(operator.estimate_seconds(shape, params) for operator, params in self.stages)
+
+    def estimate_bytes(self, shape):
+        """
+        Bộ nhớ ước lượng (byte): bước tốn nhiều nhất cộng với ảnh trung gian.
+        """
+        return max(operator.estimate_bytes(shape, params) for operator, params in self.stages) + int(np.prod(shape))
+
+    def groups(self):
+        """
+        Gom các bước LUT liên tiếp thành một nhóm; mỗi bước khác là một nhóm riêng.
+        """
+        groups = []
+        for operator, params in self.stages:
+            if operator.lut is not None and groups and groups[-1][0][0].lut is not None:
+                groups[-1].append((operator, params))
+            else:
+                groups.append([(operator, params)])
+        return groups
+
+    def fused_lut(self, group, histogram):
+        """
+        LUT gộp của một nhóm bước LUT, tính từ histogram của ảnh vào nhóm.
+        """
+        lut = np.arange(histogram.levels, dtype=histogram.dtype)
+        for lut_operator, lut_params in group:
+            stage_lut = lut_operator.lut(histogram, **lut_params)
+            lut = stage_lut[lut]
+            histogram = histogram.remap(stage_lut)
+        return lut
+
+    def run(self, image):
+        """
+        Chạy toàn bộ pipeline.
+        Args:
+            image (ndarray): Ảnh grayscale uint8/uint16 hoặc ảnh (H, W, C) (không bị sửa).
+        Returns:
+            ndarray: Ảnh kết quả.
+        """
+        self.timings = []
+        current = image
+        owned = False  # current là ảnh trung gian của pipeline (được phép ghi đè)
+
+        for group in self.groups():
+            start = time.perf_counter()
+            operator, params = group[0]
+            out = current if owned else None
+
+            if operator.lut is not None and current.ndim == 3:
+                result = map_channels(current, lambda histogram: self.fused_lut(group, histogram), out=out)
+            elif operator.lut is not None:
+                result = apply_lut(current, self.fused_lut(group, Histogram.from_image(current)), out=out)
+            elif operator.in_place:
+                result = operator(current, out=out, **params)
+            else:
+                result = operator(current, **params)
+
+            current, owned = result, True
+            self.timings.append(('+'.join(stage_operator.name for stage_operator, _ in group), time.perf_counter() - start))
+        return current
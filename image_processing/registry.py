@@ -0,0 +1,373 @@
+from functools import partial
+
+import numpy as np
+
+from image_processing.color import JPEG_SUBSAMPLING, dtype_maximum
+from image_processing.frequency_enhancement import FILTER_TYPES
+from image_processing.lazy import LazyFunction
+
+def lazy(module, *names):
+    """
+    Các hàm của module image_processing.<module>, module chỉ được import ở lần gọi đầu tiên:
+    import registry (và server) không kéo theo mọi module xử lý cùng OpenCV/SciPy của chúng.
+    """
+    functions = tuple(LazyFunction(f"image_processing.{module}", name) for name in names)
+    return functions if len(functions) > 1 else functions[0]
+
+encode_jpeg, encode_jpeg_with_opencv = lazy('compress', 'encode_jpeg', 'encode_jpeg_with_opencv')
+frequency_filter, frequency_filter_batch = lazy('frequency_enhancement', 'frequency_filter', 'frequency_filter_batch')
+equalization_lut, histogram_equalization, histogram_equalization_opencv = lazy(
+    'histogram', 'equalization_lut', 'histogram_equalization', 'histogram_equalization_opencv')
+(dilation, erosion, opening, closing, morphological_gradient, top_hat, black_hat, dilation_opencv,
+ erosion_opencv) = lazy('morphological', 'dilation', 'erosion', 'opening', 'closing', 'morphological_gradient',
+                        'top_hat', 'black_hat', 'dilation_opencv', 'erosion_opencv')
+otsu_lut, otsu_thresholding, otsu_threshold_opencv = lazy('segmentation', 'otsu_lut', 'otsu_thresholding',
+                                                          'otsu_threshold_opencv')
+mean_filter, median_filter, median_filter_opencv, laplacian_filter, laplacian_filter_opencv = lazy(
+    'spatial_enhancement', 'mean_filter', 'median_filter', 'median_filter_opencv', 'laplacian_filter',
+    'laplacian_filter_opencv')
+
+class Parameter:
+    """
+    Mô tả một tham số của toán tử: tên trong Python, tên trường form, kiểu, giá trị mặc định và ràng buộc.
+    spatial=True đánh dấu tham số đo bằng pixel (kích thước kernel), được thu nhỏ theo ảnh xem trước.
+    positive=True yêu cầu giá trị lớn hơn hẳn 0 (ví dụ bán kính cắt: bằng 0 thì hàm truyền chia cho 0).
+    """
+
+    def __init__(self, name, type, default, form_name=None, minimum=None, odd=False, maximum=None, choices=None,
+                 spatial=False, positive=False):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.form_name = form_name or name
+        self.minimum = minimum
+        self.odd = odd
+        self.maximum = maximum
+        self.choices = choices
+        self.spatial = spatial
+        self.positive = positive
+
+    def parse(self, value):
+        """
+        Chuyển giá trị (chuỗi từ form hoặc số từ JSON) về đúng kiểu và kiểm tra ràng buộc.
+        Raises:
+            ValueError: Giá trị không hợp lệ.
+        """
+        if value is None or value == '':
+            return self.default
+        if self.type is list:
+            if isinstance(value, str):
+                value = value.replace(';', ',').split(',')
+            return [self.parse_scalar(float, item) for item in value if str(item).strip()]
+        return self.parse_scalar(self.type, value)
+
+    def parse_scalar(self, type, value):
+        if type is int and isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{self.form_name} must be an integer.")
+        try:
+            value = type(value)
+        except (TypeError, ValueError):
+            # Thông báo theo tên trường form thay cho "invalid literal for int() ..." của Python
+            kind = {int: 'an integer', float: 'a number'}.get(type, f"a valid {type.__name__}")
+            raise ValueError(f"{self.form_name} must be {kind}.") from None
+        if self.positive and not value > 0:
+            raise ValueError(f"{self.form_name} must be greater than 0.")
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"{self.form_name} must be at least {self.minimum}.")
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError(f"{self.form_name} must be at most {self.maximum}.")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"{self.form_name} must be one of {', '.join(map(str, self.choices))}.")
+        if self.odd and value % 2 == 0:
+            raise ValueError(f"{self.form_name} must be odd.")
+        return value
+
+    def scale(self, value, factor):
+        """
+        Giá trị tương ứng trên ảnh thu nhỏ factor lần: tham số spatial được chia cho factor
+        (kernel lẻ giữ lẻ: bán kính kernel // 2 được chia rồi làm tròn), tham số khác giữ nguyên.
+        Bán kính cắt của bộ lọc miền tần số không đổi vì được đo theo số chu kỳ trên cả ảnh.
+        """
+        if not self.spatial or factor == 1:
+            return value
+        if self.odd:
+            return 2 * int(value // 2 / factor + 0.5) + 1
+        return max(self.minimum or 1, int(value / factor + 0.5))
+
+class Operator:
+    """
+    Một phương pháp xử lý ảnh trong registry.
+    Attributes:
+        name (str): Tên (giống methodType của form).
+        function (callable): function(image, **params) trả về ảnh; với output='encoded'
+            trả về nội dung file đã nén (bytes, JPEG).
+        parameters (tuple): Các Parameter.
+        backend (str): 'custom' (tự xây dựng) hoặc 'opencv'.
+        family (str): Các cài đặt của cùng một phép xử lý (ví dụ median_filter và median_filter_opencv).
+            Kết quả không nhất thiết giống hệt nhau: cách xử lý biên ảnh, làm tròn hoặc bảng lượng tử hóa
+            JPEG có thể khác, nên chỉ được thay thế nhau khi người gọi chấp nhận (xem choose_operator).
+        kernel_dependent (bool): Chi phí/kết quả phụ thuộc kernel_size.
+        passes (int): Số lượt kernel cục bộ (halo = passes * kernel_size // 2); 0 nếu là phép toàn cục.
+        in_place (bool): function nhận out= và out có thể chính là ảnh vào.
+        lut (callable): lut(histogram, **params) nếu toán tử là một LUT tính từ histogram.
+        batch (callable): batch(image, radii, **params) cho chế độ nhiều bán kính (trả về mảng (n, H, W)).
+        output (str): 'image' hoặc 'encoded' (nén JPEG).
+        cost (callable): cost(params) -> thời gian ước lượng (ns mỗi pixel).
+        memory (callable): memory(params) -> bộ nhớ tạm tối đa ước lượng (byte mỗi pixel), chưa tính ảnh vào.
+        multichannel (bool): function nhận thẳng ảnh (H, W, C) và xử lý mọi kênh trong một lần gọi;
+            False thì __call__ gọi function lần lượt trên từng kênh (toán tử output='image'), hoặc
+            (output='encoded') bộ mã hóa chỉ nén ảnh grayscale.
+        dtypes (tuple): Các kiểu dữ liệu ảnh vào được hỗ trợ ('uint8', 'uint16').
+    Với toán tử có batch, params truyền cho cost/memory có thể chứa thêm 'radii'.
+    """
+
+    def __init__(self, name, function, parameters=(), backend='custom', family=None, kernel_dependent=False, passes=0,
+                 in_place=False, lut=None, batch=None, output='image', cost=None, memory=None, multichannel=True,
+                 dtypes=('uint8', 'uint16')):
+        self.name = name
+        self.function = function
+        self.parameters = tuple(parameters)
+        self.backend = backend
+        self.family = family or name
+        self.kernel_dependent = kernel_dependent
+        self.passes = passes
+        self.in_place = in_place
+        self.lut = lut
+        self.batch = batch
+        self.output = output
+        self.cost = cost or (lambda params: 10.0)
+        self.memory = memory or (lambda params: 8.0)
+        self.multichannel = multichannel
+        self.dtypes = tuple(dtypes)
+
+    def parse_form(self, form):
+        """
+        Đọc tham số từ form (theo form_name) và trả về dict theo tên trong Python.
+        """
+        return {parameter.name: parameter.parse(form.get(parameter.form_name)) for parameter in self.parameters}
+
+    def validate(self, params):
+        """
+        Kiểm tra tham số truyền trực tiếp (theo tên trong Python, ví dụ từ JSON của pipeline),
+        điền giá trị mặc định và báo lỗi với tham số lạ.
+        """
+        names = {parameter.name for parameter in self.parameters}
+        unknown = set(params) - names
+        if unknown:
+            raise ValueError(f"Unknown parameters for '{self.name}': {', '.join(sorted(unknown))}")
+        return {parameter.name: parameter.parse(params.get(parameter.name)) for parameter in self.parameters}
+
+    def scale_params(self, params, factor):
+        """
+        Tham số cho ảnh thu nhỏ factor lần (ảnh xem trước), xem Parameter.scale.
+        """
+        scaled = dict(params)
+        for parameter in self.parameters:
+            if parameter.name in scaled:
+                scaled[parameter.name] = parameter.scale(scaled[parameter.name], factor)
+        return scaled
+
+    def __call__(self, image, **params):
+        if image.ndim == 3 and not self.multichannel and self.output == 'image':
+            return np.dstack([self.function(np.ascontiguousarray(image[..., channel]), **params)
+                              for channel in range(image.shape[2])])
+        return self.function(image, **params)
+
+    def supports(self, dtype):
+        """
+        True nếu toán tử nhận ảnh kiểu dtype.
+        """
+        return np.dtype(dtype).name in self.dtypes
+
+    def estimate_seconds(self, shape, params):
+        """
+        Thời gian chạy ước lượng (giây) cho ảnh kích thước shape ((H, W) hoặc (H, W, C): chi phí tính theo mẫu).
+        """
+        return self.cost(params) * int(np.prod(shape)) * 1e-9
+
+    def estimate_bytes(self, shape, params):
+        """
+        Bộ nhớ tạm tối đa ước lượng (byte) cho ảnh kích thước shape ((H, W) hoặc (H, W, C)).
+        """
+        return int(self.memory(params) * int(np.prod(shape)))
+
+OPERATORS = {}
+
+# Độ chính xác của các bộ lọc miền tần số (trường form "precision"): 'double' là fft2 complex128 như các hàm
+# lọc gốc, 'single' là rfft2 float32/complex64 (ít bộ nhớ hơn nhiều, sai khác tối đa khoảng 1 mức sáng)
+PRECISION_PARAMETER = Parameter('precision', str, 'double', choices=('double', 'single'))
+
+# Danh sách bán kính cho chế độ lô của các bộ lọc miền tần số (trường form "radii", ví dụ "10, 20, 40")
+RADII_PARAMETER = Parameter('radii', list, [], positive=True)
+
+def register(operator):
+    """
+    Thêm toán tử vào registry.
+    """
+    if operator.name in OPERATORS:
+        raise ValueError(f"Operator '{operator.name}' is already registered.")
+    OPERATORS[operator.name] = operator
+    return operator
+
+def get_operator(name):
+    """
+    Lấy toán tử theo tên.
+    Raises:
+        KeyError: Không có toán tử với tên này.
+    """
+    return OPERATORS[name]
+
+def accepts(operator, params):
+    """
+    True nếu toán tử chấp nhận bộ tham số (ví dụ median_filter_opencv chỉ nhận kernel lẻ).
+    """
+    try:
+        operator.validate({name: value for name, value in params.items() if name != 'radii'})
+    except ValueError:
+        return False
+    return True
+
+def choose_operator(name, shape, params, min_pixels=None, dtype=None):
+    """
+    Chọn cài đặt rẻ nhất trong cùng family khi ảnh có ít nhất min_pixels pixel. Đây là tùy chọn bật
+    chủ động (min_pixels): cài đặt được chọn có thể cho kết quả khác toán tử được yêu cầu (ví dụ biên ảnh
+    của median_filter_opencv, dilation_opencv), xem Operator.family.
+    Args:
+        name (str): Toán tử được yêu cầu.
+        shape (tuple): Kích thước ảnh.
+        params (dict): Tham số đã parse.
+        min_pixels (int): Ngưỡng số pixel; None hoặc 0 để luôn dùng đúng toán tử được yêu cầu.
+        dtype: Kiểu dữ liệu ảnh nếu đã biết; chỉ thay bằng các cài đặt hỗ trợ kiểu này.
+    Returns:
+        Operator
+    """
+    operator = OPERATORS[name]
+    if not min_pixels or int(np.prod(shape[:2])) < min_pixels:
+        return operator
+    parameter_names = [parameter.name for parameter in operator.parameters]
+    candidates = [candidate for candidate in OPERATORS.values()
+                  if candidate.family == operator.family and candidate.output == operator.output
+                  and [parameter.name for parameter in candidate.parameters] == parameter_names
+                  and accepts(candidate, params) and (dtype is None or candidate.supports(dtype))]
+    return min(candidates, key=lambda candidate: candidate.estimate_seconds(shape, params), default=operator)
+
+# ---------------------------------------------------------------------------
+# Các toán tử. Hệ số cost/memory đo trên ảnh 1024x1024 uint8 (một lõi CPU), chỉ dùng để so sánh
+# các cài đặt với nhau và để chặn các job quá lớn, không phải thời gian chính xác.
+# ---------------------------------------------------------------------------
+
+def kernel_size_parameter(odd=False):
+    return Parameter('kernel_size', int, 3, form_name='kernelSize', minimum=1, odd=odd, spatial=True)
+
+def median_cost(params):
+    # Histogram cột cho uint8 + kernel lẻ (thời gian không phụ thuộc kernel); ngược lại là np.median
+    # trên các cửa sổ (median_filter_sorted)
+    kernel_size = params['kernel_size']
+    return 1900.0 if kernel_size % 2 == 1 else 40.0 * kernel_size ** 2
+
+def frequency_clipped(image, filter_type, radius=30.0, order=2, precision='double', out=None):
+    """
+    Lọc miền tần số; kết quả float được cắt về dải của kiểu ảnh vào (uint8/uint16) và ghi vào out nếu có.
+    Ảnh (H, W, C) được lọc mọi kênh cùng lúc (phổ tính theo lô trên các mặt phẳng kênh).
+    precision='single' dùng đường rfft2 float32/complex64 (khoảng 1/4 bộ nhớ của fft2 complex128; kết quả
+    có thể lệch 1 mức sáng ở một số pixel).
+    """
+    planes = np.moveaxis(image, -1, 0) if image.ndim == 3 else image
+    result = frequency_filter(planes, filter_type, radius, order, use_rfft=precision == 'single')
+    if image.ndim == 3:
+        result = np.moveaxis(result, 0, -1)
+    np.clip(result, 0, dtype_maximum(image.dtype), out=result)
+    if out is None:
+        return result.astype(image.dtype)
+    np.copyto(out, result, casting='unsafe')
+    return out
+
+def frequency_batch_clipped(image, radii, filter_type, radius=None, order=2, precision='double'):
+    """
+    Lọc miền tần số với nhiều bán kính (một lần FFT thuận), kết quả cùng kiểu với ảnh vào dạng
+    (n, H, W) (hoặc (n, H, W, C)). radius (bán kính đơn) bị bỏ qua, chỉ để nhận cùng bộ tham số với toán tử.
+    """
+    planes = np.moveaxis(image, -1, 0) if image.ndim == 3 else image
+    result = frequency_filter_batch(planes, filter_type, radii, order, use_rfft=precision == 'single')
+    if image.ndim == 3:
+        result = np.moveaxis(result, 1, -1)
+    return np.clip(result, 0, dtype_maximum(image.dtype)).astype(image.dtype)
+
+def frequency_cost(params):
+    scale = 0.3 if params.get('precision') == 'single' else 1.0
+    return 60.0 * scale * max(len(params.get('radii') or []), 1)
+
+def frequency_memory(params):
+    radii = len(params.get('radii') or [])
+    if params.get('precision') == 'single':
+        return 4.0 + 12.0 * radii if radii else 14.0
+    return 16.0 + 64.0 * radii if radii else 72.0
+
+def encode_jpeg_custom(image, quality=50, subsampling='4:2:0'):
+    """
+    Nén JPEG bằng bộ mã hóa tự xây dựng (bảng Huffman tối ưu), trả về nội dung file .jpg.
+    Ảnh màu được nén YCbCr với lấy mẫu màu subsampling.
+    """
+    return encode_jpeg(image, quality, subsampling, optimize_huffman=True)
+
+def encode_jpeg_opencv(image, quality=50, subsampling='4:2:0'):
+    """
+    Nén JPEG bằng OpenCV, trả về nội dung file .jpg.
+    """
+    return encode_jpeg_with_opencv(image, quality, subsampling)
+
+# Tham số chung của hai bộ nén JPEG: chất lượng (co giãn bảng lượng tử hóa kiểu IJG) và lấy mẫu màu
+JPEG_PARAMETERS = [Parameter('quality', int, 50, minimum=1, maximum=100),
+                   Parameter('subsampling', str, '4:2:0', choices=JPEG_SUBSAMPLING)]
+
+register(Operator('equalize', histogram_equalization, in_place=True, lut=equalization_lut,
+                  cost=lambda params: 3.5, memory=lambda params: 9.0))
+register(Operator('equalize_opencv', histogram_equalization_opencv, backend='opencv', family='equalize',
+                  cost=lambda params: 1.0, memory=lambda params: 1.0, multichannel=False, dtypes=('uint8',)))
+register(Operator('mean_filter', mean_filter, [kernel_size_parameter()], kernel_dependent=True, passes=1, in_place=True,
+                  cost=lambda params: 9.0, memory=lambda params: 9.0))
+register(Operator('median_filter', median_filter, [kernel_size_parameter()], kernel_dependent=True, passes=1,
+                  in_place=True, cost=median_cost, memory=lambda params: 4.0))
+register(Operator('median_filter_opencv', median_filter_opencv, [kernel_size_parameter(odd=True)], backend='opencv',
+                  family='median_filter', kernel_dependent=True, passes=1,
+                  cost=lambda params: 1.0 if params['kernel_size'] <= 5 else 60.0, memory=lambda params: 1.0,
+                  dtypes=('uint8',)))
+register(Operator('laplacian_filter', laplacian_filter, cost=lambda params: 6.0, memory=lambda params: 10.0))
+register(Operator('laplacian_filter_opencv', laplacian_filter_opencv, backend='opencv', family='laplacian_filter',
+                  cost=lambda params: 12.0, memory=lambda params: 25.0))
+register(Operator('dilation', dilation, [kernel_size_parameter()], kernel_dependent=True, passes=1, in_place=True,
+                  cost=lambda params: 35.0, memory=lambda params: 7.0))
+register(Operator('dilation_opencv', dilation_opencv, [kernel_size_parameter()], backend='opencv', family='dilation',
+                  kernel_dependent=True, passes=1, cost=lambda params: 1.0, memory=lambda params: 1.0))
+register(Operator('erosion', erosion, [kernel_size_parameter()], kernel_dependent=True, passes=1, in_place=True,
+                  cost=lambda params: 35.0, memory=lambda params: 7.0))
+register(Operator('erosion_opencv', erosion_opencv, [kernel_size_parameter()], backend='opencv', family='erosion',
+                  kernel_dependent=True, passes=1, cost=lambda params: 1.0, memory=lambda params: 1.0))
+register(Operator('opening', opening, [kernel_size_parameter()], kernel_dependent=True, passes=2,
+                  cost=lambda params: 80.0, memory=lambda params: 7.0))
+register(Operator('closing', closing, [kernel_size_parameter()], kernel_dependent=True, passes=2,
+                  cost=lambda params: 80.0, memory=lambda params: 7.0))
+register(Operator('gradient', morphological_gradient, [kernel_size_parameter()], kernel_dependent=True, passes=1,
+                  cost=lambda params: 70.0, memory=lambda params: 8.0))
+register(Operator('top_hat', top_hat, [kernel_size_parameter()], kernel_dependent=True, passes=2,
+                  cost=lambda params: 90.0, memory=lambda params: 7.0))
+register(Operator('black_hat', black_hat, [kernel_size_parameter()], kernel_dependent=True, passes=2,
+                  cost=lambda params: 90.0, memory=lambda params: 7.0))
+register(Operator('otsu', otsu_thresholding, in_place=True, lut=otsu_lut,
+                  cost=lambda params: 3.5, memory=lambda params: 9.0))
+register(Operator('otsu_opencv', otsu_threshold_opencv, backend='opencv', family='otsu',
+                  cost=lambda params: 1.0, memory=lambda params: 1.0, multichannel=False, dtypes=('uint8',)))
+register(Operator('jpeg_custom_compress', encode_jpeg_custom, JPEG_PARAMETERS, output='encoded',
+                  cost=lambda params: 165.0, memory=lambda params: 32.0, dtypes=('uint8',)))
+register(Operator('jpeg_opencv_compress', encode_jpeg_opencv, JPEG_PARAMETERS, backend='opencv', family='jpeg_custom_compress',
+                  output='encoded', cost=lambda params: 6.0, memory=lambda params: 1.0, dtypes=('uint8',)))
+
+for filter_type in FILTER_TYPES:
+    # precision='double': phổ và hàm truyền complex128/float64 (SPECTRUM_CACHE giữ thêm phổ của ảnh), mỗi bán kính
+    # của chế độ lô cần thêm khoảng 64 byte mỗi pixel; precision='single' (rfft2 float32) tốn khoảng 1/5 số đó
+    register(Operator(
+        f"{filter_type}_pass", partial(frequency_clipped, filter_type=filter_type),
+        [Parameter('radius', float, 30.0, positive=True), Parameter('order', int, 2, minimum=1), PRECISION_PARAMETER],
+        in_place=True, batch=partial(frequency_batch_clipped, filter_type=filter_type),
+        cost=frequency_cost, memory=frequency_memory,
+    ))
@@ -1,27 +1,58 @@
 import numpy as np
-import cv2
-def otsu_thresholding(image):
-    hist, _ = np.histogram(image.flatten(), bins=256, range=[0, 256])
-    total = image.size
-    sum_total = np.sum(np.arange(256) * hist)
-    sum_bg, weight_bg, max_variance = 0, 0, 0
-    threshold = 0
-
-    for t in range(256):
-        weight_bg += hist[t]
-        if weight_bg == 0:
-            continue
-        weight_fg = total - weight_bg
-        if weight_fg == 0:
-            break
-        sum_bg += t * hist[t]
+from image_processing.histogram import Histogram, apply_lut, map_channels
+from image_processing.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+def otsu_threshold_value(histogram):
+    """
+    Tìm ngưỡng Otsu (cực đại phương sai giữa hai lớp) cho mọi ngưỡng cùng lúc.
+
+    :param histogram: Đối tượng Histogram.
+    :return: Ngưỡng t; pixel > t thuộc lớp tiền cảnh.
+    """
+    hist = histogram.counts
+    total = histogram.total
+    weight_bg = histogram.cdf
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(np.arange(histogram.levels) * hist)
+    sum_total = sum_bg[-1]
+
+    valid = (weight_bg > 0) & (weight_fg > 0)
+    variance = np.zeros(histogram.levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
         mean_bg = sum_bg / weight_bg
         mean_fg = (sum_total - sum_bg) / weight_fg
-        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
-        if variance > max_variance:
-            max_variance = variance
-            threshold = t
-    return (image > threshold).astype(np.uint8) * 255
+        variance[valid] = (weight_bg * weight_fg * (mean_bg - mean_fg) ** 2)[valid]
+
+    # Ngưỡng đầu tiên đạt phương sai lớn nhất (0 nếu ảnh chỉ có một mức xám)
+    return int(np.argmax(variance)) if variance.max() > 0 else 0
+
+def otsu_lut(histogram):
+    """
+    Bảng tra cứu phân ngưỡng Otsu: mức lớn nhất (255, hoặc 65535 với ảnh 16 bit) cho các mức > ngưỡng,
+    0 cho các mức còn lại.
+
+    :param histogram: Đối tượng Histogram.
+    :return: LUT uint8 256 phần tử (uint16 65536 phần tử với histogram của ảnh 16 bit).
+    """
+    threshold = otsu_threshold_value(histogram)
+    return np.where(np.arange(histogram.levels) > threshold, histogram.levels - 1, 0).astype(histogram.dtype)
+
+def otsu_thresholding(image, histogram=None, out=None):
+    """
+    Phân ngưỡng Otsu.
+
+    :param image: Ảnh đầu vào (grayscale uint8 hoặc uint16), hoặc ảnh (H, W, C) (ngưỡng riêng cho từng kênh).
+    :param histogram: Histogram của ảnh 2D nếu đã tính trước (tùy chọn).
+    :param out: Mảng nhận kết quả (tùy chọn), có thể chính là image.
+    :return: Ảnh nhị phân (0 hoặc mức lớn nhất của kiểu dữ liệu).
+    """
+    if image.ndim == 3:
+        return map_channels(image, otsu_lut, out=out)
+    if histogram is None:
+        histogram = Histogram.from_image(image)
+    return apply_lut(image, otsu_lut(histogram), out=out)
 
 def otsu_threshold_opencv(image):
     """
@@ -1,28 +1,419 @@
 import numpy as np
-import cv2
-def mean_filter(image, kernel_size=3):
+from numpy.lib.stride_tricks import sliding_window_view
+
+from image_processing.frequency_enhancement import fft_convolve
+from image_processing.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+def kernel_shape(kernel_size):
+    """
+    Chuẩn hóa kích thước kernel về dạng (số hàng, số cột).
+    Args:
+        kernel_size (int | tuple): Một số nguyên (kernel vuông) hoặc cặp (rows, cols).
+    Returns:
+        tuple: (kernel_height, kernel_width).
+    """
+    if np.isscalar(kernel_size):
+        kernel_height = kernel_width = int(kernel_size)
+    else:
+        kernel_height, kernel_width = (int(k) for k in kernel_size)
+    if kernel_height < 1 or kernel_width < 1:
+        raise ValueError("Kernel size must be positive.")
+    return kernel_height, kernel_width
+
+# Số phép nhân-cộng mỗi pixel (số hệ số khác 0 của kernel) từ đó convolve2d chuyển sang FFT.
+# Đo trên ảnh 1024x1024 float64 một lõi CPU: cộng dồn một lát cắt theo dải tốn khoảng 1 ns/pixel,
+# FFT khoảng 60 ns/pixel (với float32 cả hai nhanh gần gấp đôi).
+FFT_CROSSOVER_TAPS = 60
+
+# Kernel lớn nhất mà median_filter_histogram cộng trực tiếp histogram mịn của các cột thay vì qua tổng
+# tích lũy; đo trên ảnh 1024x1024 một lõi CPU, hai cách ngang nhau ở kernel 7.
+SMALL_MEDIAN_KERNEL = 5
+
+# Kernel Laplacian 4 lân cận và 8 lân cận
+LAPLACIAN_KERNEL = np.array([[0, -1, 0],
+                             [-1, 4, -1],
+                             [0, -1, 0]], dtype=np.float64)
+LAPLACIAN_KERNEL_DIAGONAL = np.array([[-1, -1, -1],
+                                      [-1, 8, -1],
+                                      [-1, -1, -1]], dtype=np.float64)
+
+def separable_factors(kernel, tolerance=1e-10):
+    """
+    Tách kernel 2D hạng 1 thành tích ngoài của hai vector (cột, hàng) bằng SVD.
+    Returns:
+        tuple | None: (column, row) với kernel = column[:, None] * row[None, :], hoặc None nếu kernel không tách được.
+    """
+    u, s, vt = np.linalg.svd(kernel)
+    if s[0] == 0 or (len(s) > 1 and s[1] > tolerance * s[0]):
+        return None
+    scale = np.sqrt(s[0])
+    return u[:, 0] * scale, vt[0] * scale
+
+def convolve2d(image, kernel, method='auto', dtype=np.float64, out=None):
+    """
+    Lọc ảnh với một kernel tùy ý, padding bằng 0 ở biên, kết quả cùng kích thước với ảnh.
+    Kernel được áp dụng như cv2.filter2D (không lật kernel): kết quả tại (i, j) là tổng
+    kernel[a, b] * padded[i + a, j + b], với padded có kernel_size // 2 hàng/cột 0 mỗi phía
+    (như mean_filter_loop, kể cả kernel chẵn). Ảnh padding không được tạo ra: mỗi hệ số chỉ được cộng
+    vào phần kết quả mà lát cắt dịch chuyển của ảnh còn chạm tới. Ba cách tính:
+    - 'direct': cộng dồn các lát cắt dịch chuyển của ảnh, một lát cho mỗi hệ số khác 0.
+    - 'separable': kernel hạng 1 (phát hiện bằng SVD, hoặc truyền sẵn cặp vector (column, row)) được
+      tính bằng hai lượt 1D, kh + kw phép mỗi pixel thay vì kh * kw. Lượt có hệ số bằng nhau dùng tổng tích
+      lũy, và kernel hằng (ví dụ kernel trung bình) dùng ảnh tích phân (box_sum): chi phí không phụ thuộc
+      kích thước kernel.
+    - 'fft': tích chập qua frequency_enhancement.fft_convolve, chi phí gần như không phụ thuộc kích thước kernel.
+    'auto' chọn 'separable' nếu kernel tách được, ngược lại 'direct' hoặc 'fft' tùy số hệ số so với FFT_CROSSOVER_TAPS.
+    Args:
+        image (ndarray): Ảnh đầu vào (2D, hoặc (H, W, C): mọi kênh được tính cùng lúc).
+        kernel (ndarray | tuple): Kernel 2D, hoặc cặp vector 1D (column, row) của kernel tách được.
+        method (str): 'auto', 'direct', 'separable' hoặc 'fft'.
+        dtype: Kiểu tính toán và kết quả, np.float64 hoặc np.float32 (một nửa bộ nhớ; vẫn chính xác với ảnh
+            uint8/uint16 và kernel hệ số nguyên nhỏ, khi mọi tổng nhỏ hơn 2^24).
+        out (ndarray): Mảng nhận kết quả (tùy chọn, không được trùng với image).
+    Returns:
+        ndarray: Kết quả kiểu dtype. Riêng kernel hằng có hệ số bằng 1 trên ảnh số nguyên, kết quả là tổng chính xác
+            theo cửa sổ ở kiểu số nguyên của box_sum.
+    """
+    factors = None
+    if isinstance(kernel, tuple):
+        factors = tuple(np.asarray(factor, dtype=np.float64).ravel() for factor in kernel)
+        kernel = np.outer(*factors)
+    kernel = np.asarray(kernel, dtype=np.float64)
+    if kernel.ndim != 2 or 0 in kernel.shape:
+        raise ValueError("Kernel must be a non-empty 2D array.")
+    if method not in ('auto', 'direct', 'separable', 'fft'):
+        raise ValueError(f"Unknown convolution method: {method}.")
+
+    if method in ('auto', 'separable') and factors is None:
+        factors = separable_factors(kernel)
+    if method == 'separable' and factors is None:
+        raise ValueError("Kernel is not separable.")
+    taps = np.count_nonzero(kernel)
+    if method == 'auto':
+        if factors is not None:
+            method = 'separable'
+        else:
+            method = 'fft' if taps > FFT_CROSSOVER_TAPS else 'direct'
+
+    if method == 'separable':
+        column, row = factors
+        if np.all(column == column[0]) and np.all(row == row[0]):
+            sums = box_sum(image, kernel.shape)
+            weight = column[0] * row[0]
+            if weight != 1 or sums.dtype.kind == 'f':
+                sums = np.multiply(sums, weight, dtype=dtype)
+            if out is None:
+                return sums
+            np.copyto(out, sums, casting='unsafe')
+            return out
+        return convolve_axis(convolve_axis(image, column, 0, dtype), row, 1, dtype, out)
+    if method == 'fft':
+        return convolve_fft(image, kernel, dtype, out)
+    return convolve_direct(image, kernel, dtype, out)
+
+def sum_accumulator(dtype, count):
+    """
+    Kiểu dùng để tích lũy (cumsum) count giá trị kiểu dtype rồi lấy hiệu của hai tổng tích lũy.
+    Với uint8/uint16/bool, uint32 đủ nếu mọi tổng theo cửa sổ nhỏ hơn 2^32: tổng tích lũy có thể tràn vòng
+    nhưng hiệu vẫn đúng theo modulo 2^32. Số nguyên khác dùng int64, số thực dùng float64.
+    """
+    dtype = np.dtype(dtype)
+    if dtype == bool or dtype in (np.uint8, np.uint16):
+        maximum = 1 if dtype == bool else np.iinfo(dtype).max
+        if maximum * count < 2 ** 32:
+            return np.uint32
+    if dtype == bool or np.issubdtype(dtype, np.integer):
+        return np.int64
+    return np.float64
+
+def box_sum(image, kernel_size=3):
+    """
+    Tính tổng các pixel trong cửa sổ kernel quanh mỗi pixel bằng ảnh tích phân
+    (summed-area table), với padding bằng 0 như mean_filter.
+    Chi phí mỗi pixel không phụ thuộc kích thước kernel.
+    Args:
+        image (ndarray): Ảnh đầu vào (2D, hoặc (H, W, C): mọi kênh được tính cùng lúc).
+        kernel_size (int | tuple): Kích thước kernel, số nguyên hoặc (rows, cols).
+    Returns:
+        ndarray: Tổng theo cửa sổ: uint32 với ảnh uint8/uint16 (xem sum_accumulator), int64 với ảnh số nguyên
+            khác, float64 với ảnh số thực.
+    """
+    kernel_height, kernel_width = kernel_shape(kernel_size)
+    pad_height, pad_width = kernel_height // 2, kernel_width // 2
+    height, width = image.shape[:2]
+
+    # Ảnh tích phân có thêm một hàng và một cột 0 ở đầu: S[i, j] = tổng image_padded[:i, :j]
+    accumulator = sum_accumulator(image.dtype, kernel_height * kernel_width)
+    integral = np.zeros((height + 2 * pad_height + 1, width + 2 * pad_width + 1) + image.shape[2:], dtype=accumulator)
+    integral[1 + pad_height:1 + pad_height + height, 1 + pad_width:1 + pad_width + width] = image
+    np.cumsum(integral, axis=0, out=integral)
+    np.cumsum(integral, axis=1, out=integral)
+
+    output = np.subtract(integral[kernel_height:kernel_height + height, kernel_width:kernel_width + width],
+                         integral[:height, kernel_width:kernel_width + width])
+    output -= integral[kernel_height:kernel_height + height, :width]
+    output += integral[:height, :width]
+    return output
+
+def convolve_direct(image, kernel, dtype=np.float64, out=None, band_elements=2 ** 16):
+    """
+    convolve2d bằng cách cộng dồn các lát cắt dịch chuyển (bỏ qua hệ số 0), theo từng dải hàng.
+    Chỉ một dải (band hàng cộng halo) được chép vào bộ đệm có viền 0, thay vì tạo ảnh padding cỡ toàn ảnh;
+    dải nhỏ nằm trong cache nên các phép cộng dồn cũng nhanh hơn trên cả ảnh.
+    out không được trùng với image (các dải sau còn đọc những hàng halo của ảnh vào).
+    """
+    kernel_height, kernel_width = kernel.shape
+    pad_height, pad_width = kernel_height // 2, kernel_width // 2
+    height, width = image.shape[:2]
+    channels = image.shape[2:]
+    output = np.empty(image.shape, dtype=dtype) if out is None else out
+    kernel = kernel.astype(dtype)  # Hệ số cùng kiểu với bộ đệm để phép nhân không bị nâng lên float64
+
+    band = max(band_elements // ((width + kernel_width - 1) * int(np.prod(channels))), 1)
+    # Các cột viền của bộ đệm không bao giờ bị ghi nên luôn bằng 0
+    padded = np.zeros((band + kernel_height - 1, width + kernel_width - 1) + channels, dtype=dtype)
+    product = np.empty((band, width) + channels, dtype=dtype)
+    taps = list(zip(*np.nonzero(kernel)))
+    for start in range(0, height, band):
+        rows = min(band, height - start)
+        top = start - pad_height  # Hàng ảnh ứng với hàng 0 của bộ đệm
+        first, last = max(top, 0), min(top + rows + kernel_height - 1, height)
+        padded[:first - top] = 0
+        padded[first - top:last - top, pad_width:pad_width + width] = image[first:last]
+        padded[last - top:] = 0
+
+        band_output = output[start:start + rows]
+        if not taps:
+            band_output.fill(0)
+        for index, (a, b) in enumerate(taps):
+            target = band_output if index == 0 else product[:rows]
+            np.multiply(padded[a:a + rows, b:b + width], kernel[a, b], out=target)
+            if index:
+                band_output += target
+    return output
+
+def convolve_axis(image, factor, axis, dtype=np.float64, out=None):
+    """
+    Một lượt 1D của convolve2d theo trục axis (0: dọc, 1: ngang), padding bằng 0.
+    Hệ số bằng nhau được tính bằng tổng tích lũy, các hệ số khác bằng convolve_direct với kernel một hàng/cột.
+    """
+    length = len(factor)
+    if not np.all(factor == factor[0]):
+        return convolve_direct(image, factor.reshape((-1, 1) if axis == 0 else (1, -1)), dtype, out)
+
+    def window(array, part):
+        index = [slice(None)] * array.ndim
+        index[axis] = part
+        return array[tuple(index)]
+
+    # Tổng tích lũy có thêm length // 2 + 1 phần tử 0 ở đầu: S[i] = tổng padded[:i]
+    size = image.shape[axis]
+    shape = list(image.shape)
+    shape[axis] = size + 2 * (length // 2) + 1
+    cumulative = np.zeros(shape, dtype=sum_accumulator(image.dtype, length))
+    window(cumulative, slice(length // 2 + 1, length // 2 + 1 + size))[...] = image
+    np.cumsum(cumulative, axis=axis, out=cumulative)
+    sums = np.subtract(window(cumulative, slice(length, length + size)), window(cumulative, slice(0, size)))
+    return np.multiply(sums, factor[0], out=out, dtype=dtype, casting='unsafe')
+
+def convolve_fft(image, kernel, dtype=np.float64, out=None):
     """
-    Lọc trung bình để làm mượt ảnh.
+    convolve2d qua FFT: tích chập đầy đủ với kernel đã lật, rồi cắt phần ứng với cửa sổ của từng pixel.
+    """
+    kernel_height, kernel_width = kernel.shape
+    height, width = image.shape[:2]
+    full = fft_convolve(image, kernel[::-1, ::-1], dtype)
+    top, left = kernel_height - 1 - kernel_height // 2, kernel_width - 1 - kernel_width // 2
+    result = full[top:top + height, left:left + width]
+    if out is None:
+        return result
+    np.copyto(out, result, casting='unsafe')
+    return out
+
+def mean_filter(image, kernel_size=3, out=None):
+    """
+    Lọc trung bình để làm mượt ảnh: convolve2d với kernel toàn số 1 (tính bằng ảnh tích phân nên chi phí
+    mỗi pixel không phụ thuộc kích thước kernel), chia cho số pixel của kernel. Kết quả giống mean_filter_loop.
+    Với ảnh uint8/uint16, tổng theo cửa sổ là uint32 và phép chia là chia nguyên tại chỗ (bằng phần nguyên
+    của phép chia số thực), không cần ảnh float64 trung gian.
     Args:
         image (ndarray): Ảnh đầu vào.
-        kernel_size (int): Kích thước kernel (phải là số lẻ).
+        kernel_size (int | tuple): Kích thước kernel (phải là số lẻ), số nguyên hoặc (rows, cols).
+        out (ndarray): Mảng nhận kết quả (tùy chọn); có thể chính là image vì ảnh vào được chép vào ảnh tích phân trước.
     Returns:
         ndarray: Ảnh sau xử lý.
     """
-    pad_size = kernel_size // 2
-    padded_image = np.pad(image, pad_size, mode='constant')
+    kernel_height, kernel_width = kernel_shape(kernel_size)
+    sums = convolve2d(image, (np.ones(kernel_height), np.ones(kernel_width)))
+    if sums.dtype == np.uint32:
+        np.floor_divide(sums, kernel_height * kernel_width, out=sums)
+    else:
+        sums = sums / (kernel_height * kernel_width)
+    if out is None:
+        return sums.astype(image.dtype)
+    np.copyto(out, sums, casting='unsafe')
+    return out
+
+def mean_filter_loop(image, kernel_size=3):
+    """
+    Lọc trung bình bằng vòng lặp qua từng pixel (phiên bản gốc, giữ lại để đối chiếu và benchmark).
+    Args:
+        image (ndarray): Ảnh đầu vào.
+        kernel_size (int | tuple): Kích thước kernel (phải là số lẻ), số nguyên hoặc (rows, cols).
+    Returns:
+        ndarray: Ảnh sau xử lý.
+    """
+    kernel_height, kernel_width = kernel_shape(kernel_size)
+    padded_image = np.pad(image, ((kernel_height // 2, kernel_height // 2), (kernel_width // 2, kernel_width // 2)), mode='constant')
     output = np.zeros_like(image)
 
     for i in range(image.shape[0]):
         for j in range(image.shape[1]):
-            region = padded_image[i:i + kernel_size, j:j + kernel_size]
+            region = padded_image[i:i + kernel_height, j:j + kernel_width]
             output[i, j] = np.mean(region)
 
     return output
 
-def median_filter(image, kernel_size=3):
+def median_filter(image, kernel_size=3, out=None):
     """
     Lọc trung vị để giảm nhiễu "Salt and Pepper".
+    Với ảnh uint8 và kernel lẻ, dùng median_filter_histogram (chi phí mỗi pixel không phụ thuộc
+    kích thước kernel), lần lượt trên từng kênh với ảnh nhiều kênh (histogram cột của một kênh vừa
+    trong cache; ghép các kênh thành một ảnh rộng chậm hơn). Các trường hợp khác (uint16, kernel chẵn)
+    dùng median_filter_sorted, xử lý mọi kênh cùng lúc.
+    Args:
+        image (ndarray): Ảnh đầu vào (2D hoặc (H, W, C)).
+        kernel_size (int): Kích thước kernel (phải là số lẻ).
+        out (ndarray): Mảng nhận kết quả (tùy chọn); có thể chính là image vì mọi cách tính đọc từ ảnh padding.
+    Returns:
+        ndarray: Ảnh sau xử lý.
+    """
+    if image.dtype == np.uint8 and kernel_size % 2 == 1:
+        if image.ndim == 3:
+            if out is None:
+                out = np.empty_like(image)
+            for channel in range(image.shape[2]):
+                median_filter_histogram(np.ascontiguousarray(image[..., channel]), kernel_size, out=out[..., channel])
+            return out
+        return median_filter_histogram(image, kernel_size, out=out)
+    return median_filter_sorted(image, kernel_size, out=out)
+
+def median_filter_sorted(image, kernel_size=3, max_window_elements=2 ** 24, out=None):
+    """
+    Lọc trung vị bằng np.median trên các cửa sổ (sliding_window_view), xử lý theo từng khối hàng
+    để giới hạn bộ nhớ tạm. Dùng cho mọi kiểu dữ liệu và kernel chẵn; kết quả giống median_filter_loop.
+    Args:
+        image (ndarray): Ảnh đầu vào (2D hoặc (H, W, C)).
+        kernel_size (int): Kích thước kernel.
+        max_window_elements (int): Số phần tử tối đa của các cửa sổ trong một khối hàng.
+        out (ndarray): Mảng nhận kết quả (tùy chọn, có thể là image).
+    Returns:
+        ndarray: Ảnh sau xử lý.
+    """
+    pad_size = kernel_size // 2
+    padding = [(pad_size, pad_size)] * 2 + [(0, 0)] * (image.ndim - 2)
+    padded_image = np.pad(image, padding, mode='constant')
+    windows = sliding_window_view(padded_image, (kernel_size, kernel_size), axis=(0, 1))
+    output = np.empty_like(image) if out is None else out
+
+    row_elements = max(int(np.prod(windows.shape[1:])), 1)
+    rows = max(max_window_elements // row_elements, 1)
+    height, width = image.shape[:2]
+    for start in range(0, height, rows):
+        # Với kernel chẵn có thêm một cửa sổ mỗi chiều; cửa sổ của pixel (i, j) là padded[i:i + k, j:j + k]
+        # như trong median_filter_loop
+        stop = min(start + rows, height)
+        output[start:stop] = np.median(windows[start:stop, :width], axis=(-2, -1))
+    return output
+
+def median_filter_histogram(image, kernel_size=3, out=None):
+    """
+    Lọc trung vị bằng histogram cột chạy (kiểu Huang / Perreault–Hébert) cho ảnh uint8.
+    Mỗi cột giữ histogram của kernel_size pixel theo chiều dọc, cập nhật O(1) khi xuống một hàng;
+    histogram thô (16 bin) của kernel cho cả hàng được lấy từ tổng tích lũy theo cột; histogram mịn
+    chỉ được cộng cho 16 bin nằm trong bin thô chứa trung vị của từng vị trí, không phải cả 256 bin.
+    Biên được padding bằng 0, kết quả giống median_filter_loop.
+    Args:
+        image (ndarray): Ảnh đầu vào (uint8, 2D).
+        kernel_size (int): Kích thước kernel (phải là số lẻ).
+        out (ndarray): Mảng uint8 nhận kết quả (tùy chọn, có thể là image).
+    Returns:
+        ndarray: Ảnh sau xử lý (uint8).
+    """
+    if image.dtype != np.uint8:
+        raise ValueError("median_filter_histogram only supports uint8 images.")
+    if kernel_size < 1 or kernel_size % 2 == 0:
+        raise ValueError("Kernel size must be a positive odd number.")
+
+    height, width = image.shape
+    pad_size = kernel_size // 2
+    padded_image = np.pad(image, pad_size, mode='constant')
+    padded_width = padded_image.shape[1]
+    rank = kernel_size * kernel_size // 2  # Trung vị là phần tử thứ rank (tính từ 0) sau khi sắp xếp
+
+    # Số đếm trong cửa sổ không vượt quá kernel_size², nên có thể dùng uint16 với phép cộng tràn vòng:
+    # hiệu của hai tổng tích lũy vẫn đúng theo modulo 2^16.
+    count_dtype = np.uint16 if kernel_size * kernel_size < 2 ** 16 else np.uint32
+    fine_histograms = np.zeros((padded_width, 256), dtype=count_dtype)
+    coarse_histograms = np.zeros((padded_width, 16), dtype=count_dtype)
+    coarse_prefix = np.zeros((padded_width + 1, 16), dtype=count_dtype)
+
+    columns = np.arange(padded_width)
+    output_columns = np.arange(width)
+    fine_offsets = np.arange(16)
+    output = np.empty_like(image) if out is None else out
+
+    # Mỗi cột chỉ có đúng một pixel được thêm/bớt nên chỉ số không bị trùng lặp
+    def add_row(row):
+        fine_histograms[columns, row] += 1
+        coarse_histograms[columns, row >> 4] += 1
+
+    def remove_row(row):
+        fine_histograms[columns, row] -= 1
+        coarse_histograms[columns, row >> 4] -= 1
+
+    for row in padded_image[:kernel_size - 1]:
+        add_row(row)
+
+    for i in range(height):
+        add_row(padded_image[i + kernel_size - 1])
+
+        # Tầng thô: histogram 16 bin của kernel cho mọi cột, chọn bin chứa trung vị
+        np.cumsum(coarse_histograms, axis=0, out=coarse_prefix[1:])
+        coarse_kernel = coarse_prefix[kernel_size:] - coarse_prefix[:width]
+        coarse_cumulative = np.cumsum(coarse_kernel, axis=1, dtype=np.int64)
+        coarse_bin = (coarse_cumulative <= rank).sum(axis=1)
+        below = coarse_cumulative[output_columns, coarse_bin] - coarse_kernel[output_columns, coarse_bin]
+
+        # Tầng mịn: chỉ 16 bin trong bin thô đã chọn
+        if kernel_size <= SMALL_MEDIAN_KERNEL:
+            # Kernel nhỏ: cộng trực tiếp kernel_size cột, O(kernel_size * 16) mỗi vị trí
+            fine_bins = coarse_bin[:, None] * 16 + fine_offsets
+            fine_kernel = fine_histograms[output_columns[:, None], fine_bins]
+            for offset in range(1, kernel_size):
+                fine_kernel += fine_histograms[output_columns[:, None] + offset, fine_bins]
+        else:
+            # Tổng tích lũy theo cột chỉ trên 16 bin của từng bin thô xuất hiện trong hàng
+            # (nhiều nhất 16 bin thô), và chỉ trên đoạn cột mà bin đó cần
+            fine_kernel = np.empty((width, 16), dtype=count_dtype)
+            for bucket in np.unique(coarse_bin):
+                selected = np.flatnonzero(coarse_bin == bucket)
+                start, stop = selected[0], selected[-1] + kernel_size
+                prefix = np.zeros((stop - start + 1, 16), dtype=count_dtype)
+                np.cumsum(fine_histograms[start:stop, bucket * 16:(bucket + 1) * 16], axis=0, out=prefix[1:])
+                fine_kernel[selected] = prefix[selected - start + kernel_size] - prefix[selected - start]
+        fine_cumulative = np.cumsum(fine_kernel, axis=1, dtype=np.int64) + below[:, None]
+        output[i] = coarse_bin * 16 + (fine_cumulative <= rank).sum(axis=1)
+
+        remove_row(padded_image[i])
+
+    return output
+
+def median_filter_loop(image, kernel_size=3):
+    """
+    Lọc trung vị bằng vòng lặp qua từng pixel (phiên bản gốc, giữ lại để đối chiếu và benchmark).
     Args:
         image (ndarray): Ảnh đầu vào.
         kernel_size (int): Kích thước kernel (phải là số lẻ).
@@ -52,45 +443,61 @@ def median_filter_opencv(image, kernel_size=3):
     return cv2.medianBlur(image, kernel_size)
 
 
-
-
-def laplacian_filter(image):
+def laplacian_filter(image, kernel=LAPLACIAN_KERNEL, out=None):
     """
     Áp dụng bộ lọc Laplacian để phát hiện biên mà không dùng OpenCV.
+    Ảnh nhiều kênh được chuẩn hóa chung cho mọi kênh (giống laplacian_filter_opencv).
     Args:
-        image (ndarray): Ảnh đầu vào (grayscale).
+        image (ndarray): Ảnh đầu vào (grayscale hoặc (H, W, C)).
+        kernel (ndarray): Kernel Laplacian (LAPLACIAN_KERNEL hoặc LAPLACIAN_KERNEL_DIAGONAL).
+        out (ndarray): Mảng uint8 nhận kết quả (tùy chọn).
     Returns:
         ndarray: Ảnh sau khi áp dụng bộ lọc Laplacian (kiểu uint8).
     """
-    # Kernel Laplacian 3x3
-    laplacian_kernel = np.array([[0, -1, 0],
-                                 [-1, 4, -1],
-                                 [0, -1, 0]])
-
-    # Padding để giữ kích thước ảnh không thay đổi
-    pad_size = 1
-    padded_image = np.pad(image, pad_size, mode='constant')
+    return normalize_laplacian(laplacian_response(image, kernel), out=out)
 
-    # Khởi tạo mảng kết quả
-    output = np.zeros_like(image, dtype=np.float64)
-
-    # Lặp qua từng pixel và áp dụng kernel Laplacian
-    for i in range(image.shape[0]):
-        for j in range(image.shape[1]):
-            region = padded_image[i:i + 3, j:j + 3]  # Lấy vùng 3x3
-            output[i, j] = np.sum(region * laplacian_kernel)  # Áp dụng kernel
+def laplacian_response(image, kernel=LAPLACIAN_KERNEL, dtype=np.float32, out=None):
+    """
+    Đáp ứng Laplacian (chưa chuẩn hóa) với padding bằng 0 ở biên, tính bằng convolve2d.
+    Chỉ phụ thuộc lân cận 3x3 nên có thể tính theo từng dải ảnh rồi ghép lại.
+    Mặc định tính ở float32: với ảnh uint8/uint16 và kernel hệ số nguyên, mọi giá trị là số nguyên
+    nhỏ hơn 2^24 nên kết quả chính xác như float64.
+    Args:
+        image (ndarray): Ảnh đầu vào (grayscale hoặc (H, W, C)).
+        kernel (ndarray): Kernel Laplacian 3x3.
+        dtype: Kiểu của đáp ứng (np.float32 hoặc np.float64).
+        out (ndarray): Mảng nhận đáp ứng (tùy chọn).
+    Returns:
+        ndarray: Đáp ứng kiểu dtype.
+    """
+    return convolve2d(image, kernel, dtype=dtype, out=out)
 
+def normalize_laplacian(response, out=None, chunk_elements=2 ** 18):
+    """
+    Chuẩn hóa đáp ứng Laplacian của cả ảnh về uint8 (min/max toàn cục).
+    response bị ghi đè bằng giá trị tuyệt đối của nó; phép co giãn tính ở float64 theo từng khối hàng
+    (giống hệt khi tính trên cả ảnh float64) nên không cần thêm ảnh float64 nào cỡ toàn ảnh.
+    Args:
+        response (ndarray): Đáp ứng Laplacian (float32 hoặc float64).
+        out (ndarray): Mảng uint8 nhận kết quả (tùy chọn).
+        chunk_elements (int): Số phần tử tối đa của một khối hàng.
+    Returns:
+        ndarray: Ảnh uint8.
+    """
     # Lấy giá trị tuyệt đối để loại bỏ giá trị âm
-    output_abs = np.abs(output)
-
-    # Chuẩn hóa giá trị về khoảng [0, 255]
-    output_normalized = (output_abs - output_abs.min()) / (output_abs.max() - output_abs.min()) * 255
-
-    # Chuyển đổi về kiểu uint8
-    output_uint8 = output_normalized.astype(np.uint8)
-
-    return output_uint8
+    magnitude = np.abs(response, out=response)
+    low, high = float(magnitude.min()), float(magnitude.max())
 
+    # Chuẩn hóa giá trị về khoảng [0, 255] rồi chuyển về uint8
+    output = np.empty(magnitude.shape, dtype=np.uint8) if out is None else out
+    rows = max(chunk_elements // max(magnitude[0].size, 1), 1)
+    for start in range(0, magnitude.shape[0], rows):
+        chunk = magnitude[start:start + rows].astype(np.float64)
+        chunk -= low
+        chunk /= high - low
+        chunk *= 255
+        output[start:start + rows] = chunk
+    return output
 
 def laplacian_filter_opencv(image):
     """
@@ -0,0 +1,149 @@
+import argparse
+import os
+
+import numpy as np
+
+from image_processing.lazy import lazy_import
+from image_processing.registry import OPERATORS
+
+Image = lazy_import('PIL.Image')
+
+try:
+    import tifffile
+except ImportError:  # tifffile chỉ cần khi đọc/ghi TIFF theo kiểu memory-mapped
+    tifffile = None
+
+# Các toán tử cục bộ có thể chạy theo tile: tên -> (hàm(image, kernel_size=...), số lượt kernel),
+# lấy từ registry (Operator.passes > 0). Halo cần thiết = số lượt * (kernel_size // 2). Các phép toàn cục
+# (cân bằng histogram, Otsu, Laplacian có chuẩn hóa min/max, lọc miền tần số) không chạy theo tile được.
+TILEABLE_OPERATORS = {name: (operator.function, operator.passes) for name, operator in OPERATORS.items()
+                      if operator.passes and operator.output == 'image'}
+
+def iter_tiles(shape, tile_height, tile_width=None):
+    """
+    Sinh các tile (row_start, row_stop, col_start, col_stop) phủ kín ảnh.
+    Args:
+        shape (tuple): Kích thước ảnh (rows, cols).
+        tile_height (int): Chiều cao tile.
+        tile_width (int): Chiều rộng tile, None để dùng cả chiều rộng ảnh (xử lý theo dải).
+    """
+    height, width = shape[:2]
+    tile_width = tile_width or width
+    for row_start in range(0, height, tile_height):
+        for col_start in range(0, width, tile_width):
+            yield row_start, min(row_start + tile_height, height), col_start, min(col_start + tile_width, width)
+
+def process_tile(source, operator, halo, out, bounds):
+    """
+    Xử lý một tile: đọc tile kèm halo từ source, chạy toán tử và ghi phần lõi (bỏ halo) vào out.
+    Args:
+        bounds (tuple): (row_start, row_stop, col_start, col_stop) của phần lõi.
+    """
+    height, width = source.shape[:2]
+    halo_height, halo_width = (halo, halo) if np.isscalar(halo) else halo
+    row_start, row_stop, col_start, col_stop = bounds
+
+    read_row_start = max(row_start - halo_height, 0)
+    read_row_stop = min(row_stop + halo_height, height)
+    read_col_start = max(col_start - halo_width, 0)
+    read_col_stop = min(col_stop + halo_width, width)
+
+    tile = np.asarray(source[read_row_start:read_row_stop, read_col_start:read_col_stop])
+    result = operator(tile)
+
+    top, left = row_start - read_row_start, col_start - read_col_start
+    out[row_start:row_stop, col_start:col_stop] = result[top:top + row_stop - row_start, left:left + col_stop - col_start]
+
+def process_tiled(source, operator, halo, out, tile_height=512, tile_width=None):
+    """
+    Chạy một toán tử cục bộ trên ảnh theo từng tile có vùng chồng lấn (halo) và ghi kết quả vào out.
+    Tại biên ảnh, tile không có halo nên padding bằng 0 của chính toán tử vẫn cho kết quả giống
+    khi xử lý cả ảnh; bên trong ảnh, phần bị ảnh hưởng bởi padding nằm trong halo và bị cắt bỏ.
+    Bộ nhớ tối đa tỉ lệ với kích thước tile chứ không phải kích thước ảnh.
+    Args:
+        source (array-like): Ảnh nguồn 2D hỗ trợ cắt lát (ndarray, np.memmap, ...).
+        operator (callable): Hàm nhận một tile ndarray và trả về ảnh cùng kích thước.
+        halo (int | tuple): Độ chồng lấn theo (hàng, cột), tối thiểu bằng bán kính kernel.
+        out (array-like): Mảng đích cùng kích thước với source (ndarray, np.memmap, ...).
+        tile_height (int): Chiều cao tile.
+        tile_width (int): Chiều rộng tile, None để xử lý theo dải cả chiều rộng.
+    Returns:
+        out
+    """
+    for bounds in iter_tiles(source.shape, tile_height, tile_width):
+        process_tile(source, operator, halo, out, bounds)
+
+    if hasattr(out, 'flush'):
+        out.flush()
+    return out
+
+def open_image_source(path):
+    """
+    Mở ảnh nguồn để đọc theo tile.
+    - .npy: memory-mapped (np.load với mmap_mode='r').
+    - .tif/.tiff không nén: memory-mapped qua tifffile (nếu đã cài), ngược lại đọc toàn bộ.
+    - Định dạng khác: giải mã toàn bộ bằng PIL (không giới hạn được bộ nhớ phía đầu vào).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        return np.load(path, mmap_mode='r')
+    if extension in ('.tif', '.tiff') and tifffile is not None:
+        try:
+            return tifffile.memmap(path, mode='r')
+        except ValueError:
+            # TIFF nén hoặc không liên tục trên đĩa: không memory-map được
+            return tifffile.imread(path)
+    return np.asarray(Image.open(path))
+
+def create_output(path, shape, dtype):
+    """
+    Tạo mảng đích memory-mapped trên đĩa (.npy, hoặc .tif/.tiff nếu có tifffile).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        return np.lib.format.open_memmap(path, mode='w+', shape=shape, dtype=dtype)
+    if extension in ('.tif', '.tiff'):
+        if tifffile is None:
+            raise ValueError("Writing memory-mapped TIFF output requires the tifffile package.")
+        return tifffile.memmap(path, shape=shape, dtype=dtype)
+    raise ValueError("Tiled output must be a .npy or .tif/.tiff file.")
+
+def process_file_tiled(input_path, output_path, method, kernel_size=3, tile_height=512, tile_width=None):
+    """
+    Xử lý một file ảnh lớn theo tile và ghi kết quả từng dải vào file memory-mapped.
+    Args:
+        input_path (str): File ảnh nguồn (grayscale 2D).
+        output_path (str): File kết quả (.npy hoặc .tif/.tiff).
+        method (str): Tên toán tử trong TILEABLE_OPERATORS.
+        kernel_size (int): Kích thước kernel.
+        tile_height (int): Chiều cao tile.
+        tile_width (int): Chiều rộng tile, None để xử lý theo dải cả chiều rộng.
+    Returns:
+        tuple: Kích thước ảnh kết quả.
+    """
+    if method not in TILEABLE_OPERATORS:
+        raise ValueError(f"Method '{method}' cannot be processed in tiles.")
+    operator, passes = TILEABLE_OPERATORS[method]
+
+    source = open_image_source(input_path)
+    if source.ndim != 2:
+        raise ValueError("Tiled processing expects a single-channel (2D) image.")
+    out = create_output(output_path, source.shape, source.dtype)
+    process_tiled(source, lambda tile: operator(tile, kernel_size=kernel_size), passes * (kernel_size // 2), out,
+                  tile_height=tile_height, tile_width=tile_width)
+    shape = out.shape
+    del out  # Đóng memmap để dữ liệu được ghi hết ra đĩa
+    return shape
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process an image larger than RAM in tiles")
+    parser.add_argument('input', help="Ảnh nguồn (.npy, .tif/.tiff, hoặc định dạng PIL đọc được)")
+    parser.add_argument('output', help="File kết quả (.npy hoặc .tif/.tiff)")
+    parser.add_argument('--method', required=True, choices=sorted(TILEABLE_OPERATORS))
+    parser.add_argument('--kernel-size', type=int, default=3)
+    parser.add_argument('--tile-height', type=int, default=512)
+    parser.add_argument('--tile-width', type=int, default=None)
+    args = parser.parse_args()
+
+    shape = process_file_tiled(args.input, args.output, args.method, args.kernel_size, args.tile_height, args.tile_width)
+    print(f"Wrote {args.output} ({shape[0]}x{shape[1]})")
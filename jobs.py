@@ -0,0 +1,339 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+from metrics import record_spans, traced
+from processing import color_mode, load_image, process_array
+
+# Các trạng thái của một job. queued/decoding/processing do tiến trình worker cập nhật;
+# done/failed/cancelled là trạng thái cuối.
+QUEUED = 'queued'
+DECODING = 'decoding'
+PROCESSING = 'processing'
+CANCELLING = 'cancelling'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+class QueueFullError(RuntimeError):
+    """
+    Hàng đợi đã đủ số job chưa hoàn thành.
+    """
+
+class JobCancelledError(RuntimeError):
+    """
+    Job bị hủy trong khi đang chạy (worker dừng ở mốc kiểm tra kế tiếp).
+    """
+
+class JobStore:
+    """
+    Trạng thái job dùng chung giữa các tiến trình server (các worker của gunicorn), để /jobs/<id> trả lời
+    được ở mọi worker chứ không chỉ ở worker đã nhận job. Mỗi job là một file JSON <job_id>.json trong folder
+    ({'status', 'context' (khi done), 'error' (khi failed)}), được ghi nguyên tử (file tạm rồi os.replace).
+    Yêu cầu hủy từ worker khác là file <job_id>.cancel, được tiến trình chạy job kiểm tra giữa các giai đoạn.
+    Chỉ giữ tên thư mục nên gửi được sang tiến trình worker của pool (pickle).
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, job_id, suffix='.json'):
+        return os.path.join(self.folder, f"{job_id}{suffix}")
+
+    def write(self, job_id, status, **fields):
+        record = dict(fields, status=status)
+        temporary = self.path(job_id, f".{os.getpid()}-{threading.get_ident()}.tmp")
+        with open(temporary, 'w') as f:
+            json.dump(record, f)
+        os.replace(temporary, self.path(job_id))
+
+    def read(self, job_id):
+        """
+        Returns:
+            dict | None: Bản ghi của job, hoặc None nếu không có (mã job chỉ gồm chữ và số, như uuid4().hex).
+        """
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self.path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def request_cancel(self, job_id):
+        open(self.path(job_id, '.cancel'), 'w').close()
+
+    def cancel_requested(self, job_id):
+        return os.path.exists(self.path(job_id, '.cancel'))
+
+    def purge(self, ttl):
+        """
+        Xóa các file không được cập nhật quá ttl giây, trừ bản ghi của job chưa kết thúc.
+        """
+        now = time.time()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if now - os.path.getmtime(path) <= ttl:
+                    continue
+                if name.endswith('.json') and self.read(name[:-len('.json')])['status'] not in FINAL_STATES:
+                    continue
+                os.remove(path)
+            except (OSError, ValueError, TypeError, KeyError):
+                pass  # Tiến trình khác vừa xóa hoặc đang ghi file này
+
+def run_job(job_id, progress, upload_path, method_type, params, result_folder, stem, auto_min_pixels=None,
+            store=None):
+    """
+    Hàm chạy trong tiến trình worker: đọc ảnh, xử lý và lưu kết quả.
+    Args:
+        job_id (str): Mã job.
+        progress (DictProxy): Từ điển dùng chung job_id -> trạng thái.
+        upload_path (str): File ảnh đã upload.
+        method_type (str): Phương pháp xử lý.
+        params (dict): Các tham số của form.
+        result_folder (str): Thư mục lưu kết quả.
+        stem (str): Phần tên dùng để đặt tên file kết quả.
+        auto_min_pixels (int): Xem processing.plan_request.
+        store (JobStore): Nơi ghi giai đoạn hiện tại cho các tiến trình server khác (None để bỏ qua).
+    Returns:
+        tuple: (context để render result.html, các span thời gian của job cho metrics.record_spans).
+    """
+    def advance(stage):
+        # Không thể dừng một worker đang tính toán từ bên ngoài: việc hủy được kiểm tra giữa các giai đoạn
+        if progress.get(job_id) == CANCELLING or (store is not None and store.cancel_requested(job_id)):
+            raise JobCancelledError("Job was cancelled")
+        progress[job_id] = stage
+        if store is not None:
+            store.write(job_id, stage)
+
+    with traced('job') as trace:
+        advance(DECODING)
+        image_array = load_image(upload_path, color_mode(params))
+        advance(PROCESSING)
+        context = process_array(image_array, method_type, params, result_folder, stem, auto_min_pixels)
+    return context, trace.spans
+
+class JobQueue:
+    """
+    Hàng đợi job chạy trên ProcessPoolExecutor, để các phép lọc thuần Python không chiếm luồng xử lý request.
+    - Số worker mặc định bằng số lõi CPU.
+    - Số job chưa hoàn thành (đang chờ + đang chạy) bị giới hạn bởi max_pending; vượt quá thì submit
+      báo QueueFullError. Các tác vụ của submit_task (từng ảnh của /batch) cũng được tính vào giới hạn này.
+    - Job đang chờ được hủy ngay; job đang chạy được đánh dấu và dừng ở mốc kiểm tra kế tiếp.
+    - Job đã xong được giữ ttl giây rồi bị xóa khỏi bảng trạng thái.
+    Pool và Manager chỉ được tạo ở lần submit đầu tiên; initializer(*initargs) chạy một lần trong mỗi
+    tiến trình worker khi nó khởi động (ví dụ processing.warm_up).
+    Với store (JobStore), trạng thái và kết quả của job được ghi thêm vào đó: status và cancel của một hàng đợi
+    khác (tiến trình server khác) đọc và hủy được các job này. Job của tiến trình khác đang chờ chỉ dừng khi
+    bắt đầu chạy (mốc kiểm tra đầu tiên), vì chỉ tiến trình sở hữu mới bỏ được nó khỏi pool.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, ttl=3600, initializer=None, initargs=(), store=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.ttl = ttl
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self.store = store
+        self.executor = None
+        self.manager = None
+        self.progress = None
+        self.jobs = {}  # job_id -> {'future', 'created', 'finished', 'context', 'cancelled'}
+        self.tasks = 0  # Số tác vụ của submit_task chưa hoàn thành
+        self.lock = threading.Lock()
+        # Báo cho submit_task đang chờ mỗi khi một job hoặc tác vụ hoàn thành
+        self.capacity = threading.Condition(self.lock)
+
+    def start(self):
+        if self.executor is None:
+            self.manager = Manager()
+            self.progress = self.manager.dict()
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer,
+                                                initargs=self.initargs)
+
+    def pending(self):
+        """
+        Số job và tác vụ chưa hoàn thành.
+        """
+        return self.tasks + sum(1 for job in self.jobs.values()
+                                if job['future'] is not None and not job['future'].done())
+
+    def full(self):
+        with self.lock:
+            return self.pending() >= self.max_pending
+
+    def submit(self, upload_path, method_type, params, result_folder, stem, on_done=None, auto_min_pixels=None):
+        """
+        Đưa một job vào hàng đợi.
+        Args:
+            on_done (callable): Gọi với context khi job hoàn thành thành công (trong tiến trình chính).
+        Returns:
+            str: Mã job.
+        """
+        with self.lock:
+            self.purge()
+            if self.pending() >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs).")
+            self.start()
+
+            job_id = uuid.uuid4().hex
+            self.progress[job_id] = QUEUED
+            if self.store is not None:
+                self.store.write(job_id, QUEUED)
+            future = self.executor.submit(run_job, job_id, self.progress, upload_path, method_type,
+                                          dict(params), result_folder, stem, auto_min_pixels, self.store)
+            self.jobs[job_id] = {'future': future, 'created': time.time(), 'finished': None, 'context': None,
+                                 'cancelled': False}
+
+        def finished(future):
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    job['finished'] = time.time()
+                discarded = job is None or job['cancelled']
+                self.capacity.notify_all()
+            if self.store is not None and job is not None:
+                self.store.write(job_id, **self.status(job_id))
+            if future.cancelled() or future.exception() is not None:
+                return
+            context, spans = future.result()
+            record_spans(spans)
+            if on_done is not None and not discarded:
+                on_done(context)
+
+        future.add_done_callback(finished)
+        return job_id
+
+    def submit_task(self, function, *args):
+        """
+        Chạy function(*args) trên pool của hàng đợi, tính vào max_pending như một job. Khi hàng đợi đầy,
+        chờ tới lúc có job hoặc tác vụ hoàn thành thay vì báo lỗi: người gọi (batch.run_batch) đã tự giới hạn
+        số tác vụ đang chạy dở, còn các job mới của /jobs thấy hàng đợi đầy và nhận QueueFullError.
+        Returns:
+            Future
+        """
+        with self.capacity:
+            while self.pending() >= self.max_pending:
+                self.capacity.wait()
+            self.start()
+            future = self.executor.submit(function, *args)
+            self.tasks += 1
+        future.add_done_callback(self.task_done)
+        return future
+
+    def task_done(self, future):
+        with self.capacity:
+            self.tasks -= 1
+            self.capacity.notify_all()
+
+    def add_finished(self, context):
+        """
+        Ghi nhận một job đã có sẵn kết quả (ví dụ lấy từ cache) mà không cần chạy worker.
+        """
+        with self.lock:
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            self.jobs[job_id] = {'future': None, 'created': now, 'finished': now, 'context': context,
+                                 'cancelled': False}
+        if self.store is not None:
+            self.store.write(job_id, DONE, context=context)
+        return job_id
+
+    def status(self, job_id):
+        """
+        Trạng thái của job.
+        Returns:
+            dict | None: {'status', 'context' (khi done), 'error' (khi failed)}, hoặc None nếu không có job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return self.shared_status(job_id)
+
+        future = job['future']
+        if future is None:
+            return {'status': DONE, 'context': job['context']}
+        if future.cancelled() or (job['cancelled'] and future.done()):
+            return {'status': CANCELLED}
+        if future.done():
+            error = future.exception()
+            if isinstance(error, JobCancelledError):
+                return {'status': CANCELLED}
+            if error is not None:
+                return {'status': FAILED, 'error': str(error)}
+            return {'status': DONE, 'context': future.result()[0]}
+        if job['cancelled'] or (self.store is not None and self.store.cancel_requested(job_id)):
+            return {'status': CANCELLING}
+        return {'status': self.progress.get(job_id, QUEUED)}
+
+    def shared_status(self, job_id):
+        """
+        Trạng thái của job do tiến trình server khác nhận, đọc từ store (xem status).
+        """
+        record = self.store.read(job_id) if self.store is not None else None
+        if record is None:
+            return None
+        if record['status'] not in FINAL_STATES and self.store.cancel_requested(job_id):
+            record['status'] = CANCELLING
+        return record
+
+    def cancel(self, job_id):
+        """
+        Hủy job. Job đang chờ bị bỏ khỏi hàng đợi; job đang chạy dừng ở mốc kiểm tra kế tiếp
+        (một phép lọc đã bắt đầu vẫn chạy hết, nhưng kết quả bị bỏ).
+        Returns:
+            bool: False nếu không có job hoặc job đã kết thúc.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            # Job của tiến trình server khác: để tiến trình chạy job tự dừng ở mốc kiểm tra kế tiếp
+            record = self.shared_status(job_id)
+            if record is None or record['status'] in FINAL_STATES:
+                return False
+            self.store.request_cancel(job_id)
+            return True
+        if job['future'] is None or job['future'].done():
+            return False
+        job['cancelled'] = True
+        if not job['future'].cancel():
+            self.progress[job_id] = CANCELLING
+        return True
+
+    def purge(self):
+        """
+        Xóa các job đã kết thúc quá ttl giây (gọi khi đang giữ lock).
+        """
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job['finished'] is not None and now - job['finished'] > self.ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+            if self.progress is not None:
+                self.progress.pop(job_id, None)
+        if self.store is not None:
+            self.store.purge(self.ttl)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.manager.shutdown()
+            self.executor = None
+
+class TaskExecutor:
+    """
+    Executor chỉ có submit, chạy trên pool của một JobQueue qua submit_task (ví dụ executor của batch.run_batch).
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def submit(self, function, *args):
+        return self.queue.submit_task(function, *args)
@@ -0,0 +1,274 @@
+import heapq
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+# Mốc histogram mặc định: thời gian (giây) và số pixel mỗi lần chạy toán tử
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PIXEL_BUCKETS = (2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26)
+
+class HistogramMetric:
+    """
+    Histogram kiểu Prometheus: số quan sát theo từng mốc (tích lũy khi xuất), tổng và số lượng.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+def format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """
+    Các counter và histogram của server, xuất ra định dạng text của Prometheus (GET /metrics).
+    Mỗi metric được khai báo một lần bằng describe; mỗi bộ nhãn (labels) là một chuỗi số liệu riêng.
+    """
+
+    def __init__(self):
+        self.metrics = {}  # name -> {'type', 'help', 'buckets', 'series': {labels: value hoặc HistogramMetric}}
+        self.lock = threading.Lock()
+
+    def describe(self, name, type, help, buckets=SECONDS_BUCKETS):
+        self.metrics[name] = {'type': type, 'help': help, 'buckets': buckets, 'series': {}}
+
+    def increment(self, name, labels=None, amount=1):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            series = self.metrics[name]['series']
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, labels=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            self.metrics[name]['series'][key] = value
+
+    def observe(self, name, value, labels=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            metric = self.metrics[name]
+            if key not in metric['series']:
+                metric['series'][key] = HistogramMetric(metric['buckets'])
+            metric['series'][key].observe(value)
+
+    def render(self):
+        """
+        Nội dung cho GET /metrics (text/plain; version=0.0.4).
+        """
+        lines = []
+        with self.lock:
+            for name, metric in self.metrics.items():
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['type']}")
+                for labels, value in sorted(metric['series'].items()):
+                    if metric['type'] != 'histogram':
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels, ('le', format_value(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(labels, ('le', '+Inf'))} {value.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(value.sum)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = MetricsRegistry()
+METRICS.describe('image_processing_requests_total', 'counter', "Processing requests by endpoint and HTTP status.")
+METRICS.describe('image_processing_request_seconds', 'histogram', "Processing request latency by endpoint.")
+METRICS.describe('image_processing_stage_seconds', 'histogram',
+                 "Time spent in each request stage (read_upload, plan, save_upload, decode, convert, operator, encode).")
+METRICS.describe('image_processing_operator_seconds', 'histogram', "Operator run time by operator.")
+METRICS.describe('image_processing_operator_pixels', 'histogram', "Pixels processed per operator run.",
+                 buckets=PIXEL_BUCKETS)
+METRICS.describe('image_processing_lazy_import_seconds', 'gauge',
+                 "Time spent importing each lazily loaded module on first use (OpenCV, SciPy, PIL, operator modules).")
+METRICS.describe('image_processing_warmup_seconds', 'gauge', "Time spent in each warm-up step before serving.")
+
+# ---------------------------------------------------------------------------
+# Span thời gian theo từng giai đoạn của một request
+# ---------------------------------------------------------------------------
+
+class Trace:
+    """
+    Các span thời gian của một request (hoặc một job trong tiến trình worker).
+    Mỗi span là (giai đoạn, nhãn, số giây); span 'operator' có nhãn operator và pixels.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((stage, labels, time.perf_counter() - start))
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+local = threading.local()
+
+@contextmanager
+def traced(name):
+    """
+    Đặt một Trace làm trace hiện tại của luồng trong khối with; span() ghi vào trace này.
+    """
+    trace = Trace(name)
+    previous = getattr(local, 'trace', None)
+    local.trace = trace
+    try:
+        yield trace
+    finally:
+        local.trace = previous
+
+def current_trace():
+    return getattr(local, 'trace', None)
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Đo thời gian một giai đoạn của trace hiện tại; không làm gì nếu luồng không có trace
+    (ví dụ gọi trực tiếp các hàm xử lý ngoài server).
+    """
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage, **labels):
+        yield
+
+def add_span(stage, seconds, **labels):
+    """
+    Ghi một span đã đo sẵn (ví dụ Pipeline.timings) vào trace hiện tại, nếu có.
+    """
+    trace = current_trace()
+    if trace is not None:
+        trace.spans.append((stage, labels, seconds))
+
+def record_spans(spans):
+    """
+    Đưa các span vào METRICS: thời gian theo giai đoạn, cộng thêm thời gian và số pixel theo toán tử.
+    Job chạy ở tiến trình worker trả spans về tiến trình chính để ghi ở đây.
+    """
+    for stage, labels, seconds in spans:
+        METRICS.observe('image_processing_stage_seconds', seconds, {'stage': stage})
+        if stage == 'operator':
+            operator = {'operator': labels['operator']}
+            METRICS.observe('image_processing_operator_seconds', seconds, operator)
+            METRICS.observe('image_processing_operator_pixels', labels['pixels'], operator)
+
+def record_request(endpoint, status, trace):
+    METRICS.increment('image_processing_requests_total', {'endpoint': endpoint, 'status': str(status)})
+    METRICS.observe('image_processing_request_seconds', trace.elapsed(), {'endpoint': endpoint})
+    record_spans(trace.spans)
+
+# ---------------------------------------------------------------------------
+# Profiler lấy mẫu cho các request chậm nhất
+# ---------------------------------------------------------------------------
+
+def collapsed_stack(frame):
+    """
+    Ngăn xếp lời gọi của frame dạng 'file:hàm;file:hàm;...' (từ ngoài vào trong), định dạng của flame graph.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu: một luồng nền đọc ngăn xếp của luồng cần đo mỗi interval giây (sys._current_frames)
+    và đếm số lần mỗi ngăn xếp xuất hiện. Chi phí không phụ thuộc số lời gọi hàm như cProfile, nên có thể
+    bật cho mọi request; thời gian trong mã C (NumPy, OpenCV) được tính cho hàm Python đang gọi nó.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapsed_stack(frame)] += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.samples
+
+class SlowestProfiles:
+    """
+    Giữ profile của limit request chậm nhất trong folder (mỗi request một file .txt dạng collapsed stack,
+    dùng được với flamegraph.pl hoặc speedscope); profile của request nhanh hơn bị bỏ hoặc bị xóa khỏi đĩa.
+    """
+
+    def __init__(self, limit, folder):
+        self.limit = limit
+        self.folder = folder
+        self.profiles = []  # heap (seconds, path)
+        self.lock = threading.Lock()
+
+    def offer(self, seconds, name, samples, interval):
+        """
+        Lưu profile nếu request nằm trong limit request chậm nhất. Các ký tự ngoài chữ, số, '_', '-' của name
+        (có thể lấy từ dữ liệu request) được thay bằng '_' trước khi đặt tên file.
+        Returns:
+            str | None: Đường dẫn file đã ghi.
+        """
+        with self.lock:
+            if len(self.profiles) >= self.limit and seconds <= self.profiles[0][0]:
+                return None
+            os.makedirs(self.folder, exist_ok=True)
+            name = re.sub(r'[^A-Za-z0-9_-]', '_', name)[:100]
+            path = os.path.join(self.folder, f"{int(seconds * 1000):07d}ms_{name}_{uuid.uuid4().hex[:8]}.txt")
+            with open(path, 'w') as f:
+                f.write(f"# {name}: {seconds:.3f} s, {sum(samples.values())} samples every {interval * 1000:g} ms\n")
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            heapq.heappush(self.profiles, (seconds, path))
+            if len(self.profiles) > self.limit:
+                _, evicted = heapq.heappop(self.profiles)
+                if os.path.exists(evicted):
+                    os.remove(evicted)
+            return path
+
+    def stats(self):
+        with self.lock:
+            return [{'seconds': round(seconds, 3), 'path': path} for seconds, path in sorted(self.profiles, reverse=True)]
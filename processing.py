@@ -0,0 +1,430 @@
+import io
+import os
+import time
+
+import numpy as np
+from image_processing.color import (COLOR_MODES, apply_luma, convert_to_grayscale, merge_alpha, normalize_depth,
+                                    split_alpha, to_uint8, working_shape)
+from image_processing.frequency_enhancement import preload_transfer_functions
+from image_processing.lazy import LazyFunction, import_deferred, lazy_import
+from image_processing.parallel import KERNEL_OPERATORS, PARALLEL_METHODS, parallel_filter
+from image_processing.pipeline import Pipeline
+from image_processing.registry import OPERATORS, RADII_PARAMETER, choose_operator
+from metrics import METRICS, add_span, span
+
+# OpenCV và PIL chỉ được import ở lần giải mã/mã hóa ảnh đầu tiên (hoặc bởi warm_up)
+Image = lazy_import('PIL.Image')
+cv2 = lazy_import('cv2')
+preload_quality_tables = LazyFunction('image_processing.compress', 'preload_quality_tables')
+
+# Ảnh từ PARALLEL_MIN_PIXELS pixel trở lên được xử lý song song theo dải hàng trên PARALLEL_WORKERS luồng
+# (image_processing.parallel, chỉ với các phương pháp trong PARALLEL_METHODS); PARALLEL_WORKERS=1 để tắt
+PARALLEL_MIN_PIXELS = int(os.environ.get('PARALLEL_MIN_PIXELS', 4 * 1024 * 1024))
+PARALLEL_WORKERS = int(os.environ.get('PARALLEL_WORKERS', os.cpu_count() or 1))
+
+class InvalidRequestError(ValueError):
+    """
+    Yêu cầu không hợp lệ (phương pháp hoặc tham số sai), server trả về 400.
+    """
+
+class UnsupportedMethodError(InvalidRequestError):
+    """
+    methodType không được hỗ trợ.
+    """
+
+class JobTooLargeError(RuntimeError):
+    """
+    Bộ nhớ ước lượng của job vượt giới hạn, server từ chối trước khi giải mã ảnh (413).
+    """
+
+def check_memory(plan, max_bytes):
+    """
+    Báo JobTooLargeError nếu bộ nhớ ước lượng của plan vượt max_bytes (None để bỏ qua).
+    """
+    if max_bytes and plan['estimated_bytes'] > max_bytes:
+        raise JobTooLargeError(f"Estimated memory {plan['estimated_bytes'] / 2 ** 20:.0f} MiB exceeds "
+                               f"the limit of {max_bytes / 2 ** 20:.0f} MiB.")
+
+def image_shape(path):
+    """
+    Kích thước ảnh (rows, cols, channels) đọc từ header, chưa giải mã pixel.
+    Args:
+        path (str | file-like): Đường dẫn file hoặc buffer (ví dụ io.BytesIO của dữ liệu upload).
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        return height, width, len(image.getbands())
+
+def color_mode(form):
+    """
+    Chế độ màu của yêu cầu (trường form "color"), mặc định 'grayscale'.
+    Raises:
+        InvalidRequestError: Giá trị không nằm trong COLOR_MODES.
+    """
+    color = form.get('color') or 'grayscale'
+    if color not in COLOR_MODES:
+        raise InvalidRequestError(f"color must be one of: {', '.join(COLOR_MODES)}.")
+    return color
+
+def pil_to_array(image):
+    """
+    Chuyển ảnh PIL sang ndarray; ảnh palette và các mode màu khác (CMYK, YCbCr, ...) được đổi sang RGB(A).
+    """
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    elif image.mode not in ('1', 'L', 'LA', 'RGB', 'RGBA', 'I', 'I;16', 'I;16B', 'I;16L', 'F'):
+        image = image.convert('RGB')
+    return np.array(image)
+
+def decode_image(data, color='grayscale'):
+    """
+    Giải mã ảnh trực tiếp từ bytes của upload (cv2.imdecode trên buffer, không ghi file), giữ nguyên
+    độ sâu bit: ảnh 16 bit cho kết quả uint16 thay vì bị cắt cụt về uint8 (xem normalize_depth).
+    Định dạng OpenCV không đọc được (ví dụ GIF) được giải mã bằng PIL từ bộ nhớ.
+    Args:
+        data (bytes): Nội dung file ảnh.
+        color (str): 'grayscale' để chuyển về một kênh; chế độ khác giữ mọi kênh theo thứ tự RGB(A).
+    Returns:
+        ndarray: Ảnh uint8 hoặc uint16, 2D hoặc (H, W, C).
+    """
+    # Giải mã nguyên kênh rồi tự chuyển sang grayscale bằng cv2.cvtColor
+    # (IMREAD_GRAYSCALE để libpng/libjpeg tự chuyển, làm tròn khác đường PIL + RGB2GRAY)
+    with span('decode'):
+        image_array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        decoded_by_pil = image_array is None
+        if decoded_by_pil:
+            with Image.open(io.BytesIO(data)) as image:
+                image_array = pil_to_array(image)
+    with span('convert'):
+        if decoded_by_pil:
+            if color == 'grayscale':
+                image_array = convert_to_grayscale(image_array)
+        elif image_array.ndim == 3:
+            # OpenCV trả về thứ tự kênh BGR(A)
+            four_channels = image_array.shape[2] == 4
+            if color == 'grayscale':
+                code = cv2.COLOR_BGRA2GRAY if four_channels else cv2.COLOR_BGR2GRAY
+            else:
+                code = cv2.COLOR_BGRA2RGBA if four_channels else cv2.COLOR_BGR2RGB
+            image_array = cv2.cvtColor(image_array, code)
+        return normalize_depth(image_array)
+
+def load_image(path, color='grayscale'):
+    """
+    Đọc và giải mã ảnh từ file (xem decode_image).
+    """
+    with open(path, 'rb') as f:
+        return decode_image(f.read(), color)
+
+def plan_request(method_type, form, shape, auto_min_pixels=None, dtype=None, scale=1):
+    """
+    Chọn toán tử trong registry, đọc tham số từ form và ước lượng chi phí, trước khi giải mã ảnh.
+    Args:
+        method_type (str): Phương pháp xử lý (methodType của form), hoặc 'pipeline'.
+        form (dict): Các trường của form (kernelSize, radius, order, radii, stages, color, ...).
+        shape (tuple): Kích thước ảnh (rows, cols) hoặc (rows, cols, channels).
+        auto_min_pixels (int): Từ số pixel này trở lên, dùng cài đặt rẻ nhất cùng family (ví dụ
+            median_filter -> median_filter_opencv, kết quả có thể khác ở biên ảnh); None hoặc 0 để luôn dùng
+            đúng phương pháp được chọn.
+        dtype: Kiểu dữ liệu ảnh nếu đã giải mã (để chỉ chọn các cài đặt hỗ trợ kiểu này).
+        scale (int): Ảnh đã được thu nhỏ scale lần so với ảnh gốc (ảnh xem trước): các tham số đo bằng
+            pixel (kernel) được thu nhỏ theo (Operator.scale_params).
+    Returns:
+        dict: operator (hoặc pipeline), params, radii, color, shape (kích thước mảng được xử lý),
+            estimated_seconds, estimated_bytes (đã gồm ảnh giải mã và ảnh được xử lý).
+    Raises:
+        InvalidRequestError: Phương pháp, tham số hoặc chế độ màu không hợp lệ.
+    """
+    color = color_mode(form)
+    work_shape = working_shape(shape, color)
+    channels = shape[2] if len(shape) > 2 else 1
+    decode_bytes = int(shape[0]) * int(shape[1]) * (channels + 1)
+    if color == 'luma' and channels >= 3:
+        # Ảnh YCbCr float32 và ảnh RGB float32 khi chuyển ngược
+        decode_bytes += int(shape[0]) * int(shape[1]) * 24
+
+    if method_type == 'pipeline':
+        # Chuỗi nhiều bước chạy trong bộ nhớ, chỉ lưu ảnh cuối cùng
+        try:
+            pipeline = Pipeline.from_json(form.get('stages', '')).scaled(scale)
+        except (ValueError, TypeError, KeyError) as e:
+            raise InvalidRequestError(str(e)) from None
+        return {'operator': None, 'pipeline': pipeline, 'params': {}, 'radii': [], 'color': color, 'shape': work_shape,
+                'estimated_seconds': pipeline.estimate_seconds(work_shape),
+                'estimated_bytes': pipeline.estimate_bytes(work_shape) + decode_bytes}
+
+    if method_type not in OPERATORS:
+        raise UnsupportedMethodError("Unsupported method")
+    try:
+        params = OPERATORS[method_type].scale_params(OPERATORS[method_type].parse_form(form), scale)
+        radii = RADII_PARAMETER.parse(form.get(RADII_PARAMETER.form_name)) if OPERATORS[method_type].batch else []
+    except ValueError as e:
+        raise InvalidRequestError(str(e)) from None
+
+    operator = choose_operator(method_type, work_shape, params, auto_min_pixels, dtype)
+    estimate_params = dict(params, radii=radii) if radii else params
+    return {'operator': operator, 'pipeline': None, 'params': params, 'radii': radii, 'color': color, 'shape': work_shape,
+            'estimated_seconds': operator.estimate_seconds(work_shape, estimate_params),
+            'estimated_bytes': operator.estimate_bytes(work_shape, estimate_params) + decode_bytes}
+
+def runs_in_parallel(operator, image):
+    """
+    Có chạy operator theo dải hàng song song không (xem PARALLEL_MIN_PIXELS): ảnh một kênh, hoặc ảnh nhiều kênh
+    với toán tử cục bộ (mỗi kênh được lọc riêng cho kết quả giống hệt; Laplacian chuẩn hóa trên cả ảnh).
+    """
+    return (PARALLEL_WORKERS > 1 and operator.name in PARALLEL_METHODS
+            and image.shape[0] * image.shape[1] >= PARALLEL_MIN_PIXELS
+            and (image.ndim == 2 or operator.name in KERNEL_OPERATORS))
+
+def filter_in_bands(image, method, **params):
+    """
+    parallel_filter trên ảnh 2D, hoặc lần lượt trên từng kênh của ảnh (H, W, C).
+    """
+    if image.ndim == 2:
+        return parallel_filter(image, method, workers=PARALLEL_WORKERS, **params)
+    return np.dstack([parallel_filter(np.ascontiguousarray(image[..., channel]), method, workers=PARALLEL_WORKERS,
+                                      **params) for channel in range(image.shape[2])])
+
+def run_method(image_array, method_type, params, stem, auto_min_pixels=None, scale=1):
+    """
+    Áp dụng phương pháp xử lý lên ảnh, chưa lưu hay mã hóa kết quả.
+    Chế độ màu (trường "color" của params, xem COLOR_MODES):
+    - grayscale: ảnh được chuyển về một kênh.
+    - channels: toán tử chạy trên mảng (H, W, 3), mọi kênh trong một lần gọi.
+    - luma: toán tử chạy trên kênh Y của YCbCr, Cb/Cr giữ nguyên (nén JPEG vẫn nén ảnh màu).
+    Kênh alpha (nếu có) được giữ nguyên và gắn lại vào ảnh kết quả ba kênh. Ảnh 16 bit được giữ
+    16 bit, trừ khi phương pháp chỉ hỗ trợ 8 bit (Operator.dtypes).
+    Args:
+        image_array (ndarray): Ảnh uint8/uint16, 2D hoặc (H, W, C) theo thứ tự RGB(A).
+        method_type (str): Phương pháp xử lý (methodType của form).
+        params (dict): Các tham số của form (kernelSize, radius, order, radii, stages, color, ...).
+        stem (str): Phần tên dùng để đặt tên file kết quả.
+        auto_min_pixels (int): Xem plan_request.
+        scale (int): Xem plan_request.
+    Returns:
+        tuple: (outputs, context). outputs là danh sách {'filename', 'caption', 'image' (ndarray) hoặc
+            'data' (bytes đã nén)}; context chứa message/timings (nếu có).
+    """
+    color = color_mode(params)
+    with span('convert'):
+        if color == 'grayscale':
+            image, alpha = convert_to_grayscale(image_array), None
+        else:
+            image, alpha = split_alpha(image_array)
+    plan = plan_request(method_type, params, image_array.shape, auto_min_pixels, image.dtype, scale)
+    operator = plan['operator']
+    pipeline = plan['pipeline']
+    context = {}
+    messages = []
+
+    operators = [stage_operator for stage_operator, _ in pipeline.stages] if pipeline is not None else [operator]
+    unsupported = [stage_operator.name for stage_operator in operators if not stage_operator.supports(image.dtype)]
+    if unsupported:
+        image = to_uint8(image)
+        messages.append(f"{', '.join(unsupported)} only supports 8-bit images: the input was converted to 8 bits.")
+
+    def apply(function):
+        # Chế độ luma: function chỉ nhận kênh Y
+        if color == 'luma' and image.ndim == 3:
+            return apply_luma(function, image)
+        return function(image)
+
+    pixels = image.shape[0] * image.shape[1]
+    if pipeline is not None:
+        outputs = [{'filename': f"processed_{method_type}_{stem}.png", 'image': apply(pipeline.run)}]
+        context['timings'] = [{'stage': stage, 'ms': round(seconds * 1000, 3)} for stage, seconds in pipeline.timings]
+        for stage, seconds in pipeline.timings:
+            add_span('operator', seconds, operator=stage, pixels=pixels)
+    elif operator.output == 'encoded':
+        # Nén ảnh thành JPEG
+        with span('operator', operator=operator.name, pixels=pixels):
+            data = operator(image, **plan['params'])
+        ratio = image.nbytes / len(data)
+        label = 'OpenCV' if operator.backend == 'opencv' else 'Custom'
+        outputs = [{'filename': f"compressed_{operator.backend}_{stem}.jpg", 'data': data}]
+        messages.append(f"{label} JPEG Compression Complete! {len(data)} bytes, ratio {ratio:.2f}:1")
+        if image.ndim == 3 and not operator.multichannel:
+            messages.append(f"{operator.name} only encodes grayscale: the colour image was converted to grayscale.")
+    elif plan['radii']:
+        # Chế độ lô: một lần FFT thuận cho tất cả các bán kính
+        with span('operator', operator=operator.name, pixels=pixels):
+            results = apply(lambda plane: operator.batch(plane, plan['radii'], **plan['params']))
+        outputs = [{'filename': f"processed_{method_type}_r{radius:g}_{stem}.png", 'caption': f"Radius {radius:g}", 'image': result}
+                   for radius, result in zip(plan['radii'], results)]
+    else:
+        if runs_in_parallel(operator, image):
+            function = lambda plane: filter_in_bands(plane, operator.name, **plan['params'])
+        else:
+            function = lambda plane: operator(plane, **plan['params'])
+        with span('operator', operator=operator.name, pixels=pixels):
+            result = apply(function)
+        outputs = [{'filename': f"processed_{method_type}_{stem}.png", 'image': result}]
+
+    for output in outputs:
+        if 'image' in output:
+            output['image'] = merge_alpha(output['image'], alpha)
+
+    if operator is not None and operator.name != method_type:
+        messages.append(f"Large image: processed with {operator.name} instead of {method_type}.")
+    if messages:
+        context['message'] = ' '.join(messages)
+    return outputs, context
+
+def preview_levels(plan, latency_budget, min_side=64):
+    """
+    Số tầng kim tự tháp (mỗi tầng giảm một nửa mỗi chiều) để ảnh xem trước xử lý xong trong latency_budget
+    giây, theo thời gian ước lượng của plan; 0 nếu ảnh gốc đã đủ nhanh. Cạnh ngắn của ảnh xem trước
+    không nhỏ hơn min_side pixel.
+    """
+    levels = 0
+    seconds = plan['estimated_seconds']
+    side = min(plan['shape'][:2])
+    while seconds > latency_budget and side // 2 >= min_side:
+        seconds /= 4
+        side //= 2
+        levels += 1
+    return levels
+
+def pyramid_downscale(image, levels):
+    """
+    Thu nhỏ ảnh 2 ** levels lần bằng kim tự tháp Gauss (cv2.pyrDown: lọc Gauss 5x5 rồi bỏ một nửa số
+    hàng/cột ở mỗi tầng), giữ nguyên kiểu dữ liệu và số kênh.
+    """
+    for _ in range(levels):
+        image = cv2.pyrDown(image)
+    return image
+
+def result_context(outputs, urls, context):
+    """
+    Context để render result.html: một ảnh (image_url) hoặc danh sách ảnh có chú thích (images).
+    """
+    context = dict(context)
+    if len(outputs) == 1 and not outputs[0].get('caption'):
+        context['image_url'] = urls[0]
+    else:
+        context['images'] = [{'url': url, 'caption': output.get('caption')} for output, url in zip(outputs, urls)]
+    return context
+
+def to_bgr(image):
+    """
+    Đổi thứ tự kênh RGB(A) sang BGR(A) trước khi mã hóa bằng OpenCV; ảnh một kênh giữ nguyên.
+    """
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA if image.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+    return image
+
+def save_png(image, path):
+    """
+    Lưu ảnh kết quả dưới định dạng PNG: ảnh 8 bit bằng PIL, ảnh 16 bit bằng OpenCV (PIL không ghi được
+    PNG màu 16 bit; thứ tự kênh RGB(A) được đổi sang BGR(A) của OpenCV).
+    """
+    if image.dtype == np.uint8:
+        Image.fromarray(image).save(path, format='PNG')
+    elif not cv2.imwrite(path, to_bgr(image)):
+        raise RuntimeError("Failed to save the result as PNG.")
+
+def process_array(image_array, method_type, params, result_folder, stem, auto_min_pixels=None, scale=1):
+    """
+    Áp dụng phương pháp xử lý lên ảnh và lưu kết quả vào result_folder.
+    Args:
+        image_array (ndarray): Ảnh uint8/uint16, 2D hoặc (H, W, C) (xem run_method).
+        method_type (str): Phương pháp xử lý (methodType của form).
+        params (dict): Các tham số của form (kernelSize, radius, order, radii, stages, ...).
+        result_folder (str): Thư mục lưu kết quả.
+        stem (str): Phần tên dùng để đặt tên file kết quả.
+        auto_min_pixels (int): Xem plan_request.
+        scale (int): Xem plan_request.
+    Returns:
+        dict: Context để render result.html (image_url hoặc images, có thể kèm message và timings).
+    """
+    outputs, context = run_method(image_array, method_type, params, stem, auto_min_pixels, scale)
+    with span('encode'):
+        for output in outputs:
+            path = os.path.join(result_folder, output['filename'])
+            if 'data' in output:
+                with open(path, 'wb') as f:
+                    f.write(output['data'])
+            else:
+                save_png(output['image'], path)
+    return result_context(outputs, [f"/results/{output['filename']}" for output in outputs], context)
+
+def encode_output(output):
+    """
+    Mã hóa một kết quả của run_method vào bộ nhớ.
+    Returns:
+        tuple: (bytes, mimetype). Ảnh được nén PNG bằng OpenCV (mức nén thấp, nhanh hơn PIL).
+    """
+    if 'data' in output:
+        return output['data'], 'image/jpeg'
+    with span('encode'):
+        success, buffer = cv2.imencode('.png', to_bgr(output['image']))
+    if not success:
+        raise RuntimeError("Failed to encode the result as PNG.")
+    return buffer.tobytes(), 'image/png'
+
+def context_files(context, result_folder):
+    """
+    Danh sách đường dẫn các file kết quả được tham chiếu trong context.
+    """
+    urls = [image['url'] for image in context['images']] if 'images' in context else [context['image_url']]
+    return [os.path.join(result_folder, os.path.basename(url)) for url in urls]
+
+def warmup_operators(value):
+    """
+    Đọc danh sách toán tử cần chạy thử từ cấu hình (biến môi trường WARMUP_OPERATORS).
+    Args:
+        value (str): '' (tắt), 'all' (mọi toán tử) hoặc danh sách tên cách nhau bởi dấu phẩy.
+    Returns:
+        list | None: Tên các toán tử, None nghĩa là mọi toán tử.
+    Raises:
+        ValueError: Có tên không nằm trong registry.
+    """
+    if value.strip() == 'all':
+        return None
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in OPERATORS]
+    if unknown:
+        raise ValueError(f"Unknown warm-up operators: {', '.join(unknown)}")
+    return names
+
+def warm_up(names=None, size=64):
+    """
+    Chuẩn bị một tiến trình trước khi nhận request: import OpenCV/PIL và các module xử lý (xem
+    image_processing.lazy), rồi chạy thử mã hóa/giải mã PNG và từng toán tử qua run_method trên một ảnh
+    nhỏ, để các chi phí của lần gọi đầu (import, khởi tạo OpenCV, plan FFT của SciPy, cache của NumPy)
+    không rơi vào request đầu tiên của worker mới.
+    Args:
+        names (iterable): Tên các toán tử cần chạy thử; None là mọi toán tử trong registry.
+        size (int): Cạnh ảnh thử (pixel).
+    Returns:
+        dict: Thời gian (giây) của từng bước: 'codec' và tên các toán tử. Cũng được ghi vào METRICS
+            (image_processing_warmup_seconds).
+    """
+    image = np.random.default_rng(0).integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    steps = [('codec', lambda: decode_image(encode_output({'image': image})[0], 'channels'))]
+    for name in (OPERATORS if names is None else names):
+        steps.append((name, lambda name=name: run_method(image, name, {}, 'warmup')))
+    timings = {}
+    for step, function in steps:
+        start = time.perf_counter()
+        function()
+        timings[step] = time.perf_counter() - start
+        METRICS.set('image_processing_warmup_seconds', timings[step], {'step': step})
+    return timings
+
+def preload_shared_state(filter_shapes=()):
+    """
+    Dựng trước các trạng thái chỉ đọc trong tiến trình master của server preforking (gunicorn.conf.py), trước
+    khi fork: các worker dùng chung chúng qua copy-on-write thay vì mỗi worker tự import và tự tính.
+    - Import mọi thư viện và module xử lý đang được import trễ (kèm các hằng số cấp module: bảng zigzag,
+      bảng Huffman chuẩn, kernel Laplacian, ...).
+    - Bảng lượng tử hóa JPEG cho mọi chất lượng 1..100.
+    - Hàm truyền của các bộ lọc miền tần số (tham số mặc định) cho các kích thước ảnh filter_shapes.
+    Returns:
+        dict: Các module đã import và số byte của từng loại bảng.
+    """
+    return {
+        'modules': import_deferred(),
+        'quality_tables_bytes': preload_quality_tables(),
+        'transfer_functions_bytes': preload_transfer_functions(filter_shapes),
+    }
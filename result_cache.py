@@ -0,0 +1,154 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+def code_version(paths):
+    """
+    Phiên bản mã nguồn: mã băm nội dung các file .py, để kết quả cũ tự mất hiệu lực khi thuật toán thay đổi.
+    Args:
+        paths (list): Danh sách file hoặc thư mục chứa file .py.
+    Returns:
+        str: Chuỗi hex 16 ký tự.
+    """
+    digest = hashlib.sha256()
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.py'))
+        else:
+            files.append(path)
+    for file_path in sorted(files):
+        with open(file_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+class ResultCache:
+    """
+    Cache kết quả /process theo nội dung: khóa = SHA-256 của (bytes upload, phương pháp, tham số, phiên bản mã).
+    Mỗi mục lưu context để render result.html và danh sách file kết quả trong thư mục results/.
+    Khi tổng kích thước các file vượt max_bytes, các mục ít được dùng gần đây nhất bị xóa (cả file trên đĩa).
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, version=''):
+        self.max_bytes = max_bytes
+        self.version = version
+        self.entries = OrderedDict()  # key -> (context, files, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, data, method, params):
+        """
+        Tạo khóa cache.
+        Args:
+            data (bytes): Nội dung file upload.
+            method (str): Phương pháp xử lý (methodType).
+            params (dict): Các tham số của form.
+        Returns:
+            str: Khóa dạng hex.
+        """
+        digest = hashlib.sha256(data)
+        digest.update(repr((method, sorted(params.items()), self.version)).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Trả về context đã lưu, hoặc None nếu chưa có (hoặc file kết quả đã bị xóa khỏi đĩa).
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and all(os.path.exists(path) for path in entry[1]):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key, delete_files=False)
+            self.misses += 1
+            return None
+
+    def put(self, key, context, files):
+        """
+        Lưu kết quả vào cache và xóa các mục cũ nếu vượt giới hạn kích thước.
+        """
+        size = sum(os.path.getsize(path) for path in files)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key, delete_files=False)
+            self.entries[key] = (context, list(files), size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)), delete_files=True)
+
+    def _remove(self, key, delete_files):
+        _, files, size = self.entries.pop(key)
+        self.total_bytes -= size
+        if delete_files:
+            for path in files:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def stats(self):
+        """
+        Thống kê cache: số mục, tổng kích thước, số lần hit/miss.
+        """
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+class MemoryResultStore:
+    """
+    Kho kết quả ngắn hạn trong bộ nhớ cho chế độ không chạm đĩa: mỗi kết quả đã mã hóa (PNG/JPEG)
+    được giữ ttl giây dưới một token ngẫu nhiên. Khi tổng kích thước vượt max_bytes, các mục cũ nhất bị bỏ.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # token -> (data, mimetype, expires)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def put(self, data, mimetype):
+        """
+        Lưu một kết quả và trả về token để lấy lại.
+        """
+        token = secrets.token_urlsafe(16)
+        with self.lock:
+            self.expire()
+            self.entries[token] = (data, mimetype, time.monotonic() + self.ttl)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                self.total_bytes -= len(self.entries.popitem(last=False)[1][0])
+        return token
+
+    def get(self, token):
+        """
+        Trả về (data, mimetype), hoặc None nếu token không tồn tại hoặc đã hết hạn.
+        """
+        with self.lock:
+            self.expire()
+            entry = self.entries.get(token)
+            return None if entry is None else entry[:2]
+
+    def expire(self):
+        # Các mục được thêm theo thứ tự thời gian với cùng ttl, nên mục hết hạn luôn nằm ở đầu
+        now = time.monotonic()
+        while self.entries:
+            token, (data, _, expires) = next(iter(self.entries.items()))
+            if expires > now:
+                break
+            del self.entries[token]
+            self.total_bytes -= len(data)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes}
@@ -1,124 +1,432 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, Response, jsonify, render_template, request, send_file
+from functools import wraps
 from http import HTTPStatus
+import base64
+import io
+import json
 import os
-import numpy as np
-from PIL import Image
-import cv2
-from image_processing.histogram import histogram_equalization, histogram_equalization_opencv
-from image_processing.morphological import dilation, erosion, erosion_opencv, dilation_opencv
-from image_processing.spatial_enhancement import mean_filter, median_filter, laplacian_filter, laplacian_filter_opencv, median_filter_opencv
-from image_processing.segmentation import otsu_thresholding, otsu_threshold_opencv
-from image_processing.compress import jpeg_encode_decode_grayscale, compress_jpeg_with_opencv  
+import tempfile
+import threading
+import zipfile
+from werkzeug.exceptions import HTTPException
+from batch import ZipWriter, is_image_name, run_batch, zip_inputs
+from image_processing.lazy import IMPORT_SECONDS
+from image_processing.registry import OPERATORS
+from jobs import DONE, FAILED, CANCELLED, JobQueue, JobStore, QueueFullError, TaskExecutor
+from metrics import METRICS, SamplingProfiler, SlowestProfiles, record_request, span, traced
+from processing import (InvalidRequestError, JobTooLargeError, check_memory, color_mode, context_files, decode_image,
+                        encode_output, image_shape, load_image, plan_request, preview_levels, process_array,
+                        pyramid_downscale, result_context, run_method, warm_up, warmup_operators)
+from result_cache import MemoryResultStore, ResultCache, code_version
 
 app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 RESULT_FOLDER = 'results'
+# Trạng thái và kết quả của các job, dùng chung giữa các tiến trình server (xem jobs.JobStore)
+JOB_FOLDER = os.environ.get('JOB_FOLDER', 'jobs')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['RESULT_FOLDER'] = RESULT_FOLDER
+app.config['JOB_FOLDER'] = JOB_FOLDER
+# Số tiến trình server phục vụ cùng một địa chỉ (gunicorn.conf.py đặt theo số worker). Lớn hơn 1 thì
+# delivery=memory nhúng kết quả vào trang (data URL) vì MEMORY_STORE là bộ nhớ riêng của từng tiến trình
+app.config['WEB_WORKERS'] = int(os.environ.get('WEB_WORKERS', 1))
+# Kích thước tối đa của một request (byte), lớn hơn bị trả về 413; 0 để không giới hạn
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 0)) or None
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', os.cpu_count() or 1))
+app.config['JOB_QUEUE_DEPTH'] = int(os.environ.get('JOB_QUEUE_DEPTH', app.config['JOB_WORKERS'] * 4))
+# Từ số pixel này trở lên, dùng cài đặt rẻ nhất cùng family trong registry. Kết quả có thể khác phương pháp
+# được chọn (ví dụ biên ảnh của các cài đặt OpenCV) nên mặc định tắt (0)
+app.config['AUTO_BACKEND_MIN_PIXELS'] = int(os.environ.get('AUTO_BACKEND_MIN_PIXELS', 0))
+# Job có bộ nhớ ước lượng vượt giới hạn này bị từ chối trước khi giải mã ảnh (0 để tắt)
+app.config['MAX_JOB_MEMORY_BYTES'] = int(os.environ.get('MAX_JOB_MEMORY_BYTES', 2 * 1024 * 1024 * 1024))
+# /process ước lượng lâu hơn ngưỡng này (giây) thì trả ngay kết quả trên ảnh thu nhỏ và xử lý ảnh gốc
+# trong JOB_QUEUE (0 để tắt)
+app.config['PREVIEW_LATENCY_SECONDS'] = float(os.environ.get('PREVIEW_LATENCY_SECONDS', 0.5))
+# Profiler lấy mẫu: giữ profile của PROFILE_SLOWEST request chậm nhất trong PROFILE_FOLDER (0 để tắt)
+app.config['PROFILE_SLOWEST'] = int(os.environ.get('PROFILE_SLOWEST', 0))
+app.config['PROFILE_FOLDER'] = os.environ.get('PROFILE_FOLDER', 'profiles')
+app.config['PROFILE_INTERVAL'] = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+# Chạy thử các toán tử này (tên cách nhau bởi dấu phẩy, hoặc 'all') trước khi nhận request, trong tiến trình
+# server và trong mỗi worker của JOB_QUEUE; '' để tắt (thư viện nặng được import ở lần dùng đầu tiên)
+app.config['WARMUP_OPERATORS'] = os.environ.get('WARMUP_OPERATORS', '')
+WARMUP_OPERATORS = warmup_operators(app.config['WARMUP_OPERATORS'])
 
-def convert_to_grayscale(image_array):
-    """
-    Chuyển đổi ảnh về định dạng grayscale.
-    """
-    if len(image_array.shape) == 2:  # Ảnh đã là grayscale
-        return image_array
-    elif len(image_array.shape) == 3:  # Ảnh có nhiều kênh (RGB hoặc RGBA)
-        return cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-    else:
-        raise ValueError("Unsupported image format.")
+# Cache kết quả theo nội dung upload; phiên bản mã đổi thì khóa cũ không còn khớp
+RESULT_CACHE = ResultCache(
+    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    version=code_version([os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_processing'),
+                          os.path.abspath(__file__),
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'processing.py')])
+            + f"-auto{app.config['AUTO_BACKEND_MIN_PIXELS']}",
+)
+
+# Kết quả của chế độ delivery=memory: giữ trong RAM vài phút, không ghi ra results/. Riêng cho từng tiến trình
+# server, nên chỉ dùng khi WEB_WORKERS = 1
+MEMORY_STORE = MemoryResultStore(max_bytes=int(os.environ.get('MEMORY_STORE_MAX_BYTES', 256 * 1024 * 1024)),
+                                 ttl=int(os.environ.get('MEMORY_STORE_TTL', 300)))
+
+# Hàng đợi job chạy trên các tiến trình worker; pool chỉ được tạo ở lần submit đầu tiên. Trạng thái job được
+# ghi vào JOB_FOLDER để /jobs/<id> (cả status_url của chế độ xem trước) trả lời được ở mọi tiến trình server
+JOB_QUEUE = JobQueue(max_workers=app.config['JOB_WORKERS'], max_pending=app.config['JOB_QUEUE_DEPTH'],
+                     initializer=warm_up if app.config['WARMUP_OPERATORS'] else None, initargs=(WARMUP_OPERATORS,),
+                     store=JobStore(app.config['JOB_FOLDER']))
 
+SLOWEST_PROFILES = SlowestProfiles(app.config['PROFILE_SLOWEST'], app.config['PROFILE_FOLDER'])
 
+if app.config['WARMUP_OPERATORS']:
+    warm_up(WARMUP_OPERATORS)
+
+def instrumented(view):
+    """
+    Đo một endpoint xử lý ảnh: số request theo mã trạng thái, thời gian cả request và các span theo giai đoạn
+    (metrics.span trong server và processing) được đưa vào METRICS. Khi bật PROFILE_SLOWEST, request
+    chạy dưới SamplingProfiler và profile được giữ lại nếu request nằm trong nhóm chậm nhất.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        interval = app.config['PROFILE_INTERVAL']
+        profiler = SamplingProfiler(threading.get_ident(), interval).start() if SLOWEST_PROFILES.limit else None
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        with traced(request.endpoint) as trace:
+            try:
+                response = app.make_response(view(*args, **kwargs))
+                status = response.status_code
+                return response
+            except HTTPException as error:
+                # Ví dụ 413 khi upload vượt MAX_CONTENT_LENGTH
+                status = error.code
+                raise
+            finally:
+                record_request(request.endpoint, int(status), trace)
+                if profiler is not None:
+                    # Chỉ đưa tên phương pháp có trong registry vào tên file profile, không dùng nguyên giá trị form
+                    method_type = request.form.get('methodType', '')
+                    known = method_type in OPERATORS or method_type == 'pipeline'
+                    name = f"{request.endpoint}_{method_type}" if known else request.endpoint
+                    SLOWEST_PROFILES.offer(trace.elapsed(), name, profiler.stop(), interval)
+    return wrapper
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/process', methods=['POST'])
+@instrumented
 def process_image():
+    return process_upload(request.form.get('methodType', ''))
+
+@app.route('/pipeline', methods=['POST'])
+@instrumented
+def process_pipeline():
+    """
+    Chạy một chuỗi bước trong bộ nhớ. Trường form 'stages' là JSON dạng
+    [{"method": "median_filter", "params": {"kernel_size": 5}}, {"method": "equalize"}, ...].
+    """
+    return process_upload('pipeline')
+
+def process_upload(method_type):
     if 'file' not in request.files or request.files['file'].filename == '':
         return "No file provided", HTTPStatus.BAD_REQUEST
 
     file = request.files['file']
-    method_type = request.form.get('methodType', '')
-    kernel_size = request.form.get('kernelSize', '3')  # Lấy giá trị kernelSize từ form, mặc định là 3
 
     if not method_type:
         return "No method selected", HTTPStatus.BAD_REQUEST
 
+    delivery = request.form.get('delivery', 'disk')
+    if delivery not in ('disk', 'inline', 'memory'):
+        return "delivery must be 'disk', 'inline' or 'memory'", HTTPStatus.BAD_REQUEST
+
     try:
-        kernel_size = int(kernel_size)
+        if delivery != 'disk':
+            return process_in_memory(file, method_type, delivery)
+
+        # Cache theo nội dung: cùng ảnh + cùng phương pháp/tham số thì trả ngay kết quả đã lưu
+        with span('read_upload'):
+            data = file.read()
+        cache_key = RESULT_CACHE.make_key(data, method_type, request.form.to_dict())
+        context = RESULT_CACHE.get(cache_key)
+        if context is not None:
+            return render_template('result.html', **context)
+
+        # Kiểm tra phương pháp, tham số và bộ nhớ ước lượng từ header trước khi giải mã ảnh
+        with span('plan'):
+            plan = plan_upload(method_type, request.form, io.BytesIO(data))
 
         filename = file.filename
-        original_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(original_path)
-
-        # Đọc ảnh và chuyển đổi sang grayscale
-        image = Image.open(original_path)
-        image_array = np.array(image)
-        image_array = convert_to_grayscale(image_array)
-
-        # Đảm bảo image_array là uint8 và có giá trị pixel từ 0 đến 255
-        if image_array.dtype != np.uint8:
-            image_array = image_array.astype(np.uint8)
-
-        # Xử lý các phương pháp xử lý ảnh grayscale
-        if method_type == 'equalize':
-            image_array = histogram_equalization(image_array)
-        elif method_type == 'equalize_opencv':
-            image_array = histogram_equalization_opencv(image_array)
-        elif method_type == 'mean_filter':
-            image_array = mean_filter(image_array, kernel_size=kernel_size)
-        elif method_type == 'median_filter':
-            image_array = median_filter(image_array, kernel_size=kernel_size)
-        elif method_type == 'median_filter_opencv':
-            image_array = median_filter_opencv(image_array, kernel_size=kernel_size)
-        elif method_type == 'laplacian_filter':
-            image_array = laplacian_filter(image_array)
-        elif method_type == 'laplacian_filter_opencv':
-            image_array = laplacian_filter_opencv(image_array)
-        elif method_type == 'dilation':
-            image_array = dilation(image_array, kernel_size=kernel_size)
-        elif method_type == 'dilation_opencv':
-            image_array = dilation_opencv(image_array, kernel_size=kernel_size)
-        elif method_type == 'erosion':
-            image_array = erosion(image_array, kernel_size=kernel_size)
-        elif method_type == 'erosion_opencv':
-            image_array = erosion_opencv(image_array, kernel_size=kernel_size)
-        elif method_type == 'otsu':
-            image_array = otsu_thresholding(image_array)
-        elif method_type == 'otsu_opencv':
-            image_array = otsu_threshold_opencv(image_array)
-        elif method_type == 'jpeg_custom_compress':
-            # Nén ảnh grayscale bằng thuật toán tùy chỉnh
-            reconstructed_image = jpeg_encode_decode_grayscale(image_array)
-            compressed_path = os.path.join(app.config['RESULT_FOLDER'], f"compressed_custom_{filename.split('.')[0]}.jpg")
-            Image.fromarray(reconstructed_image).save(compressed_path, format="JPEG")
-            return render_template('result.html', message="Custom JPEG Compression Complete!", image_url=f"/results/{os.path.basename(compressed_path)}")
-        elif method_type == 'jpeg_opencv_compress':
-            # Nén ảnh grayscale bằng OpenCV
-            compressed_path = os.path.join(app.config['RESULT_FOLDER'], f"compressed_opencv_{filename.split('.')[0]}.jpg")
-            success = compress_jpeg_with_opencv(image_array, compressed_path, quality=50)
-            if success:
-                return render_template('result.html', message="OpenCV JPEG Compression Complete!", image_url=f"/results/{os.path.basename(compressed_path)}")
-            else:
-                return "Failed to compress the image using OpenCV.", HTTPStatus.INTERNAL_SERVER_ERROR
-        else:
-            return "Unsupported method", HTTPStatus.BAD_REQUEST
-
-        # Lưu kết quả xử lý ảnh
-        result_filename = f"processed_{method_type}_{filename.split('.')[0]}.png"  # Tên file không có đuôi
-        processed_path = os.path.join(app.config['RESULT_FOLDER'], result_filename)
-        Image.fromarray(image_array).save(processed_path, format='PNG')  # Lưu dưới định dạng PNG
-
-        return render_template('result.html', image_url=f"/results/{os.path.basename(processed_path)}")
+        # Tên file kết quả gắn mã băm để các ảnh khác nhau trùng tên không ghi đè lên nhau
+        stem = f"{filename.split('.')[0]}_{cache_key[:12]}"
+
+        levels = preview_levels(plan, app.config['PREVIEW_LATENCY_SECONDS']) if wants_preview(plan, request.form) else 0
+        if levels:
+            try:
+                return process_preview(data, filename, method_type, cache_key, stem, levels)
+            except QueueFullError:
+                pass  # Hàng đợi đầy: xử lý ảnh gốc ngay trong request như bình thường
+
+        # Giải mã thẳng từ bytes đã đọc (chuyển sang grayscale trừ khi chọn chế độ màu khác) và xử lý. Không lưu
+        # upload theo tên file của client: hai upload cùng tên nhưng khác nội dung có thể chạy đồng thời và ghi
+        # đè lên nhau, làm kết quả của ảnh này bị lưu vào cache dưới khóa của ảnh kia
+        image_array = decode_image(data, color_mode(request.form))
+        context = process_array(image_array, method_type, request.form, app.config['RESULT_FOLDER'], stem,
+                                app.config['AUTO_BACKEND_MIN_PIXELS'])
+        RESULT_CACHE.put(cache_key, context, context_files(context, app.config['RESULT_FOLDER']))
 
+        return render_template('result.html', **context)
+
+    except InvalidRequestError as e:
+        return str(e), HTTPStatus.BAD_REQUEST
+    except JobTooLargeError as e:
+        return str(e), HTTPStatus.REQUEST_ENTITY_TOO_LARGE
     except Exception as e:
         import traceback
         traceback.print_exc()  # In ra thông báo lỗi chi tiết
         return f"An error occurred: {str(e)}", HTTPStatus.INTERNAL_SERVER_ERROR
 
+def wants_preview(plan, form):
+    """
+    Có trả ảnh xem trước không: bật trong cấu hình, không bị tắt bằng trường form preview=0,
+    và kết quả là ảnh (nén JPEG không có bản xem trước).
+    """
+    return (app.config['PREVIEW_LATENCY_SECONDS'] > 0 and form.get('preview', '1') != '0'
+            and (plan['operator'] is None or plan['operator'].output == 'image'))
+
+def process_preview(data, filename, method_type, cache_key, stem, levels):
+    """
+    Chế độ xem trước: gửi job xử lý ảnh gốc vào JOB_QUEUE, rồi xử lý ngay bản thu nhỏ 2 ** levels lần
+    (kernel thu nhỏ theo) và trả về trang kết quả của bản này. Trang tự thay bằng kết quả đầy đủ khi job xong.
+    Raises:
+        QueueFullError: Hàng đợi đầy (người gọi xử lý ảnh gốc ngay trong request).
+    """
+    params = request.form.to_dict()
+    job_id = submit_upload_job(data, filename, method_type, params, cache_key, stem)
+
+    scale = 2 ** levels
+    upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{cache_key[:12]}_{filename}")
+    image_array = pyramid_downscale(load_image(upload_path, color_mode(params)), levels)
+    context = process_array(image_array, method_type, params, app.config['RESULT_FOLDER'], f"{stem}_preview",
+                            app.config['AUTO_BACKEND_MIN_PIXELS'], scale)
+    notice = f"Preview at 1/{scale} resolution: the full-resolution result will replace it when it is ready."
+    context['message'] = f"{notice} {context['message']}" if 'message' in context else notice
+    context['status_url'] = f"/jobs/{job_id}"
+    return render_template('result.html', **context)
+
+def submit_upload_job(data, filename, method_type, params, cache_key, stem):
+    """
+    Lưu upload vào file riêng của job và gửi job vào JOB_QUEUE; kết quả được đưa vào RESULT_CACHE khi xong.
+    Returns:
+        str: Mã job.
+    Raises:
+        QueueFullError: Hàng đợi đầy.
+    """
+    # Mỗi job có file upload riêng để các job chạy song song không ghi đè lên nhau
+    upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{cache_key[:12]}_{filename}")
+    with span('save_upload'), open(upload_path, 'wb') as f:
+        f.write(data)
+    result_folder = app.config['RESULT_FOLDER']
+    on_done = lambda context: RESULT_CACHE.put(cache_key, context, context_files(context, result_folder))
+    return JOB_QUEUE.submit(upload_path, method_type, params, result_folder, stem, on_done=on_done,
+                            auto_min_pixels=app.config['AUTO_BACKEND_MIN_PIXELS'])
+
+def process_in_memory(file, method_type, delivery):
+    """
+    Xử lý hoàn toàn trong bộ nhớ, không ghi upload hay kết quả ra đĩa (và không dùng RESULT_CACHE):
+    giải mã thẳng từ buffer upload, mã hóa kết quả vào buffer rồi trả về ngay trong response
+    (delivery=inline, khi chỉ có một ảnh kết quả) hoặc giữ trong MEMORY_STORE (delivery=memory).
+    Với nhiều tiến trình server (WEB_WORKERS > 1), /memory/<token> có thể tới tiến trình không giữ kết quả,
+    nên delivery=memory nhúng thẳng các ảnh vào trang kết quả (data URL).
+    """
+    with span('read_upload'):
+        data = file.read()
+    with span('plan'):
+        plan_upload(method_type, request.form, io.BytesIO(data))
+    image_array = decode_image(data, color_mode(request.form))
+    stem = file.filename.split('.')[0]
+    outputs, context = run_method(image_array, method_type, request.form, stem, app.config['AUTO_BACKEND_MIN_PIXELS'])
+    encoded = [encode_output(output) for output in outputs]
+
+    if delivery == 'inline' and len(encoded) == 1:
+        body, mimetype = encoded[0]
+        headers = {'Content-Disposition': f"inline; filename={outputs[0]['filename']}"}
+        if 'message' in context:
+            headers['X-Result-Message'] = context['message']
+        return Response(body, mimetype=mimetype, headers=headers)
+
+    if app.config['WEB_WORKERS'] > 1:
+        urls = [f"data:{mimetype};base64,{base64.b64encode(body).decode('ascii')}" for body, mimetype in encoded]
+    else:
+        urls = [f"/memory/{MEMORY_STORE.put(body, mimetype)}" for body, mimetype in encoded]
+    return render_template('result.html', **result_context(outputs, urls, context))
+
+def plan_upload(method_type, form, path):
+    """
+    Lập kế hoạch xử lý từ header ảnh đã upload (đường dẫn hoặc buffer) và từ chối job vượt giới hạn bộ nhớ.
+    """
+    plan = plan_request(method_type, form, image_shape(path), app.config['AUTO_BACKEND_MIN_PIXELS'])
+    check_memory(plan, app.config['MAX_JOB_MEMORY_BYTES'])
+    return plan
+
+@app.route('/jobs', methods=['POST'])
+@instrumented
+def submit_job():
+    """
+    Gửi một job xử lý ảnh vào hàng đợi; trả về ngay mã job thay vì chờ xử lý xong.
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify(error="No file provided"), HTTPStatus.BAD_REQUEST
+
+    file = request.files['file']
+    method_type = request.form.get('methodType', '')
+    if not method_type:
+        return jsonify(error="No method selected"), HTTPStatus.BAD_REQUEST
+
+    with span('read_upload'):
+        data = file.read()
+    params = request.form.to_dict()
+    cache_key = RESULT_CACHE.make_key(data, method_type, params)
+    context = RESULT_CACHE.get(cache_key)
+    if context is not None:
+        job_id = JOB_QUEUE.add_finished(context)
+    else:
+        filename = file.filename
+        stem = f"{filename.split('.')[0]}_{cache_key[:12]}"
+        try:
+            with span('plan'):
+                plan = plan_upload(method_type, params, io.BytesIO(data))
+        except InvalidRequestError as e:
+            return jsonify(error=str(e)), HTTPStatus.BAD_REQUEST
+        except JobTooLargeError as e:
+            return jsonify(error=str(e)), HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+        try:
+            job_id = submit_upload_job(data, filename, method_type, params, cache_key, stem)
+        except QueueFullError as e:
+            return jsonify(error=str(e)), HTTPStatus.SERVICE_UNAVAILABLE, {'Retry-After': '5'}
+        return (jsonify(job_id=job_id, status_url=f"/jobs/{job_id}", estimated_seconds=round(plan['estimated_seconds'], 3)),
+                HTTPStatus.ACCEPTED)
+
+    return jsonify(job_id=job_id, status_url=f"/jobs/{job_id}"), HTTPStatus.ACCEPTED
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = JOB_QUEUE.status(job_id)
+    if status is None:
+        return jsonify(error="Unknown job"), HTTPStatus.NOT_FOUND
+    body = {'job_id': job_id, 'status': status['status']}
+    if status['status'] == DONE:
+        body['result_url'] = f"/jobs/{job_id}/result"
+    if status['status'] == FAILED:
+        body['error'] = status['error']
+    return jsonify(body)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    status = JOB_QUEUE.status(job_id)
+    if status is None:
+        return "Unknown job", HTTPStatus.NOT_FOUND
+    if status['status'] == DONE:
+        return render_template('result.html', **status['context'])
+    if status['status'] == FAILED:
+        return f"An error occurred: {status['error']}", HTTPStatus.INTERNAL_SERVER_ERROR
+    if status['status'] == CANCELLED:
+        return "Job was cancelled", HTTPStatus.GONE
+    return jsonify(job_id=job_id, status=status['status']), HTTPStatus.ACCEPTED
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if JOB_QUEUE.status(job_id) is None:
+        return jsonify(error="Unknown job"), HTTPStatus.NOT_FOUND
+    cancelled = JOB_QUEUE.cancel(job_id)
+    return jsonify(job_id=job_id, cancelled=cancelled, status=JOB_QUEUE.status(job_id)['status'])
+
+# File zip kết quả của /batch được giữ trong RAM tới kích thước này, lớn hơn thì chuyển sang file tạm trên đĩa
+BATCH_SPOOL_BYTES = 32 * 1024 * 1024
+
+@app.route('/batch', methods=['POST'])
+@instrumented
+def process_batch():
+    """
+    Xử lý nhiều ảnh cùng một phương pháp: nhiều trường file "files" hoặc một file zip trong "file".
+    Ảnh được giải mã/mã hóa trên các luồng I/O và xử lý trên các tiến trình của JOB_QUEUE (xem batch.run_batch);
+    trả về một file zip gồm các kết quả và report.json, tóm tắt thông lượng nằm trong header X-Batch-Summary.
+    File zip được ghi vào file tạm (chỉ giữ trong RAM khi nhỏ) và gửi dần từ đó, còn các upload lớn đã được
+    Werkzeug lưu vào file tạm và chỉ được đọc khi tới lượt giải mã, nên bộ nhớ không tăng theo số ảnh.
+    Các ảnh đang xử lý được tính vào giới hạn JOB_QUEUE_DEPTH như các job; lô bị từ chối (503) nếu hàng đợi
+    đã đầy khi nhận request.
+    """
+    method_type = request.form.get('methodType', '')
+    if not method_type:
+        return jsonify(error="No method selected"), HTTPStatus.BAD_REQUEST
+
+    uploads = [file for file in request.files.getlist('files') if file.filename]
+    if uploads:
+        inputs = [(os.path.basename(file.filename), file.read) for file in uploads if is_image_name(file.filename)]
+    elif 'file' in request.files and zipfile.is_zipfile(request.files['file'].stream):
+        try:
+            inputs = zip_inputs(request.files['file'].stream)
+        except InvalidRequestError as e:
+            return jsonify(error=str(e)), HTTPStatus.BAD_REQUEST
+    else:
+        return jsonify(error="Provide image files in 'files' or a zip archive in 'file'"), HTTPStatus.BAD_REQUEST
+    if not inputs:
+        return jsonify(error="No images found"), HTTPStatus.BAD_REQUEST
+
+    if JOB_QUEUE.full():
+        return (jsonify(error=f"Job queue is full ({JOB_QUEUE.max_pending} pending jobs)."),
+                HTTPStatus.SERVICE_UNAVAILABLE, {'Retry-After': '5'})
+    # send_file đóng (và xóa) file tạm khi đã gửi xong response
+    archive = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+    writer = ZipWriter(archive)
+    try:
+        report = run_batch(inputs, method_type, request.form.to_dict(), writer,
+                           workers=JOB_QUEUE.max_workers, auto_min_pixels=app.config['AUTO_BACKEND_MIN_PIXELS'],
+                           max_job_bytes=app.config['MAX_JOB_MEMORY_BYTES'], executor=TaskExecutor(JOB_QUEUE))
+    except InvalidRequestError as e:
+        writer.abort()
+        archive.close()
+        return jsonify(error=str(e)), HTTPStatus.BAD_REQUEST
+    except Exception:
+        writer.abort()
+        archive.close()
+        raise
+    archive.seek(0)
+    response = send_file(archive, mimetype='application/zip', as_attachment=True,
+                         download_name=f"batch_{method_type}.zip")
+    response.headers['X-Batch-Summary'] = json.dumps(report['summary'])
+    return response
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(dict(RESULT_CACHE.stats(), memory_store=MEMORY_STORE.stats()))
+
+@app.route('/metrics')
+def metrics():
+    """
+    Số liệu cho Prometheus: số request, thời gian theo giai đoạn, thời gian và số pixel theo toán tử,
+    thời gian import trễ và warm-up của tiến trình server.
+    """
+    for module, seconds in list(IMPORT_SECONDS.items()):
+        METRICS.set('image_processing_lazy_import_seconds', seconds, {'module': module})
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles')
+def profiles():
+    """
+    Danh sách profile của các request chậm nhất (khi bật PROFILE_SLOWEST).
+    """
+    return jsonify(enabled=bool(SLOWEST_PROFILES.limit), profiles=SLOWEST_PROFILES.stats())
+
+@app.route('/memory/<token>')
+def memory_result(token):
+    entry = MEMORY_STORE.get(token)
+    if entry is None:
+        return "Result expired or not found", HTTPStatus.NOT_FOUND
+    body, mimetype = entry
+    return Response(body, mimetype=mimetype)
+
 @app.route('/results/<filename>')
 def result_image(filename):
     return send_file(os.path.join(app.config['RESULT_FOLDER'], filename))
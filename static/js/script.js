@@ -37,6 +37,8 @@ const dimmedBackground = document.getElementById('dimmedBackground');
 const kernelInput = document.getElementById('kernelInput');
 const kernelSizeInput = document.getElementById('kernelSize');
 const kernelError = document.getElementById('kernelError');
+const frequencyInput = document.getElementById('frequencyInput');
+const jpegInput = document.getElementById('jpegInput');
 const methodOptions = document.querySelectorAll('input[name="methodType"]');
 
 // Hiển thị/ẩn trường nhập kernel dựa trên phương pháp được chọn
@@ -52,6 +54,18 @@ methodOptions.forEach(option => {
         } else {
             kernelInput.style.display = 'none';
         }
+
+        if (selectedMethod.endsWith('_pass')) {
+            frequencyInput.style.display = 'block';
+        } else {
+            frequencyInput.style.display = 'none';
+        }
+
+        if (selectedMethod.startsWith('jpeg_')) {
+            jpegInput.style.display = 'block';
+        } else {
+            jpegInput.style.display = 'none';
+        }
     });
 });
 
@@ -78,4 +92,48 @@ form.addEventListener('submit', (event) => {
     // Hiển thị loading animation
     loading.style.display = 'flex';
     dimmedBackground.style.display = 'block';
-});
\ No newline at end of file
+
+    // Gửi job vào hàng đợi rồi theo dõi trạng thái; nếu không gọi được API thì gửi form như cũ
+    event.preventDefault();
+    submitJob().catch(() => form.submit());
+});
+
+const loadingText = loading.querySelector('.loading-text');
+
+function hideLoading() {
+    loading.style.display = 'none';
+    dimmedBackground.style.display = 'none';
+    loadingText.textContent = 'Processing...';
+}
+
+async function submitJob() {
+    const response = await fetch('/jobs', { method: 'POST', body: new FormData(form) });
+    const job = await response.json();
+    if (!response.ok) {
+        hideLoading();
+        alert(job.error || 'Failed to submit the job.');
+        return;
+    }
+    pollJob(job.status_url);
+}
+
+function pollJob(statusUrl) {
+    fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'done') {
+                window.location.href = job.result_url;
+            } else if (job.status === 'failed' || job.status === 'cancelled') {
+                hideLoading();
+                alert(job.error || `Job ${job.status}.`);
+            } else {
+                // Hiển thị giai đoạn hiện tại: queued, decoding, processing
+                loadingText.textContent = `Processing... (${job.status})`;
+                setTimeout(() => pollJob(statusUrl), 500);
+            }
+        })
+        .catch(() => {
+            hideLoading();
+            alert('Lost connection to the server.');
+        });
+}
\ No newline at end of file